@@ -3,6 +3,7 @@ from django.contrib import admin
 from django.contrib.auth import models as auth_models
 from django.contrib.auth.admin import GroupAdmin as BaseGroupAdmin
 from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
 from django.db.models import Q, Prefetch
 from django.utils.html import format_html
 from django.utils.translation import ugettext as _
@@ -16,9 +17,11 @@ from polymorphic.admin import PolymorphicParentModelAdmin
 from rangefilter.filter import DateRangeFilter
 from rangefilter.filter import DateTimeRangeFilter
 from import_export.admin import ExportMixin
+from import_export.forms import ExportForm
 from import_export.resources import ModelResource
+from import_export.signals import post_export
 from adminsortable.admin import SortableAdmin
-from ninetofiver import models, redmine
+from ninetofiver import exports, models, redmine
 from ninetofiver.templatetags.markdown import markdown
 from datetime import date
 import logging
@@ -348,6 +351,47 @@ class ContractForm(forms.ModelForm):
         self.fields['redmine_id'].widget = forms.Select(choices=redmine_project_choices)
 
 
+class StreamingExportMixin(ExportMixin):
+    """
+    Export mixin which streams exports in formats which support it, rather than building them in memory.
+
+    Streamed exports follow `ExportMixin.export_action`, but `get_export_rows` is used instead of `get_export_data`.
+    Other formats are exported by `ExportMixin` itself.
+
+    """
+
+    def get_export_rows(self, file_format, queryset, *args, **kwargs):
+        """Get the headers and rows of the export for the given queryset, which are yielded as they are exported."""
+        request = kwargs.pop('request')
+        if not self.has_export_permission(request):
+            raise PermissionDenied
+
+        resource_class = self.get_export_resource_class()
+        return exports.get_resource_values(resource_class(**self.get_export_resource_kwargs(request)), queryset)
+
+    def export_action(self, request, *args, **kwargs):
+        """Export the changelist."""
+        if not self.has_export_permission(request):
+            raise PermissionDenied
+
+        formats = self.get_export_formats()
+        form = ExportForm(formats, request.POST or None)
+
+        if form.is_valid():
+            file_format = formats[int(form.cleaned_data['file_format'])]()
+
+            if exports.is_streaming_format(file_format.get_extension()):
+                queryset = self.get_export_queryset(request)
+                rows = self.get_export_rows(file_format, queryset, request=request)
+                response = exports.get_streaming_response(file_format.get_extension(), rows,
+                                                          self.get_export_filename(file_format))
+
+                post_export.send(sender=None, model=self.model)
+                return response
+
+        return super().export_action(request, *args, **kwargs)
+
+
 class ContractResource(ModelResource):
     """Contract resource."""
 
@@ -377,7 +421,7 @@ class ContractResource(ModelResource):
 
 
 @admin.register(models.Contract)
-class ContractParentAdmin(ExportMixin, PolymorphicParentModelAdmin):
+class ContractParentAdmin(StreamingExportMixin, PolymorphicParentModelAdmin):
     """Contract parent admin."""
 
     def get_queryset(self, request):
@@ -519,7 +563,7 @@ class ProjectContractAdmin(ContractChildAdmin):
 @admin.register(models.ContractRole)
 class ContractRoleAdmin(admin.ModelAdmin):
     """Contract role admin."""
-    list_display = ('__str__', 'name', 'description')
+    list_display = ('__str__', 'name', 'description', 'hourly_cost')
     ordering = ('name',)
 
 
@@ -666,7 +710,7 @@ class PerformanceResource(ModelResource):
 
 
 @admin.register(models.Performance)
-class PerformanceParentAdmin(ExportMixin, PolymorphicParentModelAdmin):
+class PerformanceParentAdmin(StreamingExportMixin, PolymorphicParentModelAdmin):
     """Performance parent admin."""
 
     resource_class = PerformanceResource
@@ -780,4 +824,19 @@ class InvoiceAdmin(admin.ModelAdmin):
     inlines = [
         InvoiceItemInline,
     ]
-    ordering = ('-reference',)
\ No newline at end of file
+    ordering = ('-reference',)
+
+
+@admin.register(models.ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    """Report job admin."""
+
+    def result_link(self, obj):
+        """Link to the report job page, which displays the result."""
+        return format_html('<a href="{}">{}</a>', reverse('admin_report_job', kwargs={'job_pk': obj.id}), _('View'))
+    result_link.short_description = _('Result')
+
+    list_display = ('__str__', 'user', 'report', 'status', 'created_at', 'started_at', 'finished_at', 'result_link')
+    list_filter = ('status', 'report')
+    readonly_fields = ('started_at', 'finished_at', 'error')
+    ordering = ('-created_at',)
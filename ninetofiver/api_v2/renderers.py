@@ -0,0 +1,37 @@
+"""925r API v2 renderers."""
+import json
+from collections.abc import Iterator
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """
+    Columnar JSON renderer.
+
+    Renders JSON like the regular JSON renderer, but is selected using `format=columnar`, so views supporting it can
+    return their data in a columnar format instead.
+    """
+
+    format = 'columnar'
+
+
+def stream_json_object(items):
+    """
+    Yield the given (key, value) pairs as chunks of a single JSON object, the way `JSONRenderer` renders it.
+
+    Values can be callables, which are only called once the preceding items have been yielded, or iterators of
+    (key, value) pairs, which are streamed as nested objects.
+    """
+    yield '{'
+
+    for i, (key, value) in enumerate(items):
+        yield '%s%s:' % (',' if i else '', json.dumps(str(key)))
+
+        if isinstance(value, Iterator):
+            yield from stream_json_object(value)
+        else:
+            value = value() if callable(value) else value
+            yield json.dumps(value, cls=encoders.JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+    yield '}'
@@ -3,11 +3,12 @@ from rest_framework import status
 from rest_framework.test import APITestCase
 from rest_assured import testcases
 from ninetofiver import factories, models
-from ninetofiver.tests import ModelTestMixin, AuthenticatedAPITestCase
+from ninetofiver.tests import ModelTestMixin, ListQueryBudgetTestMixin, AuthenticatedAPITestCase
 from django.utils import timezone
 from django.shortcuts import reverse
 import tempfile
 import datetime
+import json
 
 
 class GenericViewTests(AuthenticatedAPITestCase):
@@ -30,6 +31,40 @@ class GenericViewTests(AuthenticatedAPITestCase):
         })
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_range_info_view_included(self):
+        """Test range info view with included objects."""
+        today = datetime.date.today()
+        company = factories.InternalCompanyFactory.create(country='BE')
+        factories.EmploymentContractFactory.create(
+            user=self.user, company=company, work_schedule=factories.WorkScheduleFactory.create(),
+            employment_contract_type=factories.EmploymentContractTypeFactory.create(),
+            started_at=today, ended_at=None)
+        holiday = factories.HolidayFactory.create(date=today, country='BE')
+        timesheet = factories.OpenTimesheetFactory.create(user=self.user, year=today.year, month=today.month)
+        contract = factories.ContractFactory.create(company=company)
+        contract_role = factories.ContractRoleFactory.create()
+        factories.ContractUserFactory.create(user=self.user, contract=contract, contract_role=contract_role)
+        performance = factories.ActivityPerformanceFactory.create(
+            timesheet=timesheet, date=today, contract=contract, contract_role=contract_role,
+            performance_type=factories.PerformanceTypeFactory.create())
+
+        response = self.client.get('/api/v2/range_info/', {
+            'from': str(today),
+            'until': str(today),
+            'daily': 'true',
+            'detailed': 'true',
+            'included': 'true',
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        day = response.data['details'][str(today)]
+        self.assertEqual(day['holidays'], [holiday.id])
+        self.assertEqual(day['activity_performances'], [performance.id])
+
+        # Every referenced object resolves to an included one
+        for key in ['holidays', 'leaves', 'activity_performances', 'standby_performances']:
+            for object_id in day[key]:
+                self.assertEqual(response.data['included'][key][str(object_id)]['id'], object_id)
+
     def test_range_availability_view(self):
         """Test range availability view."""
         response = self.client.get('/api/v2/range_availability/', {
@@ -38,6 +73,70 @@ class GenericViewTests(AuthenticatedAPITestCase):
         })
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_range_availability_view_included(self):
+        """Test range availability view with included objects."""
+        holiday = factories.HolidayFactory.create(date=datetime.date.today(), country='BE')
+        factories.EmploymentContractFactory.create(
+            user=self.user, company=factories.InternalCompanyFactory.create(country='BE'),
+            work_schedule=factories.WorkScheduleFactory.create(),
+            employment_contract_type=factories.EmploymentContractTypeFactory.create(),
+            started_at=datetime.date.today(), ended_at=None)
+
+        response = self.client.get('/api/v2/range_availability/', {
+            'from': str(datetime.date.today()),
+            'until': str(datetime.date.today()),
+            'user': str(self.user.id),
+            'included': 'true',
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.data['data'][str(self.user.id)][str(datetime.date.today())]['holidays'],
+                         [holiday.id])
+
+        response = self.client.get('/api/v2/range_availability/', {
+            'from': str(datetime.date.today()),
+            'until': str(datetime.date.today()),
+            'user': str(self.user.id),
+            'included': 'true',
+            'stream': 'true',
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content).decode('utf-8'))
+        self.assertEqual(list(data.keys()), ['data', 'included'])
+        self.assertEqual(data['data'][str(self.user.id)][str(datetime.date.today())]['holidays'], [holiday.id])
+        self.assertEqual(data['included']['holidays'][str(holiday.id)]['id'], holiday.id)
+
+    def test_range_availability_view_invalid(self):
+        """Test whether range availability parameters are validated before streaming starts."""
+        response = self.client.get('/api/v2/range_availability/', {'from': 'invalid', 'stream': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_range_availability_view_columnar(self):
+        """Test range availability view with the columnar format."""
+        holiday = factories.HolidayFactory.create(date=datetime.date.today(), country='BE')
+        factories.EmploymentContractFactory.create(
+            user=self.user, company=factories.InternalCompanyFactory.create(country='BE'),
+            work_schedule=factories.WorkScheduleFactory.create(),
+            employment_contract_type=factories.EmploymentContractTypeFactory.create(),
+            started_at=datetime.date.today(), ended_at=None)
+
+        response = self.client.get('/api/v2/range_availability/', {
+            'from': str(datetime.date.today()),
+            'until': str(datetime.date.today() + datetime.timedelta(days=1)),
+            'user': str(self.user.id),
+            'format': 'columnar',
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data['dates'], [str(datetime.date.today()),
+                                         str(datetime.date.today() + datetime.timedelta(days=1))])
+        self.assertEqual(data['users'], [self.user.id])
+        self.assertEqual(len(data['work_hours'][0]), 2)
+        self.assertEqual(data['tags'][0][0], 1 << data['legend'].index('holidays'))
+        self.assertEqual(data['holidays'], [[0, 0, holiday.id]])
+        self.assertIn(str(holiday.id), data['included']['holidays'])
+
 
 class ApiKeyAuthenticationTests(APITestCase):
     """API key authentication tests."""
@@ -123,12 +222,14 @@ class ApiKeyAuthenticationTests(APITestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
-class AttachmentAPITestCase(testcases.ReadWriteRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin):
+class AttachmentAPITestCase(testcases.ReadWriteRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin,
+                            ListQueryBudgetTestMixin):
     """Attachment API test case."""
 
     base_name = 'ninetofiver_api_v2:attachment'
     factory_class = factories.AttachmentFactory
     user_factory = factories.AdminFactory
+    list_query_budget = 2
     create_data = {
         'name': 'myfile',
         'description': 'My file\'s description',
@@ -161,12 +262,14 @@ class AttachmentAPITestCase(testcases.ReadWriteRESTAPITestCaseMixin, testcases.B
         return super().get_update_response(data=data, results=results, use_patch=True, format='multipart', **kwargs)
 
 
-class TimesheetAPITestCase(testcases.ReadWriteRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin):
+class TimesheetAPITestCase(testcases.ReadWriteRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin,
+                           ListQueryBudgetTestMixin):
     """Timesheet API test case."""
 
     base_name = 'ninetofiver_api_v2:timesheet'
     factory_class = factories.TimesheetFactory
     user_factory = factories.AdminFactory
+    list_query_budget = 3
     create_data = {
         'status': 'active',
         'year': datetime.date.today().year,
@@ -243,12 +346,14 @@ class TimesheetTests(AuthenticatedAPITestCase):
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
 
-class HolidayAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin):
+class HolidayAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin,
+                         ListQueryBudgetTestMixin):
     """Holiday API test case."""
 
     base_name = 'ninetofiver_api_v2:holiday'
     factory_class = factories.HolidayFactory
     user_factory = factories.AdminFactory
+    list_query_budget = 2
     create_data = {
         'name': 'Friday Night Deploy',
         'date': datetime.date(2018, 1, 15),
@@ -261,12 +366,14 @@ class HolidayAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRESTA
     }
 
 
-class LeaveTypeAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin):
+class LeaveTypeAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin,
+                           ListQueryBudgetTestMixin):
     """Leave type API test case."""
 
     base_name = 'ninetofiver_api_v2:leavetype'
     factory_class = factories.LeaveTypeFactory
     user_factory = factories.AdminFactory
+    list_query_budget = 2
     create_data = {
         'name': 'ADV',
     }
@@ -275,12 +382,14 @@ class LeaveTypeAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRES
     }
 
 
-class LocationAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin):
+class LocationAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin,
+                          ListQueryBudgetTestMixin):
     """Location API test case."""
 
     base_name = 'ninetofiver_api_v2:location'
     factory_class = factories.LocationFactory
     user_factory = factories.AdminFactory
+    list_query_budget = 2
     create_data = {
         'name': 'Loc#1',
     }
@@ -289,12 +398,14 @@ class LocationAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseREST
     }
 
 
-class PerformanceTypeAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin):
+class PerformanceTypeAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin,
+                                 ListQueryBudgetTestMixin):
     """Performance type API test case."""
 
     base_name = 'ninetofiver_api_v2:performancetype'
     factory_class = factories.PerformanceTypeFactory
     user_factory = factories.AdminFactory
+    list_query_budget = 2
     create_data = {
         'name': 'Regular',
         'multiplier': 1.00,
@@ -305,12 +416,16 @@ class PerformanceTypeAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.B
     }
 
 
-class ContractAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin):
+class ContractAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin,
+                          ListQueryBudgetTestMixin):
     """Contract API test case."""
 
     base_name = 'ninetofiver_api_v2:contract'
     factory_class = factories.ProjectContractFactory
     user_factory = factories.AdminFactory
+    # Contracts are polymorphic, so listing them performs an additional query per contract type
+    # Since only project contracts are listed, the budget is still constant
+    list_query_budget = 6
 
     def setUp(self):
         self.company = factories.InternalCompanyFactory.create()
@@ -324,12 +439,14 @@ class ContractAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseREST
         return obj
 
 
-class ContractRoleAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin):
+class ContractRoleAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin,
+                              ListQueryBudgetTestMixin):
     """Contract role API test case."""
 
     base_name = 'ninetofiver_api_v2:contractrole'
     factory_class = factories.ContractRoleFactory
     user_factory = factories.AdminFactory
+    list_query_budget = 2
     create_data = {
         'name': 'Project Manager',
     }
@@ -338,12 +455,14 @@ class ContractRoleAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.Base
     }
 
 
-class ContractUserAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin):
+class ContractUserAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin,
+                              ListQueryBudgetTestMixin):
     """Contract user API test case."""
 
     base_name = 'ninetofiver_api_v2:contractuser'
     factory_class = factories.ContractUserFactory
     user_factory = factories.AdminFactory
+    list_query_budget = 2
     create_data = {}
     update_data = {}
 
@@ -358,13 +477,19 @@ class ContractUserAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.Base
     def get_object(self, factory):
         return factory.create(contract=self.contract, contract_role=self.contract_role, user=self.user)
 
+    def create_query_budget_row(self):
+        return factories.ContractUserFactory.create(contract=self.contract, user=self.user,
+                                                    contract_role=factories.ContractRoleFactory.create())
+
 
-class WhereaboutAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin):
+class WhereaboutAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin,
+                            ListQueryBudgetTestMixin):
     """Whereabout API test case."""
 
     base_name = 'ninetofiver_api_v2:whereabout'
     factory_class = factories.WhereaboutFactory
     # user_factory = factories.AdminFactory
+    list_query_budget = 2
     create_data = {
         'starts_at': timezone.make_aware(datetime.datetime(2018, 3, 20, 13, 50)),
         'ends_at': timezone.make_aware(datetime.datetime(2018, 3, 20, 14, 50)),
@@ -389,13 +514,22 @@ class WhereaboutAPITestCase(testcases.ReadRESTAPITestCaseMixin, testcases.BaseRE
 
         return obj
 
+    def create_query_budget_row(self):
+        day = models.Whereabout.objects.count() + 1
+        return factories.WhereaboutFactory.create(
+            location=self.location, timesheet=self.timesheet,
+            starts_at=timezone.make_aware(datetime.datetime(2018, 3, day, 9, 0)),
+            ends_at=timezone.make_aware(datetime.datetime(2018, 3, day, 12, 0)))
+
 
-class PerformanceAPITestCase(testcases.ReadWriteRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin):
+class PerformanceAPITestCase(testcases.ReadWriteRESTAPITestCaseMixin, testcases.BaseRESTAPITestCase, ModelTestMixin,
+                             ListQueryBudgetTestMixin):
     """Performance API test case."""
 
     base_name = 'ninetofiver_api_v2:performance'
     factory_class = factories.ActivityPerformanceFactory
     # user_factory = factories.AdminFactory
+    list_query_budget = 5
     create_data = {
         'date': datetime.date(2018, 3, 15),
         'duration': 12,
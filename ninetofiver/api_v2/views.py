@@ -1,15 +1,18 @@
 """925r API v2 views."""
 import datetime
 import dateutil
+from itertools import chain, islice
 from django.contrib.auth import models as auth_models
 from django.core.exceptions import ValidationError
 from django.utils.translation import ugettext_lazy as _
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Prefetch
+from django.db.models import Q, Prefetch, prefetch_related_objects
+from django.http import StreamingHttpResponse
 from rest_framework import mixins, permissions, viewsets, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from ninetofiver.api_v2 import serializers, filters
+from rest_framework.settings import api_settings
+from ninetofiver.api_v2 import serializers, filters, renderers
 from ninetofiver import models, feeds, calculation, redmine
 from ninetofiver.views import BaseTimesheetContractPdfExportServiceAPIView
 
@@ -119,7 +122,9 @@ class TimesheetViewSet(viewsets.ModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = serializers.TimesheetSerializer
     filter_class = filters.TimesheetFilter
-    queryset = models.Timesheet.objects.all()
+    queryset = (models.Timesheet.objects.all()
+                .select_related('user')
+                .prefetch_related('attachments'))
 
     def get_queryset(self):
         return self.queryset.filter(user=self.request.user)
@@ -137,8 +142,8 @@ class LeaveViewSet(viewsets.ModelViewSet):
     serializer_class = serializers.LeaveSerializer
     filter_class = filters.LeaveFilter
     queryset = (models.Leave.objects.all()
-                .select_related('leave_type')
-                .prefetch_related('leavedate_set'))
+                .select_related('leave_type', 'user')
+                .prefetch_related('leavedate_set', 'attachments'))
 
     def get_queryset(self):
         return self.queryset.filter(user=self.request.user)
@@ -156,7 +161,7 @@ class WhereaboutViewSet(viewsets.ModelViewSet):
     serializer_class = serializers.WhereaboutSerializer
     filter_class = filters.WhereaboutFilter
     queryset = (models.Whereabout.objects.all()
-                .select_related('location'))
+                .select_related('location', 'timesheet', 'timesheet__user'))
 
     def get_queryset(self):
         return self.queryset.filter(timesheet__user=self.request.user)
@@ -174,6 +179,19 @@ class PerformanceViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return self.queryset.filter(timesheet__user=self.request.user)
 
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+
+        # Related objects aren't selected along with the child instances polymorphic querysets return,
+        # so they are prefetched for the whole page instead
+        if page is not None:
+            for performance_class, lookups in [(models.ActivityPerformance, ['contract__customer', 'performance_type',
+                                                                             'contract_role']),
+                                               (models.StandbyPerformance, ['contract__customer'])]:
+                prefetch_related_objects([x for x in page if isinstance(x, performance_class)], *lookups)
+
+        return page
+
 
 class AttachmentViewSet(viewsets.ModelViewSet):
     """CRUD attachments."""
@@ -181,7 +199,8 @@ class AttachmentViewSet(viewsets.ModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = serializers.AttachmentSerializer
     filter_class = filters.AttachmentFilter
-    queryset = (models.Attachment.objects.all())
+    queryset = (models.Attachment.objects.all()
+                .select_related('user'))
 
     def get_queryset(self):
         return self.queryset.filter(user=self.request.user)
@@ -272,22 +291,58 @@ class PerformanceImportAPIView(APIView):
 
 
 class RangeAvailabilityAPIView(APIView):
-    """Get availability for all active users."""
+    """
+    Get availability for all active users.
+
+    Pass `included=true` to have days reference objects by ID, in which case availability is nested under `data`
+    and the objects themselves are listed under `included`. Pass `format=columnar` to get availability in a compact,
+    columnar format instead.
+
+    Pass `stream=true` along with `format=json` to have plain JSON streamed as availability is determined for every
+    chunk of users, so it isn't kept in memory. Parameters are validated and the first chunk is determined before
+    streaming starts, but errors determining later chunks can only be logged, leaving the response incomplete.
+    """
 
     permission_classes = (permissions.IsAuthenticated,)
+    renderer_classes = list(api_settings.DEFAULT_RENDERER_CLASSES) + [renderers.ColumnarJSONRenderer]
 
     def get(self, request, format=None):
         """Defines the entrypoint of the retrieval."""
-        from_date = dateutil.parser.parse(request.query_params.get('from', None)).date()
-        until_date = dateutil.parser.parse(request.query_params.get('until', None)).date()
+        try:
+            from_date = dateutil.parser.parse(request.query_params['from']).date()
+            until_date = dateutil.parser.parse(request.query_params['until']).date()
+            user_ids = (list(map(int, request.query_params['user'].split(',')))
+                        if request.query_params.get('user', None) else None)
+        except (KeyError, ValueError, OverflowError):
+            raise ValidationError(_('A valid from and until date, and optionally a list of user IDs, are required.'))
 
         users = auth_models.User.objects.filter(is_active=True)
-        users = users if not request.query_params.get('user', None) else \
-            users.filter(id__in=list(map(int, request.query_params.get('user', None).split(','))))
+        users = users if user_ids is None else users.filter(id__in=user_ids)
+
+        if request.accepted_renderer.format == renderers.ColumnarJSONRenderer.format:
+            data = calculation.get_columnar_availability(users, from_date, until_date)
+            return Response(data, status=status.HTTP_200_OK)
+
+        included = calculation.IncludedObjects() if request.query_params.get('included', 'false') == 'true' else None
+        stream = ((request.accepted_renderer.format == 'json') and
+                  (request.query_params.get('stream', 'false') == 'true'))
+        items = calculation.iter_availability(users.iterator() if stream else users, from_date, until_date,
+                                              serialize=True, included=included)
+
+        if not stream:
+            data = {str(user_id): user_data for user_id, user_data in items}
+            if included:
+                data = {'data': data, 'included': included.serialize()}
+            return Response(data, status=status.HTTP_200_OK)
 
-        data = calculation.get_availability(users, from_date, until_date, serialize=True)
+        # The first chunk of users is determined before streaming starts, so errors fetching data still result in an
+        # error response
+        items = chain(list(islice(items, 1)), items)
+        if included:
+            # Availability is nested under data, and objects are only included once it's been determined for all users
+            items = iter([('data', items), ('included', included.serialize)])
 
-        return Response(data, status=status.HTTP_200_OK)
+        return StreamingHttpResponse(renderers.stream_json_object(items), content_type='application/json')
 
 
 class RangeInfoAPIView(APIView):
@@ -304,9 +359,12 @@ class RangeInfoAPIView(APIView):
         daily = request.query_params.get('daily', 'false') == 'true'
         detailed = request.query_params.get('detailed', 'false') == 'true'
         summary = request.query_params.get('summary', 'false') == 'true'
+        included = calculation.IncludedObjects() if request.query_params.get('included', 'false') == 'true' else None
 
         data = calculation.get_range_info([user], from_date, until_date, daily=daily, detailed=detailed,
-                                          summary=summary, serialize=True)
+                                          summary=summary, serialize=True, included=included)
         data = data[user.id]
+        if included:
+            data['included'] = included.serialize()
 
         return Response(data)
\ No newline at end of file
@@ -1,70 +1,445 @@
 """Calculation."""
-from django.db.models import Q
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Q, Count, Sum, prefetch_related_objects
+from django.utils.dateparse import parse_date
+from django.utils.functional import cached_property
 from decimal import Decimal
-from datetime import timedelta
+from datetime import date, timedelta
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 import copy
-from ninetofiver import models
+import json
+import numpy as np
+from ninetofiver import models, settings
 from ninetofiver.api_v2 import serializers
+from ninetofiver.utils import hours_to_centi, centi_to_hours, seconds_to_centi, multiply_centi
 
 
-def get_availability(users, from_date, until_date, serialize=False):
-    """Determine and return availability."""
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+BUCKET_GRANULARITIES = ['day', 'week', 'month', 'year']
+HOUR_KEYS = ['work_hours', 'holiday_hours', 'leave_hours', 'pending_leave_hours', 'performed_hours', 'remaining_hours',
+             'total_hours', 'overtime_hours']
+
+
+def get_weekday_hours(work_schedule):
+    """Get the hours of a (contract user) work schedule as a list indexed by weekday, with monday being 0."""
+    return [getattr(work_schedule, weekday) for weekday in WEEKDAYS]
+
+
+class EmploymentTimeline:
+    """
+    Employment timeline.
+
+    Compiles the employment contracts of a single user into sorted, non-overlapping intervals. This allows looking
+    up the effective employment contract, work hours and country for any day using a binary search.
+    """
+
+    def __init__(self, employment_contracts):
+        """Constructor."""
+        # Every start date and every day following an end date is a boundary at which the effective
+        # employment contract may change
+        boundaries = set()
+        for ec in employment_contracts:
+            boundaries.add(ec.started_at.toordinal())
+            if ec.ended_at:
+                boundaries.add(ec.ended_at.toordinal() + 1)
+
+        # For every interval, the earliest started employment contract covering it is the effective one
+        self.starts = sorted(boundaries)
+        self.intervals = []
+        for start in self.starts:
+            employment_contract = None
+            for ec in employment_contracts:
+                if (ec.started_at.toordinal() <= start) and ((not ec.ended_at) or (ec.ended_at.toordinal() >= start)):
+                    employment_contract = ec
+                    break
+
+            weekday_hours = get_weekday_hours(employment_contract.work_schedule) if employment_contract else None
+            self.intervals.append([
+                employment_contract,
+                weekday_hours,
+                [hours_to_centi(x) for x in weekday_hours] if weekday_hours else None,
+            ])
+
+    def get_interval(self, current_date):
+        """Get the interval containing the given day."""
+        i = bisect_right(self.starts, current_date.toordinal()) - 1
+        return self.intervals[i] if i >= 0 else [None, None, None]
+
+    def get_employment_contract(self, current_date):
+        """Get the effective employment contract on the given day."""
+        return self.get_interval(current_date)[0]
+
+    def get_work_hours(self, current_date):
+        """Get the amount of hours to work on the given day."""
+        weekday_hours = self.get_interval(current_date)[1]
+        return weekday_hours[current_date.weekday()] if weekday_hours else Decimal('0.00')
+
+    def get_work_centi_hours(self, current_date):
+        """Get the amount of hundredths of an hour to work on the given day."""
+        weekday_centi_hours = self.get_interval(current_date)[2]
+        return weekday_centi_hours[current_date.weekday()] if weekday_centi_hours else 0
+
+    def get_country(self, current_date):
+        """Get the country of the company employing the user on the given day."""
+        employment_contract = self.get_interval(current_date)[0]
+        return employment_contract.company.country if employment_contract else None
+
+
+class IncludedObjects:
+    """
+    Included objects.
+
+    Collects the objects referenced by serialized calculation results, so they can be serialized once into a map
+    indexed by type, then by ID, instead of once for every user and day referencing them.
+    """
+
+    def __init__(self):
+        """Constructor."""
+        self.objects = {}
+
+    def add(self, key, serializer_class, objects):
+        """Add objects of the given type, returning their IDs."""
+        included = self.objects.setdefault(key, (serializer_class, {}))[1]
+        for obj in objects:
+            included[obj.id] = obj
+        return [obj.id for obj in objects]
+
+    def serialize(self):
+        """Serialize all included objects, indexed by type, then by ID."""
+        res = {}
+        for key, (serializer_class, included) in self.objects.items():
+            objects = list(included.values())
+            if key == 'leaves':
+                prefetch_related_objects(objects, 'attachments', 'leavedate_set')
+            res[key] = {str(x['id']): x for x in serializer_class(objects, many=True).data}
+        return res
+
+
+class CalendarContext:
+    """
+    Calendar context.
+
+    Fetches and indexes the employment contracts, leave dates, holidays, whereabouts and performances for a set of
+    users and a date range. Every dataset is only fetched when it is first needed, and only once, so the same context
+    can be passed to every calculation made for those users and that range within a request.
+    """
+
+    def __init__(self, users, from_date, until_date):
+        """Constructor."""
+        self.users = list(users)
+        self.user_ids = [user.id for user in self.users]
+        self.from_date = from_date
+        self.until_date = until_date
+
+    @cached_property
+    def sickness_type_ids(self):
+        """Get the IDs of all sickness leave types."""
+        return list(models.LeaveType.objects.filter(sickness=True).values_list('id', flat=True))
+
+    @cached_property
+    def employment_contracts(self):
+        """Get all employment contracts for this period, indexed by user ID."""
+        employment_contracts = (models.EmploymentContract.objects
+                                .filter(
+                                    (Q(ended_at__isnull=True) & Q(started_at__lte=self.until_date)) |
+                                    (Q(started_at__lte=self.until_date) & Q(ended_at__gte=self.from_date)),
+                                    user__in=self.user_ids)
+                                .order_by('started_at')
+                                .select_related('user', 'company', 'work_schedule'))
+        employment_contract_data = {}
+        for employment_contract in employment_contracts:
+            (employment_contract_data
+                .setdefault(employment_contract.user.id, [])
+                .append(employment_contract))
+        return employment_contract_data
+
+    @cached_property
+    def leave_dates(self):
+        """Get all approved and pending leave dates for this period, indexed by day, then by user ID."""
+        leave_dates = (models.LeaveDate.objects
+                       .filter(leave__user__in=self.user_ids,
+                               leave__status__in=[models.STATUS_PENDING, models.STATUS_APPROVED],
+                               starts_at__date__gte=self.from_date, starts_at__date__lte=self.until_date)
+                       .select_related('leave', 'leave__leave_type', 'leave__user'))
+        leave_date_data = {}
+        for leave_date in leave_dates:
+            (leave_date_data
+                .setdefault(str(leave_date.starts_at.date()), {})
+                .setdefault(leave_date.leave.user.id, [])
+                .append(leave_date))
+        return leave_date_data
+
+    @cached_property
+    def holidays(self):
+        """Get all holidays for this period, indexed by day, then by country."""
+        holidays = (models.Holiday.objects
+                    .filter(date__gte=self.from_date, date__lte=self.until_date))
+        holiday_data = {}
+        for holiday in holidays:
+            (holiday_data
+                .setdefault(str(holiday.date), {})
+                .setdefault(holiday.country, [])
+                .append(holiday))
+        return holiday_data
+
+    @cached_property
+    def whereabouts(self):
+        """Get all whereabouts for this period, indexed by day, then by user ID."""
+        whereabouts = (models.Whereabout.objects
+                       .filter(timesheet__user__in=self.user_ids, starts_at__date__gte=self.from_date,
+                               starts_at__date__lte=self.until_date)
+                       .select_related('timesheet', 'timesheet__user', 'location'))
+        whereabout_data = {}
+        for whereabout in whereabouts:
+            (whereabout_data
+                .setdefault(str(whereabout.starts_at.date()), {})
+                .setdefault(whereabout.timesheet.user.id, [])
+                .append(whereabout))
+        return whereabout_data
+
+    @cached_property
+    def activity_performances(self):
+        """Get all activity performances for this period, indexed by day, then by user ID."""
+        activity_performances = (models.ActivityPerformance.objects
+                                 .filter(date__gte=self.from_date, date__lte=self.until_date,
+                                         timesheet__user__in=self.user_ids)
+                                 .select_related('performance_type', 'contract_role', 'contract',
+                                                 'contract__customer', 'timesheet', 'timesheet__user'))
+        activity_performance_data = {}
+        for performance in activity_performances:
+            (activity_performance_data
+                .setdefault(str(performance.date), {})
+                .setdefault(performance.timesheet.user.id, [])
+                .append(performance))
+        return activity_performance_data
+
+    @cached_property
+    def standby_performances(self):
+        """Get all standby performances for this period, indexed by day, then by user ID."""
+        standby_performances = (models.StandbyPerformance.objects
+                                .filter(date__gte=self.from_date, date__lte=self.until_date,
+                                        timesheet__user__in=self.user_ids)
+                                .select_related('contract', 'contract__customer', 'timesheet', 'timesheet__user'))
+        standby_performance_data = {}
+        for performance in standby_performances:
+            (standby_performance_data
+                .setdefault(str(performance.date), {})
+                .setdefault(performance.timesheet.user.id, [])
+                .append(performance))
+        return standby_performance_data
+
+    @cached_property
+    def employment_contract_values(self):
+        """
+        Get the user ID, start date, end date, country and weekday hours of all employment contracts for this period.
+
+        Values are taken from the employment contracts if those have been fetched already, and fetched without
+        instantiating any models otherwise.
+        """
+        if 'employment_contracts' in self.__dict__:
+            return [[x.user_id, x.started_at, x.ended_at, x.company.country] + get_weekday_hours(x.work_schedule)
+                    for user_employment_contracts in self.employment_contracts.values()
+                    for x in user_employment_contracts]
+
+        employment_contracts = (models.EmploymentContract.objects
+                                .filter(
+                                    (Q(ended_at__isnull=True) & Q(started_at__lte=self.until_date)) |
+                                    (Q(started_at__lte=self.until_date) & Q(ended_at__gte=self.from_date)),
+                                    user__in=self.user_ids)
+                                .order_by('started_at')
+                                .values_list('user', 'started_at', 'ended_at', 'company__country',
+                                             'work_schedule__monday', 'work_schedule__tuesday',
+                                             'work_schedule__wednesday', 'work_schedule__thursday',
+                                             'work_schedule__friday', 'work_schedule__saturday',
+                                             'work_schedule__sunday'))
+        return [list(x) for x in employment_contracts]
+
+    @cached_property
+    def holiday_values(self):
+        """Get the date and country of all holidays for this period."""
+        if 'holidays' in self.__dict__:
+            return [[x.date, x.country] for day_holidays in self.holidays.values()
+                    for country_holidays in day_holidays.values() for x in country_holidays]
+
+        return list(models.Holiday.objects
+                    .filter(date__gte=self.from_date, date__lte=self.until_date)
+                    .values_list('date', 'country'))
+
+    @cached_property
+    def leave_date_values(self):
+        """Get the user ID, leave status, start and end of all approved and pending leave dates for this period."""
+        if 'leave_dates' in self.__dict__:
+            return [[user_id, x.leave.status, x.starts_at, x.ends_at] for day_leave_dates in self.leave_dates.values()
+                    for user_id, user_leave_dates in day_leave_dates.items() for x in user_leave_dates]
+
+        return list(models.LeaveDate.objects
+                    .filter(leave__user__in=self.user_ids,
+                            leave__status__in=[models.STATUS_PENDING, models.STATUS_APPROVED],
+                            starts_at__date__gte=self.from_date, starts_at__date__lte=self.until_date)
+                    .values_list('leave__user', 'leave__status', 'starts_at', 'ends_at'))
+
+    @cached_property
+    def activity_performance_values(self):
+        """Get the user ID, date, duration and multiplier of all activity performances for this period."""
+        if 'activity_performances' in self.__dict__:
+            return [[user_id, x.date, x.duration, x.performance_type.multiplier]
+                    for day_performances in self.activity_performances.values()
+                    for user_id, user_performances in day_performances.items() for x in user_performances]
+
+        return list(models.ActivityPerformance.objects
+                    .filter(date__gte=self.from_date, date__lte=self.until_date, timesheet__user__in=self.user_ids)
+                    .values_list('timesheet__user', 'date', 'duration', 'performance_type__multiplier'))
+
+    @cached_property
+    def employment_timelines(self):
+        """Get employment timelines, indexed by user ID."""
+        return {user_id: EmploymentTimeline(self.employment_contracts.get(user_id, []))
+                for user_id in self.user_ids}
+
+    def prefetch(self):
+        """Fetch all datasets at once."""
+        for key in ['sickness_type_ids', 'employment_contracts', 'leave_dates', 'holidays', 'whereabouts',
+                    'activity_performances', 'standby_performances', 'employment_timelines']:
+            getattr(self, key)
+
+    def get_subset(self, users):
+        """Get a context for a subset of the users, containing the data which has been fetched for them already."""
+        subset = CalendarContext(users, self.from_date, self.until_date)
+        user_ids = set(subset.user_ids)
+
+        for key in ['sickness_type_ids', 'holidays']:
+            if key in self.__dict__:
+                subset.__dict__[key] = self.__dict__[key]
+        for key in ['employment_contracts', 'employment_timelines']:
+            if key in self.__dict__:
+                subset.__dict__[key] = {x: y for x, y in self.__dict__[key].items() if x in user_ids}
+        for key in ['leave_dates', 'whereabouts', 'activity_performances', 'standby_performances']:
+            if key in self.__dict__:
+                subset.__dict__[key] = {day: {x: y for x, y in day_data.items() if x in user_ids}
+                                        for day, day_data in self.__dict__[key].items()}
+        for key in ['employment_contract_values', 'leave_date_values', 'activity_performance_values']:
+            if key in self.__dict__:
+                subset.__dict__[key] = [x for x in self.__dict__[key] if x[0] in user_ids]
+        if 'holiday_values' in self.__dict__:
+            subset.__dict__['holiday_values'] = self.__dict__['holiday_values']
+
+        return subset
+
+    def check(self, users, from_date, until_date):
+        """Check whether this context covers the given users and date range, raising a `ValueError` otherwise."""
+        if (from_date != self.from_date) or (until_date != self.until_date):
+            raise ValueError('Calendar context range %s - %s does not match %s - %s' %
+                             (self.from_date, self.until_date, from_date, until_date))
+
+        missing_user_ids = set(user.id for user in users) - set(self.user_ids)
+        if missing_user_ids:
+            raise ValueError('Calendar context does not contain users %s' % sorted(missing_user_ids))
+
+    def get_employment_timeline(self, user_id):
+        """Get the employment timeline for the given user."""
+        try:
+            return self.employment_timelines[user_id]
+        except KeyError:
+            return self.employment_timelines.setdefault(user_id, EmploymentTimeline([]))
+
+    def get_employment_contract(self, user_id, current_date):
+        """Get the employment contract for the given user on the given day."""
+        return self.get_employment_timeline(user_id).get_employment_contract(current_date)
+
+    def get_work_hours(self, user_id, current_date):
+        """Get the amount of hours the given user should work on the given day."""
+        return self.get_employment_timeline(user_id).get_work_hours(current_date)
+
+    def get_country(self, user_id, current_date):
+        """Get the country the given user works in on the given day."""
+        return self.get_employment_timeline(user_id).get_country(current_date)
+
+
+def get_calendar_context(users, from_date, until_date, context=None):
+    """Get the given calendar context after checking it matches the given users and range, or create a new one."""
+    if not context:
+        return CalendarContext(users, from_date, until_date)
+
+    context.check(users, from_date, until_date)
+    return context
+
+
+def chunk_users(users, chunk_size=None):
+    """Split the given users into lists of at most the given size, defaulting to the configured chunk size."""
+    chunk_size = chunk_size if chunk_size else settings.CALCULATION_CHUNK_SIZE
+    users = iter(users)
+
+    while True:
+        chunk = list(islice(users, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _calculate_partition(fn, context, from_date, until_date, kwargs):
+    """Run a calculation for a single partition of users."""
+    return fn(context.users, from_date, until_date, context=context, **kwargs)
+
+
+def calculate_parallel(fn, users, from_date, until_date, workers=None, threshold=None, context=None, **kwargs):
+    """
+    Run a calculation such as `get_range_info`, `get_availability` or `get_availability_info` using multiple processes.
+
+    All data is fetched up front, after which the users are partitioned across a process pool and the results are
+    merged. The worker processes never query the database, so calculations requiring serialization or included
+    objects are rejected. Small inputs, in user days, are calculated serially since starting the pool would take
+    longer. Forking a process pool is meant for management commands, not for handling requests.
+    """
+    if kwargs.get('serialize', False) or (kwargs.get('included', None) is not None):
+        raise ValueError('Parallel calculations can not serialize or include objects, since this queries the database')
+
+    workers = settings.CALCULATION_WORKERS if workers is None else workers
+    threshold = settings.CALCULATION_PARALLEL_THRESHOLD if threshold is None else threshold
+    context = get_calendar_context(users, from_date, until_date, context)
+    users = context.users
+    day_count = (until_date - from_date).days + 1
+
+    if (workers < 2) or (len(users) < 2) or ((len(users) * day_count) < threshold):
+        return fn(users, from_date, until_date, context=context, **kwargs)
+
+    context.prefetch()
+    partitions = [users[i::workers] for i in range(min(workers, len(users)))]
+
+    # Forked processes would share the open database connections, so they are closed and reopened when needed
+    connections.close_all()
+
     res = {}
+    with ProcessPoolExecutor(max_workers=len(partitions)) as executor:
+        futures = [executor.submit(_calculate_partition, fn, context.get_subset(partition), from_date, until_date,
+                                   kwargs) for partition in partitions]
+        for future in futures:
+            res.update(future.result())
 
-    # Fetch sickness leave type IDs
-    sickness_type_ids = list(models.LeaveType.objects.filter(sickness=True).values_list('id', flat=True))
-
-    # Fetch all employment contracts for this period
-    employment_contracts = (models.EmploymentContract.objects
-                            .filter(
-                                (Q(ended_at__isnull=True) & Q(started_at__lte=until_date)) |
-                                (Q(started_at__lte=until_date) & Q(ended_at__gte=from_date)),
-                                user__in=users)
-                            .order_by('started_at')
-                            .select_related('user', 'company', 'work_schedule'))
-    # Index employment contracts by user ID
-    employment_contract_data = {}
-    for employment_contract in employment_contracts:
-        (employment_contract_data
-            .setdefault(employment_contract.user.id, [])
-            .append(employment_contract))
-
-    # Fetch all leave dates for this period
-    leave_dates = (models.LeaveDate.objects
-                   .filter(Q(leave__status=models.STATUS_APPROVED) | Q(leave__status=models.STATUS_PENDING),
-                           leave__user__in=users, starts_at__date__gte=from_date, starts_at__date__lte=until_date)
-                   .select_related('leave', 'leave__leave_type', 'leave__user'))
-    # Index leave dates by day, then by user ID
-    leave_date_data = {}
-    for leave_date in leave_dates:
-        (leave_date_data
-            .setdefault(str(leave_date.starts_at.date()), {})
-            .setdefault(leave_date.leave.user.id, [])
-            .append(leave_date))
-
-    # Fetch all holidays for this period
-    holidays = (models.Holiday.objects
-                .filter(date__gte=from_date, date__lte=until_date))
-    # Index holidays by day, then by country
-    holiday_data = {}
-    for holiday in holidays:
-        (holiday_data
-            .setdefault(str(holiday.date), {})
-            .setdefault(holiday.country, [])
-            .append(holiday))
-
-    # Fetch all whereabouts for this period
-    whereabouts = (models.Whereabout.objects
-                   .filter(timesheet__user__in=users, starts_at__date__gte=from_date,
-                           starts_at__date__lte=until_date)
-                   .select_related('timesheet', 'timesheet__user', 'location'))
-    # Index whereabouts by day, then by user ID
-    whereabout_data = {}
-    for whereabout in whereabouts:
-        (whereabout_data
-            .setdefault(str(whereabout.starts_at.date()), {})
-            .setdefault(whereabout.timesheet.user.id, [])
-            .append(whereabout))
+    return res
+
+
+def iter_availability(users, from_date, until_date, serialize=False, chunk_size=None, included=None):
+    """Determine availability for chunks of users, yielding (user ID, availability) pairs."""
+    for chunk in chunk_users(users, chunk_size):
+        context = CalendarContext(chunk, from_date, until_date)
+        res = get_availability(context.users, from_date, until_date, serialize=serialize, context=context,
+                               included=included)
+
+        for user in chunk:
+            yield user.id, res[str(user.id)]
+
+
+def get_availability(users, from_date, until_date, serialize=False, context=None, included=None):
+    """
+    Determine and return availability.
+
+    If `included` is passed along with `serialize`, days reference objects by ID and the objects themselves are added
+    to `included` instead.
+    """
+    res = {}
+    context = get_calendar_context(users, from_date, until_date, context)
 
     # Count days
     day_count = (until_date - from_date).days + 1
@@ -86,35 +461,24 @@ def get_availability(users, from_date, until_date, serialize=False):
                 'whereabouts': [],
             }
 
-            # Get employment contract for this day
-            # This allows us to determine the work schedule and country of the user
-            employment_contract = None
-            try:
-                for ec in employment_contract_data[user.id]:
-                    if (ec.started_at <= current_date) and ((not ec.ended_at) or (ec.ended_at >= current_date)):
-                        employment_contract = ec
-                        break
-            except KeyError:
-                pass
-
-            work_schedule = employment_contract.work_schedule if employment_contract else None
-            country = employment_contract.company.country if employment_contract else None
-
-            # No work occurs when there is no work_schedule, or no hours should be worked that day
-            if work_schedule:
-                user_day_data['work_hours'] = getattr(work_schedule, current_date.strftime('%A').lower(), 0.00)
+            # Get the work hours and country of the user for this day
+            # No work occurs when there is no employment contract, or no hours should be worked that day
+            timeline = context.get_employment_timeline(user.id)
+            country = timeline.get_country(current_date)
+            if timeline.get_employment_contract(current_date):
+                user_day_data['work_hours'] = timeline.get_work_hours(current_date)
 
             # Holidays
             try:
                 if country:
-                    user_day_data['holidays'] = holiday_data[str(current_date)][country][0:]
+                    user_day_data['holidays'] = context.holidays[str(current_date)][country][0:]
             except KeyError:
                 pass
 
             # Leave & Sickness
             try:
-                for leave_date in leave_date_data[str(current_date)][user.id]:
-                    if leave_date.leave.leave_type.id in sickness_type_ids:
+                for leave_date in context.leave_dates[str(current_date)][user.id]:
+                    if leave_date.leave.leave_type.id in context.sickness_type_ids:
                         user_day_data['sickness'] += [leave_date]
                     else:
                         user_day_data['leave'] += [leave_date]
@@ -123,11 +487,20 @@ def get_availability(users, from_date, until_date, serialize=False):
 
             # Whereabouts
             try:
-                user_day_data['whereabouts'] = whereabout_data[str(current_date)][user.id][0:]
+                user_day_data['whereabouts'] = context.whereabouts[str(current_date)][user.id][0:]
             except KeyError:
                 pass
 
-            if serialize:
+            if serialize and (included is not None):
+                user_day_data['whereabouts'] = included.add('whereabouts', serializers.WhereaboutSerializer,
+                                                            user_day_data['whereabouts'])
+                user_day_data['holidays'] = included.add('holidays', serializers.HolidaySerializer,
+                                                         user_day_data['holidays'])
+                user_day_data['leave'] = included.add('leave_dates', serializers.LeaveDateSerializer,
+                                                      user_day_data['leave'])
+                user_day_data['sickness'] = included.add('leave_dates', serializers.LeaveDateSerializer,
+                                                         user_day_data['sickness'])
+            elif serialize:
                 user_day_data['whereabouts'] = serializers.WhereaboutSerializer(user_day_data['whereabouts'], many=True).data
                 user_day_data['holidays'] = serializers.HolidaySerializer(user_day_data['holidays'], many=True).data
                 user_day_data['leave'] = serializers.LeaveDateSerializer(user_day_data['leave'], many=True).data
@@ -136,64 +509,60 @@ def get_availability(users, from_date, until_date, serialize=False):
     return res
 
 
-def get_availability_info(users, from_date, until_date):
+# Availability keys days are tagged with in columnar availability, in order of their bit in the tag mask
+COLUMNAR_AVAILABILITY_TAGS = ['holidays', 'leave', 'sickness', 'whereabouts']
+
+
+def get_columnar_availability(users, from_date, until_date, chunk_size=None):
+    """
+    Determine and return availability in a columnar format.
+
+    Dates and user IDs are listed once, and work hours are returned as one list of numbers per user, in the same
+    order. Days are tagged using one bit mask per user and day, of which the bits are listed in the legend. Referenced
+    objects are listed per tag as (user index, date index, ID) triples, and their details are included once.
+    """
+    included = IncludedObjects()
+    dates = [str(from_date + timedelta(days=i)) for i in range((until_date - from_date).days + 1)]
+    res = {
+        'dates': dates,
+        'users': [],
+        'legend': COLUMNAR_AVAILABILITY_TAGS,
+        'work_hours': [],
+        'tags': [],
+    }
+    for tag in COLUMNAR_AVAILABILITY_TAGS:
+        res[tag] = []
+
+    for user_index, (user_id, user_data) in enumerate(iter_availability(users, from_date, until_date, serialize=True,
+                                                                        chunk_size=chunk_size, included=included)):
+        work_hours = []
+        tags = []
+
+        for date_index, current_date in enumerate(dates):
+            day_data = user_data[current_date]
+            work_hours.append(float(day_data['work_hours']))
+            day_tags = 0
+
+            for bit, tag in enumerate(COLUMNAR_AVAILABILITY_TAGS):
+                if day_data[tag]:
+                    day_tags |= 1 << bit
+                    res[tag] += [[user_index, date_index, x] for x in day_data[tag]]
+
+            tags.append(day_tags)
+
+        res['users'].append(user_id)
+        res['work_hours'].append(work_hours)
+        res['tags'].append(tags)
+
+    res['included'] = included.serialize()
+
+    return res
+
+
+def get_availability_info(users, from_date, until_date, context=None):
     """Determine and return availability info."""
     res = {}
-
-    # Fetch sickness leave type IDs
-    sickness_type_ids = list(models.LeaveType.objects.filter(sickness=True).values_list('id', flat=True))
-
-    # Fetch all employment contracts for this period
-    employment_contracts = (models.EmploymentContract.objects
-                            .filter(
-                                (Q(ended_at__isnull=True) & Q(started_at__lte=until_date)) |
-                                (Q(started_at__lte=until_date) & Q(ended_at__gte=from_date)),
-                                user__in=users)
-                            .order_by('started_at')
-                            .select_related('user', 'company', 'work_schedule'))
-    # Index employment contracts by user ID
-    employment_contract_data = {}
-    for employment_contract in employment_contracts:
-        (employment_contract_data
-            .setdefault(employment_contract.user.id, [])
-            .append(employment_contract))
-
-    # Fetch all leave dates for this period
-    leave_dates = (models.LeaveDate.objects
-                   .filter(Q(leave__status=models.STATUS_APPROVED) | Q(leave__status=models.STATUS_PENDING),
-                           leave__user__in=users, starts_at__date__gte=from_date, starts_at__date__lte=until_date)
-                   .select_related('leave', 'leave__leave_type', 'leave__user'))
-    # Index leave dates by day, then by user ID
-    leave_date_data = {}
-    for leave_date in leave_dates:
-        (leave_date_data
-            .setdefault(str(leave_date.starts_at.date()), {})
-            .setdefault(leave_date.leave.user.id, [])
-            .append(leave_date))
-
-    # Fetch all holidays for this period
-    holidays = (models.Holiday.objects
-                .filter(date__gte=from_date, date__lte=until_date))
-    # Index holidays by day, then by country
-    holiday_data = {}
-    for holiday in holidays:
-        (holiday_data
-            .setdefault(str(holiday.date), {})
-            .setdefault(holiday.country, [])
-            .append(holiday))
-
-    # Fetch all whereabouts for this period
-    whereabouts = (models.Whereabout.objects
-                   .filter(timesheet__user__in=users, starts_at__date__gte=from_date,
-                           starts_at__date__lte=until_date)
-                   .select_related('timesheet', 'timesheet__user', 'location'))
-    # Index whereabouts by day, then by user ID
-    whereabout_data = {}
-    for whereabout in whereabouts:
-        (whereabout_data
-            .setdefault(str(whereabout.starts_at.date()), {})
-            .setdefault(whereabout.timesheet.user.id, [])
-            .append(whereabout))
+    context = get_calendar_context(users, from_date, until_date, context)
 
     # Count days
     day_count = (until_date - from_date).days + 1
@@ -209,37 +578,26 @@ def get_availability_info(users, from_date, until_date):
             current_date = copy.deepcopy(from_date) + timedelta(days=i)
             user_data[str(current_date)] = user_day_tags = []
 
-            # Get employment contract for this day
-            # This allows us to determine the work schedule and country of the user
-            employment_contract = None
-            try:
-                for ec in employment_contract_data[user.id]:
-                    if (ec.started_at <= current_date) and ((not ec.ended_at) or (ec.ended_at >= current_date)):
-                        employment_contract = ec
-                        break
-            except KeyError:
-                pass
-
-            work_schedule = employment_contract.work_schedule if employment_contract else None
-            country = employment_contract.company.country if employment_contract else None
-
-            # No work occurs when there is no work_schedule, or no hours should be worked that day
-            if (not work_schedule) or (getattr(work_schedule, current_date.strftime('%A').lower(), 0.00) <= 0):
+            # Get the work hours and country of the user for this day
+            # No work occurs when there is no employment contract, or no hours should be worked that day
+            timeline = context.get_employment_timeline(user.id)
+            country = timeline.get_country(current_date)
+            if timeline.get_work_hours(current_date) <= 0:
                 user_day_tags.append('no_work')
 
             # Holidays
             try:
-                if country and holiday_data[str(current_date)][country]:
+                if country and context.holidays[str(current_date)][country]:
                     user_day_tags.append('holiday')
             except KeyError:
                 pass
 
             # Leave & Sickness
             try:
-                for leave_date in leave_date_data[str(current_date)][user.id]:
+                for leave_date in context.leave_dates[str(current_date)][user.id]:
                     leave_status = leave_date.leave.status
 
-                    if leave_date.leave.leave_type.id in sickness_type_ids:
+                    if leave_date.leave.leave_type.id in context.sickness_type_ids:
                         if leave_status == models.STATUS_APPROVED:
                             user_day_tags.append('sickness')
                         else:
@@ -254,7 +612,7 @@ def get_availability_info(users, from_date, until_date):
 
             # Whereabouts
             try:
-                for whereabout in whereabout_data[str(current_date)][user.id]:
+                for whereabout in context.whereabouts[str(current_date)][user.id]:
                     user_day_tags.append('whereabout_%s' % whereabout.location.name.lower().replace(' ', '_'))
             except KeyError:
                 pass
@@ -262,74 +620,26 @@ def get_availability_info(users, from_date, until_date):
     return res
 
 
-def get_range_info(users, from_date, until_date, daily=False, detailed=False, summary=False, serialize=False):
-    """Determine and return range info."""
-    res = {}
+def get_range_info(users, from_date, until_date, daily=False, detailed=False, summary=False, serialize=False,
+                   context=None, included=None):
+    """
+    Determine and return range info.
 
-    # Fetch all employment contracts for this period
-    employment_contracts = (models.EmploymentContract.objects
-                            .filter(
-                                (Q(ended_at__isnull=True) & Q(started_at__lte=until_date)) |
-                                (Q(started_at__lte=until_date) & Q(ended_at__gte=from_date)),
-                                user__in=users)
-                            .order_by('started_at')
-                            .select_related('user', 'company', 'work_schedule'))
-    # Index employment contracts by user ID
-    employment_contract_data = {}
-    for employment_contract in employment_contracts:
-        (employment_contract_data
-            .setdefault(employment_contract.user.id, [])
-            .append(employment_contract))
-
-    # Fetch all leave dates for this period
-    leave_dates = (models.LeaveDate.objects
-                   .filter(leave__user__in=users, leave__status__in=[models.STATUS_PENDING, models.STATUS_APPROVED],
-                           starts_at__date__gte=from_date, starts_at__date__lte=until_date)
-                   .select_related('leave', 'leave__leave_type', 'leave__user')
-                   .prefetch_related('leave__attachments', 'leave__leavedate_set'))
-    # Index leave dates by day, then by user ID
-    leave_date_data = {}
-    for leave_date in leave_dates:
-        (leave_date_data
-            .setdefault(str(leave_date.starts_at.date()), {})
-            .setdefault(leave_date.leave.user.id, [])
-            .append(leave_date))
-
-    # Fetch all holidays for this period
-    holidays = (models.Holiday.objects
-                .filter(date__gte=from_date, date__lte=until_date))
-    # Index holidays by day, then by country
-    holiday_data = {}
-    for holiday in holidays:
-        (holiday_data
-            .setdefault(str(holiday.date), {})
-            .setdefault(holiday.country, [])
-            .append(holiday))
-
-    # Fetch all activity performances for this period
-    activity_performances = (models.ActivityPerformance.objects
-                             .filter(date__gte=from_date, date__lte=until_date, timesheet__user__in=users)
-                             .select_related('performance_type', 'contract_role', 'contract',
-                                             'contract__customer', 'timesheet', 'timesheet__user'))
-    # Index activity performances by day, then by user ID
-    activity_performance_data = {}
-    for performance in activity_performances:
-        (activity_performance_data
-            .setdefault(str(performance.date), {})
-            .setdefault(performance.timesheet.user.id, [])
-            .append(performance))
-
-    # Fetch all standby performances for this period
-    standby_performances = (models.StandbyPerformance.objects
-                             .filter(date__gte=from_date, date__lte=until_date, timesheet__user__in=users)
-                            .select_related('contract', 'contract__customer', 'timesheet', 'timesheet__user'))
-    # Index standby performances by day, then by user ID
-    standby_performance_data = {}
-    for performance in standby_performances:
-        (standby_performance_data
-            .setdefault(str(performance.date), {})
-            .setdefault(performance.timesheet.user.id, [])
-            .append(performance))
+    If `included` is passed along with `detailed` and `serialize`, days reference objects by ID and the objects
+    themselves are added to `included` instead.
+    """
+    # Totals can be summed up using the user day ledger, if it is enabled and has been built for the period
+    if ((not (daily or detailed or summary)) and settings.USER_DAY_LEDGER_ENABLED and
+            is_user_day_ledger_built(users, from_date, until_date)):
+        return get_ledger_range_info(users, from_date, until_date)
+
+    # Without daily or detailed info, performances and leave can be aggregated in the database
+    # If a context was passed, its rows have been fetched already, so they are simply iterated over
+    if (not (daily or detailed)) and (not context):
+        return get_aggregated_range_info(users, from_date, until_date, summary=summary, serialize=serialize)
+
+    res = {}
+    context = get_calendar_context(users, from_date, until_date, context)
 
     # Count days
     day_count = (until_date - from_date).days + 1
@@ -369,41 +679,32 @@ def get_range_info(users, from_date, until_date, daily=False, detailed=False, su
             day_res['activity_performances'] = []
             day_res['standby_performances'] = []
 
-            # Get employment contract for this day
-            # This allows us to determine the work schedule and country of the user
-            employment_contract = None
-            try:
-                for ec in employment_contract_data[user.id]:
-                    if (ec.started_at <= current_date) and ((not ec.ended_at) or (ec.ended_at >= current_date)):
-                        employment_contract = ec
-                        break
-            except KeyError:
-                pass
-
-            work_schedule = employment_contract.work_schedule if employment_contract else None
-            country = employment_contract.company.country if employment_contract else None
+            # Get the work hours and country of the user for this day
+            # Hours are accumulated as integer hundredths of an hour, and only converted to decimals at the end
+            timeline = context.get_employment_timeline(user.id)
+            work_hours = timeline.get_work_centi_hours(current_date)
+            country = timeline.get_country(current_date)
 
             # Work hours
-            if work_schedule:
-                duration = getattr(work_schedule, current_date.strftime('%A').lower(), Decimal('0.00'))
+            if timeline.get_employment_contract(current_date):
+                duration = work_hours
                 user_res['work_hours'] += duration
                 day_res['work_hours'] += duration
 
             # Holidays
             try:
-                if country and holiday_data[str(current_date)][country]:
-                    duration = getattr(work_schedule, current_date.strftime('%A').lower(), Decimal('0.00'))
+                if country and context.holidays[str(current_date)][country]:
+                    duration = work_hours
                     user_res['holiday_hours'] += duration
                     day_res['holiday_hours'] += duration
-                    day_res['holidays'] += holiday_data[str(current_date)][country]
+                    day_res['holidays'] += context.holidays[str(current_date)][country]
             except KeyError:
                 pass
 
             # Leave
             try:
-                for leave_date in leave_date_data[str(current_date)][user.id]:
-                    duration = round((leave_date.ends_at - leave_date.starts_at).total_seconds() / 3600, 2)
-                    duration = Decimal(str(duration))
+                for leave_date in context.leave_dates[str(current_date)][user.id]:
+                    duration = seconds_to_centi((leave_date.ends_at - leave_date.starts_at).total_seconds())
                     if leave_date.leave.status == models.STATUS_APPROVED:
                         user_res['leave_hours'] += duration
                         day_res['leave_hours'] += duration
@@ -416,8 +717,8 @@ def get_range_info(users, from_date, until_date, daily=False, detailed=False, su
 
             # Activity performance
             try:
-                for performance in activity_performance_data[str(current_date)][user.id]:
-                    duration = performance.normalized_duration
+                for performance in context.activity_performances[str(current_date)][user.id]:
+                    duration = performance.normalized_centi_duration
                     user_res['performed_hours'] += duration
                     day_res['performed_hours'] += duration
                     day_res['activity_performances'].append(performance)
@@ -431,7 +732,7 @@ def get_range_info(users, from_date, until_date, daily=False, detailed=False, su
 
             # Standby performance
             try:
-                for performance in standby_performance_data[str(current_date)][user.id]:
+                for performance in context.standby_performances[str(current_date)][user.id]:
                     day_res['standby_performances'].append(performance)
                     user_res['summary']['performances'].setdefault(performance.contract.id, {
                         'contract': performance.contract,
@@ -444,11 +745,17 @@ def get_range_info(users, from_date, until_date, daily=False, detailed=False, su
             day_res['total_hours'] = (day_res['holiday_hours'] + day_res['leave_hours'] + day_res['performed_hours'])
             day_res['overtime_hours'] = abs(min(0, day_res['work_hours'] - day_res['total_hours']))
             day_res['remaining_hours'] = max(0, day_res['work_hours'] - day_res['total_hours'])
+            for key in HOUR_KEYS:
+                day_res[key] = centi_to_hours(day_res[key])
 
         user_res['total_hours'] = user_res['holiday_hours'] + user_res['leave_hours'] + user_res['performed_hours']
         user_res['overtime_hours'] = abs(min(0, user_res['work_hours'] - user_res['total_hours']))
         user_res['remaining_hours'] = max(0, user_res['work_hours'] - user_res['total_hours'])
-        user_res['summary']['performances'] = user_res['summary']['performances'].values()
+        for key in HOUR_KEYS:
+            user_res[key] = centi_to_hours(user_res[key])
+        for performance in user_res['summary']['performances'].values():
+            performance['duration'] = centi_to_hours(performance['duration'])
+        user_res['summary']['performances'] = list(user_res['summary']['performances'].values())
 
         if not summary:
             user_res.pop('summary', None)
@@ -462,7 +769,19 @@ def get_range_info(users, from_date, until_date, daily=False, detailed=False, su
                 day_data.pop('holidays', None)
                 day_data.pop('activity_performances', None)
                 day_data.pop('standby_performances', None)
+        elif serialize and (included is not None):
+            for day, day_data in user_res['details'].items():
+                day_data['holidays'] = included.add('holidays', serializers.HolidaySerializer, day_data['holidays'])
+                day_data['leaves'] = included.add('leaves', serializers.LeaveSerializer, day_data['leaves'])
+                day_data['activity_performances'] = included.add('activity_performances',
+                                                                 serializers.ActivityPerformanceSerializer,
+                                                                 day_data['activity_performances'])
+                day_data['standby_performances'] = included.add('standby_performances',
+                                                                serializers.StandbyPerformanceSerializer,
+                                                                day_data['standby_performances'])
         elif serialize:
+            prefetch_related_objects([leave for day_data in user_res['details'].values()
+                                      for leave in day_data['leaves']], 'attachments', 'leavedate_set')
             for day, day_data in user_res['details'].items():
                 day_data['holidays'] = serializers.HolidaySerializer(day_data['holidays'], many=True).data
                 day_data['leaves'] = serializers.LeaveSerializer(day_data['leaves'], many=True).data
@@ -475,3 +794,617 @@ def get_range_info(users, from_date, until_date, daily=False, detailed=False, su
             user_res.pop('details', None)
 
     return res
+
+
+def get_aggregated_range_info(users, from_date, until_date, summary=False, serialize=False):
+    """
+    Determine and return range info totals, and optionally a summary, using grouped queries.
+
+    Performances are grouped by user, contract, duration and multiplier, so rounding of the normalized duration
+    still happens per performance, in Python, exactly like `ActivityPerformance.normalized_centi_duration` does.
+    Only employment contracts and holidays are fetched as model instances.
+    """
+    res = {}
+    context = CalendarContext(users, from_date, until_date)
+    day_count = (until_date - from_date).days + 1
+
+    for user in context.users:
+        user_res = res[user.id] = {}
+        user_res['work_hours'] = 0
+        user_res['holiday_hours'] = 0
+        user_res['leave_hours'] = 0
+        user_res['pending_leave_hours'] = 0
+        user_res['performed_hours'] = 0
+        user_res['remaining_hours'] = 0
+        user_res['total_hours'] = 0
+        user_res['overtime_hours'] = 0
+        user_res['summary'] = {
+            'performances': {},
+        }
+
+        # Work hours & holidays
+        timeline = context.get_employment_timeline(user.id)
+        for i in range(day_count):
+            current_date = from_date + timedelta(days=i)
+            if not timeline.get_employment_contract(current_date):
+                continue
+
+            work_hours = timeline.get_work_centi_hours(current_date)
+            user_res['work_hours'] += work_hours
+            if context.holidays.get(str(current_date), {}).get(timeline.get_country(current_date), None):
+                user_res['holiday_hours'] += work_hours
+
+    # Leave
+    leave_dates = (models.LeaveDate.objects
+                   .filter(leave__user__in=context.user_ids,
+                           leave__status__in=[models.STATUS_PENDING, models.STATUS_APPROVED],
+                           starts_at__date__gte=from_date, starts_at__date__lte=until_date)
+                   .order_by()
+                   .values_list('leave__user', 'leave__status', 'starts_at', 'ends_at'))
+    for user_id, status, starts_at, ends_at in leave_dates:
+        duration = seconds_to_centi((ends_at - starts_at).total_seconds())
+        key = 'leave_hours' if status == models.STATUS_APPROVED else 'pending_leave_hours'
+        res[user_id][key] += duration
+
+    # Activity performance
+    activity_performances = (models.ActivityPerformance.objects
+                             .filter(date__gte=from_date, date__lte=until_date, timesheet__user__in=context.user_ids)
+                             .order_by()
+                             .values_list('timesheet__user', 'contract', 'duration', 'performance_type__multiplier')
+                             .annotate(count=Count('id')))
+    for user_id, contract_id, duration, multiplier, count in activity_performances:
+        duration = multiply_centi(hours_to_centi(duration), hours_to_centi(multiplier)) * count
+        res[user_id]['performed_hours'] += duration
+        res[user_id]['summary']['performances'].setdefault(contract_id, {
+            'contract': contract_id,
+            'duration': 0,
+            'standby_days': 0,
+        })['duration'] += duration
+
+    # Standby performance, which only contributes to the summary
+    if summary:
+        standby_performances = (models.StandbyPerformance.objects
+                                .filter(date__gte=from_date, date__lte=until_date,
+                                        timesheet__user__in=context.user_ids)
+                                .order_by()
+                                .values_list('timesheet__user', 'contract')
+                                .annotate(count=Count('id')))
+        for user_id, contract_id, count in standby_performances:
+            res[user_id]['summary']['performances'].setdefault(contract_id, {
+                'contract': contract_id,
+                'duration': 0,
+                'standby_days': 0,
+            })['standby_days'] += count
+
+        # Contracts are not fetched as their polymorphic child classes, just like performance contracts aren't
+        contracts = (models.Contract.objects
+                     .non_polymorphic()
+                     .select_related('customer')
+                     .filter(id__in=set([contract_id for user_res in res.values()
+                                         for contract_id in user_res['summary']['performances']])))
+        contracts = {x.id: x for x in contracts}
+
+    for user_res in res.values():
+        user_res['total_hours'] = user_res['holiday_hours'] + user_res['leave_hours'] + user_res['performed_hours']
+        user_res['overtime_hours'] = abs(min(0, user_res['work_hours'] - user_res['total_hours']))
+        user_res['remaining_hours'] = max(0, user_res['work_hours'] - user_res['total_hours'])
+        for key in HOUR_KEYS:
+            user_res[key] = centi_to_hours(user_res[key])
+
+        if not summary:
+            user_res.pop('summary', None)
+            continue
+
+        user_res['summary']['performances'] = [user_res['summary']['performances'][x]
+                                               for x in sorted(user_res['summary']['performances'])]
+        for performance in user_res['summary']['performances']:
+            performance['contract'] = contracts[performance['contract']]
+            performance['duration'] = centi_to_hours(performance['duration'])
+            if serialize:
+                performance['contract'] = serializers.MinimalContractSerializer(performance['contract']).data
+
+    return res
+
+
+def iter_range_info(users, from_date, until_date, chunk_size=None, matrix=False, **kwargs):
+    """
+    Determine range info for chunks of users, yielding (user, range info) pairs.
+
+    Data is only fetched for a single chunk at a time. If `matrix` is set, the matrix engine is used, in which case
+    only `daily` is supported as additional argument.
+
+    """
+    for chunk in chunk_users(users, chunk_size):
+        context = CalendarContext(chunk, from_date, until_date)
+        if matrix:
+            res = get_range_info_matrix(context.users, from_date, until_date, context=context).to_range_info(**kwargs)
+        else:
+            res = get_range_info(context.users, from_date, until_date, context=context, **kwargs)
+
+        for user in chunk:
+            yield user, res[user.id]
+
+
+def get_user_day_ledger_until_date():
+    """Get the last date covered by the user day ledger, which is the end of next year."""
+    return date(date.today().year + 1, 12, 31)
+
+
+def update_user_day_ledger(users, from_date, until_date, parallel=False):
+    """
+    Recalculate and store the user day ledger entries for the given users and period.
+
+    If `parallel` is set, range info is calculated using multiple processes, which is only meant for management
+    commands.
+    """
+    users = list(users)
+    until_date = min(until_date, get_user_day_ledger_until_date())
+    if (not users) or (until_date < from_date):
+        return
+
+    context = CalendarContext(users, from_date, until_date)
+    range_info = calculate_parallel(get_range_info, users, from_date, until_date, workers=(None if parallel else 0),
+                                    context=context, daily=True)
+    keys = ['work_hours', 'holiday_hours', 'leave_hours', 'pending_leave_hours', 'performed_hours']
+
+    # Only days with hours or standby performances are stored, other days are implied to be empty
+    entries = []
+    for user in users:
+        for day, day_data in range_info[user.id]['details'].items():
+            standby_count = len(context.standby_performances.get(day, {}).get(user.id, []))
+
+            if standby_count or any(day_data[key] for key in keys):
+                entry = models.UserDayLedger(user=user, date=parse_date(day), standby_count=standby_count,
+                                             **{key: day_data[key] for key in keys})
+                entry.pre_save_polymorphic()
+                entries.append(entry)
+
+    with transaction.atomic():
+        (models.UserDayLedger.objects
+            .filter(user__in=context.user_ids, date__gte=from_date, date__lte=until_date)
+            .delete())
+        models.UserDayLedger.objects.bulk_create(entries)
+        extend_user_day_ledger_ranges(users, from_date, until_date)
+
+
+def extend_user_day_ledger_ranges(users, from_date, until_date):
+    """
+    Extend the periods for which the user day ledger has been built for the given users with the given period.
+
+    Built periods are kept continuous, so they are only extended if the given period overlaps or borders them.
+    """
+    ledger_ranges = {x.user_id: x for x in models.UserDayLedgerRange.objects.filter(user__in=users)}
+
+    for user in users:
+        ledger_range = ledger_ranges.get(user.id, None)
+        if not ledger_range:
+            models.UserDayLedgerRange.objects.create(user=user, from_date=from_date, until_date=until_date)
+        elif ((from_date <= ledger_range.until_date + timedelta(days=1)) and
+                (until_date >= ledger_range.from_date - timedelta(days=1)) and
+                ((from_date < ledger_range.from_date) or (until_date > ledger_range.until_date))):
+            ledger_range.from_date = min(from_date, ledger_range.from_date)
+            ledger_range.until_date = max(until_date, ledger_range.until_date)
+            ledger_range.save()
+
+
+def invalidate_user_day_ledger(users, from_date):
+    """
+    Invalidate the user day ledger for the given users onwards from the given date.
+
+    Built periods are truncated to end before the date, so the ledger is no longer used from then on. Invalidated
+    periods are rebuilt by the `rebuild_user_day_ledger` command, rather than while saving the change.
+    """
+    ledger_ranges = models.UserDayLedgerRange.objects.filter(user__in=users, until_date__gte=from_date)
+    ledger_ranges.filter(from_date__gte=from_date).delete()
+    ledger_ranges.filter(from_date__lt=from_date).update(until_date=from_date - timedelta(days=1))
+
+
+def is_user_day_ledger_built(users, from_date, until_date):
+    """Determine whether the user day ledger has been built for the given users for the whole given period."""
+    user_ids = {user.id for user in users}
+    return (models.UserDayLedgerRange.objects
+            .filter(user__in=user_ids, from_date__lte=from_date, until_date__gte=until_date)
+            .count()) == len(user_ids)
+
+
+def get_ledger_range_info(users, from_date, until_date):
+    """Determine and return range info totals using the user day ledger."""
+    res = {}
+
+    ledger_data = (models.UserDayLedger.objects
+                   .filter(user__in=[user.id for user in users], date__gte=from_date, date__lte=until_date)
+                   .order_by()
+                   .values('user')
+                   .annotate(work_hours=Sum('work_hours'), holiday_hours=Sum('holiday_hours'),
+                             leave_hours=Sum('leave_hours'), pending_leave_hours=Sum('pending_leave_hours'),
+                             performed_hours=Sum('performed_hours')))
+    ledger_data = {x['user']: x for x in ledger_data}
+
+    for user in users:
+        user_ledger_data = ledger_data.get(user.id, {})
+
+        user_res = res[user.id] = {}
+        user_res['work_hours'] = user_ledger_data.get('work_hours', Decimal('0.00'))
+        user_res['holiday_hours'] = user_ledger_data.get('holiday_hours', Decimal('0.00'))
+        user_res['leave_hours'] = user_ledger_data.get('leave_hours', Decimal('0.00'))
+        user_res['pending_leave_hours'] = user_ledger_data.get('pending_leave_hours', Decimal('0.00'))
+        user_res['performed_hours'] = user_ledger_data.get('performed_hours', Decimal('0.00'))
+        user_res['total_hours'] = user_res['holiday_hours'] + user_res['leave_hours'] + user_res['performed_hours']
+        user_res['overtime_hours'] = abs(min(0, user_res['work_hours'] - user_res['total_hours']))
+        user_res['remaining_hours'] = max(0, user_res['work_hours'] - user_res['total_hours'])
+
+    return res
+
+
+TIMESHEET_RANGE_INFO_KEYS = ['work_hours', 'holiday_hours', 'leave_hours', 'pending_leave_hours', 'performed_hours',
+                             'remaining_hours', 'total_hours', 'overtime_hours']
+
+
+def get_timesheet_range_info(timesheets):
+    """
+    Determine and return range info, including a summary, for the given timesheets, indexed by timesheet ID.
+
+    Range info for closed timesheets can no longer change, so it is stored and reused on subsequent calls.
+
+    """
+    timesheets = list(timesheets)
+    keys = TIMESHEET_RANGE_INFO_KEYS
+    res = {}
+
+    # Load stored range info for closed timesheets, loading the contracts for their summaries in one go
+    stored_data = (models.TimesheetRangeInfo.objects
+                   .filter(timesheet__in=[x.id for x in timesheets if x.status == models.STATUS_CLOSED])
+                   .values_list('timesheet', 'data'))
+    stored_data = {x[0]: json.loads(x[1]) for x in stored_data}
+    contract_ids = set([performance['contract'] for data in stored_data.values()
+                        for performance in data['summary']['performances']])
+    contracts = {x.id: x for x in models.Contract.objects.filter(id__in=contract_ids)} if contract_ids else {}
+
+    for timesheet_id, data in stored_data.items():
+        for key in keys:
+            data[key] = Decimal(data[key])
+        for performance in data['summary']['performances']:
+            performance['contract'] = contracts[performance['contract']]
+            performance['duration'] = Decimal(performance['duration'])
+        res[timesheet_id] = data
+
+    # Calculate range info for all other timesheets one month at a time, storing it for closed ones
+    periods = {}
+    for timesheet in timesheets:
+        if timesheet.id not in res:
+            periods.setdefault((timesheet.year, timesheet.month), []).append(timesheet)
+
+    entries = []
+    for period_timesheets in periods.values():
+        range_info = get_range_info([x.user for x in period_timesheets], *period_timesheets[0].get_date_range(),
+                                    summary=True)
+
+        for timesheet in period_timesheets:
+            data = res[timesheet.id] = range_info[timesheet.user.id]
+            data['summary']['performances'] = list(data['summary']['performances'])
+
+            if timesheet.status == models.STATUS_CLOSED:
+                entry = models.TimesheetRangeInfo(timesheet=timesheet, data=json.dumps({
+                    **{key: str(data[key]) for key in keys},
+                    'summary': {
+                        'performances': [{
+                            'contract': x['contract'].id,
+                            'duration': str(x['duration']),
+                            'standby_days': x['standby_days'],
+                        } for x in data['summary']['performances']],
+                    },
+                }))
+                entry.pre_save_polymorphic()
+                entries.append(entry)
+
+    # Range info for the same timesheets may be stored by another request or report job in the meantime, in which
+    # case entries are stored one at a time, skipping the ones which already exist
+    try:
+        if entries:
+            with transaction.atomic():
+                models.TimesheetRangeInfo.objects.bulk_create(entries)
+    except IntegrityError:
+        for entry in entries:
+            try:
+                with transaction.atomic():
+                    entry.save()
+            except IntegrityError:
+                pass
+
+    return res
+
+
+def get_timesheet_range_info_totals(timesheets):
+    """
+    Determine and return range info totals summed up over the given timesheets.
+
+    Range info is determined without summaries for all users of a month at once, so it is aggregated in the database
+    or summed up using the user day ledger, rather than being determined for every timesheet separately.
+
+    """
+    res = {key: 0 for key in TIMESHEET_RANGE_INFO_KEYS}
+
+    periods = {}
+    for timesheet in timesheets:
+        periods.setdefault(tuple(timesheet.get_date_range()), []).append(timesheet.user)
+
+    for (from_date, until_date), users in periods.items():
+        for user_range_info in get_range_info(users, from_date, until_date).values():
+            for key in TIMESHEET_RANGE_INFO_KEYS:
+                res[key] += user_range_info[key]
+
+    return res
+
+
+def get_timesheet_contract_info(timesheets, contracts=None):
+    """
+    Determine and return performed hours and standby days per timesheet and contract, using grouped queries.
+
+    Timesheets and contracts are passed as querysets and used as subqueries. Only combinations with performances
+    are returned, as a list of dicts containing the timesheet, contract, duration and standby days, ordered by
+    timesheet and contract. If `contracts` is passed, only performances on those contracts are taken into account.
+
+    """
+    timesheet_ids = timesheets.values('id')
+    timesheets = {x.id: x for x in timesheets}
+    res = {}
+
+    # Activity performance, grouped by duration and multiplier so normalized durations are rounded per performance
+    activity_performances = (models.ActivityPerformance.objects
+                             .filter(timesheet__in=timesheet_ids)
+                             .order_by())
+    if contracts is not None:
+        activity_performances = activity_performances.filter(contract__in=contracts.values('id'))
+    activity_performances = (activity_performances
+                             .values_list('timesheet', 'contract', 'duration', 'performance_type__multiplier')
+                             .annotate(count=Count('id')))
+    for timesheet_id, contract_id, duration, multiplier, count in activity_performances:
+        res.setdefault((timesheet_id, contract_id), {
+            'duration': 0,
+            'standby_days': 0,
+        })['duration'] += multiply_centi(hours_to_centi(duration), hours_to_centi(multiplier)) * count
+
+    # Standby performance
+    standby_performances = (models.StandbyPerformance.objects
+                            .filter(timesheet__in=timesheet_ids)
+                            .order_by())
+    if contracts is not None:
+        standby_performances = standby_performances.filter(contract__in=contracts.values('id'))
+    standby_performances = (standby_performances
+                            .values_list('timesheet', 'contract')
+                            .annotate(count=Count('id')))
+    for timesheet_id, contract_id, count in standby_performances:
+        res.setdefault((timesheet_id, contract_id), {
+            'duration': 0,
+            'standby_days': 0,
+        })['standby_days'] += count
+
+    # Only the contracts which were performed on are fetched, without their polymorphic child classes
+    contract_instances = list(models.Contract.objects.non_polymorphic().filter(id__in=set([x[1] for x in res])))
+    prefetch_related_objects(contract_instances, 'customer')
+    contract_instances = {x.id: x for x in contract_instances}
+
+    timesheet_order = {x: i for i, x in enumerate(timesheets)}
+
+    return [{
+        'timesheet': timesheets[timesheet_id],
+        'contract': contract_instances[contract_id],
+        'duration': centi_to_hours(res[(timesheet_id, contract_id)]['duration']),
+        'standby_days': res[(timesheet_id, contract_id)]['standby_days'],
+    } for timesheet_id, contract_id in sorted(res, key=lambda x: (timesheet_order[x[0]], x[1]))]
+
+
+def get_timesheet_contract_type_info(timesheets):
+    """
+    Determine and return performed hours per contract type, along with performed and leave hours, using grouped
+    queries, indexed by timesheet ID.
+
+    Timesheets are passed as a queryset and used as a subquery. Hours per contract type are indexed by the ID of the
+    contract's polymorphic content type, so contracts themselves are never fetched.
+
+    """
+    timesheet_ids = timesheets.values('id')
+    res = {}
+
+    # Activity performance, grouped by duration and multiplier so normalized durations are rounded per performance
+    activity_performances = (models.ActivityPerformance.objects
+                             .filter(timesheet__in=timesheet_ids)
+                             .order_by()
+                             .values_list('timesheet', 'contract__polymorphic_ctype', 'duration',
+                                          'performance_type__multiplier')
+                             .annotate(count=Count('id')))
+    for timesheet_id, contract_type_id, duration, multiplier, count in activity_performances:
+        timesheet_res = res.setdefault(timesheet_id, {'performed_hours': 0, 'leave_hours': 0, 'contract_types': {}})
+        duration = multiply_centi(hours_to_centi(duration), hours_to_centi(multiplier)) * count
+        timesheet_res['performed_hours'] += duration
+        timesheet_res['contract_types'][contract_type_id] = (timesheet_res['contract_types']
+                                                             .get(contract_type_id, 0) + duration)
+
+    # Approved leave
+    leave_dates = (models.LeaveDate.objects
+                   .filter(timesheet__in=timesheet_ids, leave__status=models.STATUS_APPROVED)
+                   .order_by()
+                   .values_list('timesheet', 'starts_at', 'ends_at'))
+    for timesheet_id, starts_at, ends_at in leave_dates:
+        timesheet_res = res.setdefault(timesheet_id, {'performed_hours': 0, 'leave_hours': 0, 'contract_types': {}})
+        timesheet_res['leave_hours'] += seconds_to_centi((ends_at - starts_at).total_seconds())
+
+    for timesheet_res in res.values():
+        timesheet_res['performed_hours'] = centi_to_hours(timesheet_res['performed_hours'])
+        timesheet_res['leave_hours'] = centi_to_hours(timesheet_res['leave_hours'])
+        timesheet_res['contract_types'] = {x: centi_to_hours(y) for x, y in timesheet_res['contract_types'].items()}
+
+    return res
+
+
+def _round_centi(values):
+    """Round amounts of ten-thousandths of an hour to hundredths, rounding half to even like Decimal does."""
+    quotients, remainders = np.divmod(values, 100)
+    return quotients + ((remainders > 50) | ((remainders == 50) & (quotients % 2 == 1)))
+
+
+def get_buckets(from_date, until_date, granularity):
+    """
+    Split the given range into consecutive buckets of the given granularity, returning (from, until) date pairs.
+
+    Supported granularities are `day`, `week` (starting on monday), `month` and `year`. The first and last bucket are
+    clipped to the given range.
+    """
+    if granularity not in BUCKET_GRANULARITIES:
+        raise ValueError('Unsupported bucket granularity: %s' % granularity)
+
+    res = []
+    current_date = from_date
+    while current_date <= until_date:
+        if granularity == 'day':
+            next_date = current_date + timedelta(days=1)
+        elif granularity == 'week':
+            next_date = current_date + timedelta(days=7 - current_date.weekday())
+        elif granularity == 'month':
+            next_date = (current_date.replace(day=28) + timedelta(days=4)).replace(day=1)
+        else:
+            next_date = date(current_date.year + 1, 1, 1)
+
+        res.append((current_date, min(next_date - timedelta(days=1), until_date)))
+        current_date = next_date
+
+    return res
+
+
+class RangeInfoMatrix:
+    """Range info for a set of users, stored as dense (user, day) matrices of hundredths of an hour."""
+
+    keys = ['work_hours', 'holiday_hours', 'leave_hours', 'pending_leave_hours', 'performed_hours']
+
+    def __init__(self, user_ids, from_date, until_date, hours):
+        """Constructor."""
+        self.user_ids = user_ids
+        self.from_date = from_date
+        self.until_date = until_date
+        self.hours = hours
+
+        self.hours['total_hours'] = hours['holiday_hours'] + hours['leave_hours'] + hours['performed_hours']
+        self.hours['remaining_hours'] = np.maximum(hours['work_hours'] - hours['total_hours'], 0)
+        self.hours['overtime_hours'] = np.maximum(hours['total_hours'] - hours['work_hours'], 0)
+
+    def to_range_info(self, daily=False):
+        """Materialize the matrices into the structure returned by `get_range_info`."""
+        res = {}
+
+        # Totals for a user are determined from the summed hours, not from the daily remaining/overtime hours
+        sums = {key: self.hours[key].sum(axis=1) for key in self.keys}
+        sums['total_hours'] = sums['holiday_hours'] + sums['leave_hours'] + sums['performed_hours']
+        sums['remaining_hours'] = np.maximum(sums['work_hours'] - sums['total_hours'], 0)
+        sums['overtime_hours'] = np.maximum(sums['total_hours'] - sums['work_hours'], 0)
+        sums = {key: value.tolist() for key, value in sums.items()}
+
+        days = [str(self.from_date + timedelta(days=i)) for i in range((self.until_date - self.from_date).days + 1)]
+        hours = {key: value.tolist() for key, value in self.hours.items()} if daily else {}
+
+        for i, user_id in enumerate(self.user_ids):
+            user_res = res[user_id] = {key: centi_to_hours(value[i]) for key, value in sums.items()}
+
+            if daily:
+                user_res['details'] = {}
+                for j, day in enumerate(days):
+                    user_res['details'][day] = {key: centi_to_hours(value[i][j]) for key, value in hours.items()}
+
+        return res
+
+    def to_bucketed_range_info(self, granularity):
+        """
+        Sum up the matrices per bucket of the given granularity, returning a list of bucket totals per user.
+
+        Remaining and overtime hours for a bucket are determined from its summed hours, like they are for a range.
+        """
+        buckets = get_buckets(self.from_date, self.until_date, granularity)
+        starts = np.array([(x[0] - self.from_date).days for x in buckets], dtype=np.int64)
+        res = {}
+
+        sums = {key: np.add.reduceat(self.hours[key], starts, axis=1) for key in self.keys}
+        sums['total_hours'] = sums['holiday_hours'] + sums['leave_hours'] + sums['performed_hours']
+        sums['remaining_hours'] = np.maximum(sums['work_hours'] - sums['total_hours'], 0)
+        sums['overtime_hours'] = np.maximum(sums['total_hours'] - sums['work_hours'], 0)
+        sums = {key: value.tolist() for key, value in sums.items()}
+
+        for i, user_id in enumerate(self.user_ids):
+            res[user_id] = [dict({key: centi_to_hours(value[i][j]) for key, value in sums.items()},
+                                 from_date=bucket[0], until_date=bucket[1]) for j, bucket in enumerate(buckets)]
+
+        return res
+
+
+def get_range_info_matrix(users, from_date, until_date, context=None):
+    """
+    Determine and return range info as a `RangeInfoMatrix`.
+
+    Instead of iterating over every user and every day, hours are accumulated into NumPy arrays indexed by
+    (user, day ordinal). Only totals and daily hours are supported; use `get_range_info` for summaries and details.
+    """
+    context = get_calendar_context(users, from_date, until_date, context)
+    user_ids = [user.id for user in users]
+    user_index = {user_id: i for i, user_id in enumerate(user_ids)}
+    day_count = (until_date - from_date).days + 1
+    shape = (len(user_ids), day_count)
+    hours = {key: np.zeros(shape, dtype=np.int64) for key in RangeInfoMatrix.keys}
+
+    # Day of the week for every day ordinal, with monday being 0
+    weekdays = (from_date.weekday() + np.arange(day_count)) % 7
+
+    # Fill in work hours and countries using employment contracts, index countries by position
+    # Contracts are applied in reverse so the earliest matching contract for a day wins
+    # Only values are used, so the matrix doesn't require model instances to be fetched
+    countries = {}
+    country_matrix = np.full(shape, -1, dtype=np.int64)
+    for user_id, started_at, ended_at, country, *schedule in reversed(context.employment_contract_values):
+        start = max((started_at - from_date).days, 0)
+        end = min((ended_at - from_date).days, day_count - 1) if ended_at else day_count - 1
+        if (user_id not in user_index) or (start > end):
+            continue
+
+        schedule = np.array([hours_to_centi(x) for x in schedule], dtype=np.int64)
+        hours['work_hours'][user_index[user_id], start:end + 1] = schedule[weekdays[start:end + 1]]
+        country_matrix[user_index[user_id], start:end + 1] = countries.setdefault(country, len(countries))
+
+    # Mark holidays by country position, then by day
+    # The last row remains empty and is used for days without employment contract
+    holiday_mask = np.zeros((len(countries) + 1, day_count), dtype=bool)
+    for holiday_date, country in context.holiday_values:
+        day_ordinal = (holiday_date - from_date).days
+        if (country in countries) and (0 <= day_ordinal < day_count):
+            holiday_mask[countries[country], day_ordinal] = True
+    holiday_days = holiday_mask[country_matrix, np.arange(day_count)]
+    hours['holiday_hours'] = np.where(holiday_days, hours['work_hours'], 0)
+
+    # Accumulate leave hours
+    leave_rows = {models.STATUS_APPROVED: [], models.STATUS_PENDING: []}
+    for user_id, status, starts_at, ends_at in context.leave_date_values:
+        day_ordinal = (starts_at.date() - from_date).days
+        if (user_id in user_index) and (0 <= day_ordinal < day_count):
+            leave_rows[status].append([user_index[user_id], day_ordinal,
+                                       seconds_to_centi((ends_at - starts_at).total_seconds())])
+    for key, status in [['leave_hours', models.STATUS_APPROVED], ['pending_leave_hours', models.STATUS_PENDING]]:
+        if leave_rows[status]:
+            rows = np.array(leave_rows[status], dtype=np.int64)
+            np.add.at(hours[key], (rows[:, 0], rows[:, 1]), rows[:, 2])
+
+    # Accumulate performed hours
+    performance_rows = [[user_index[user_id], (date - from_date).days, hours_to_centi(duration),
+                         hours_to_centi(multiplier)]
+                        for user_id, date, duration, multiplier in context.activity_performance_values
+                        if (user_id in user_index) and (0 <= (date - from_date).days < day_count)]
+    if performance_rows:
+        rows = np.array(performance_rows, dtype=np.int64)
+        np.add.at(hours['performed_hours'], (rows[:, 0], rows[:, 1]), _round_centi(rows[:, 2] * rows[:, 3]))
+
+    return RangeInfoMatrix(user_ids, from_date, until_date, hours)
+
+
+def get_bucketed_range_info(users, from_date, until_date, granularity='month', context=None):
+    """
+    Determine and return range info totals per bucket of the given granularity, indexed by user ID.
+
+    Data for the whole range is fetched once, after which hours are summed up per bucket. Every bucket is a dict
+    containing its `from_date`, `until_date` and the same totals `get_range_info` returns.
+    """
+    return get_range_info_matrix(users, from_date, until_date, context=context).to_bucketed_range_info(granularity)
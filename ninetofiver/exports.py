@@ -0,0 +1,151 @@
+"""Exports."""
+import csv
+import datetime
+import tempfile
+from decimal import Decimal
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from django.utils.encoding import force_text
+from django_tables2.rows import BoundRow
+from django_tables2.export.export import TableExport
+from openpyxl import Workbook
+
+
+# Amount of bytes to read at once when streaming files
+CHUNK_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    TableExport.CSV: 'text/csv; charset=utf-8',
+    TableExport.XLSX: 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+class Echo:
+    """File-like object which returns whatever is written to it, so CSV rows can be yielded as they are written."""
+
+    def write(self, value):
+        """Return the written value."""
+        return value
+
+
+def stream_csv(rows):
+    """Yield the given rows as lines of CSV."""
+    writer = csv.writer(Echo())
+
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def get_xlsx_value(value):
+    """
+    Get the given value as a value which can be written to an XLSX cell.
+
+    Numbers, dates and times are kept, so they can be used in formulas, empty values are left out and anything else
+    is converted to text, the way `tablib` does when building XLSX files.
+
+    """
+    if (value is None) or (value == ''):
+        return None
+    if isinstance(value, (int, float, Decimal, datetime.date, datetime.time)):
+        return value
+
+    return str(value)
+
+
+def stream_xlsx(rows):
+    """
+    Yield the given rows as chunks of an XLSX workbook.
+
+    The rows are written to a write-only workbook, which doesn't keep them in memory, saved to a temporary file and
+    then read back in chunks.
+
+    """
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet()
+
+    for row in rows:
+        worksheet.append([get_xlsx_value(x) for x in row])
+
+    with tempfile.TemporaryFile() as f:
+        workbook.save(f)
+        f.seek(0)
+
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            yield chunk
+
+
+STREAMS = {
+    TableExport.CSV: stream_csv,
+    TableExport.XLSX: stream_xlsx,
+}
+
+
+def is_streaming_format(export_format):
+    """Determine whether the given export format can be streamed."""
+    return export_format in STREAMS
+
+
+def get_streaming_response(export_format, rows, filename=None):
+    """Get a response streaming the given rows, of which the first one contains the headers, in the given format."""
+    response = StreamingHttpResponse(STREAMS[export_format](rows), content_type=CONTENT_TYPES[export_format])
+    if filename is not None:
+        response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+
+    return response
+
+
+def get_table_values(table):
+    """
+    Yield the headers and then the rows of the given table, the way `Table.as_values` does.
+
+    Rows are iterated over regardless of pagination, and querysets are iterated over without filling their result
+    cache, so records are not kept in memory once their row has been yielded.
+
+    """
+    columns = [x for x in table.columns if not x.column.exclude_from_export]
+    yield [force_text(x.header, strings_only=True) for x in columns]
+
+    records = table.data
+    if isinstance(records.data, QuerySet):
+        records = records.data.iterator()
+
+    for record in records:
+        row = BoundRow(record, table=table)
+        yield [force_text(row.get_cell_value(x.name), strings_only=True) for x in columns]
+
+
+def get_resource_values(resource, queryset=None):
+    """
+    Yield the headers and then the rows of the given import-export resource for the given queryset.
+
+    This follows `Resource.export`, but rows are yielded instead of being collected into a dataset. Since there is no
+    dataset, `Resource.after_export` is not called.
+
+    """
+    resource.before_export(queryset)
+
+    if queryset is None:
+        queryset = resource.get_queryset()
+
+    yield resource.get_export_headers()
+
+    for obj in (queryset.iterator() if isinstance(queryset, QuerySet) else queryset):
+        yield resource.export_resource(obj)
+
+
+def export_table(export_format, table, filename=None):
+    """
+    Export the given table to the given format, streaming the export if possible.
+
+    The table is kept on the response, so its values can be used without generating and parsing the export, which is
+    how report jobs store their results.
+
+    """
+    if is_streaming_format(export_format):
+        response = get_streaming_response(export_format, get_table_values(table), filename)
+    else:
+        response = TableExport(export_format, table).response(filename)
+
+    response.table = table
+
+    return response
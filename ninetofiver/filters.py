@@ -130,7 +130,8 @@ class AdminReportResourceAvailabilityOverviewFilter(FilterSet):
                                                       queryset=auth_models.Group.objects.all(),
                                                       distinct=True))
     contract = (django_filters.ModelMultipleChoiceFilter(label='Contract',
-                                                         queryset=models.Contract.objects.filter(active=True),
+                                                         queryset=(models.Contract.objects.filter(active=True)
+                                                                   .select_related('customer')),
                                                          distinct=True))
     from_date = django_filters.DateFilter(label='From', widget=admin_widgets.AdminDateWidget(), field_name='starts_at',
                                           lookup_expr='date__gte')
@@ -160,7 +161,8 @@ class AdminReportProjectContractOverviewFilter(FilterSet):
     """Project contract overview admin report filter."""
     contract = (django_filters.ModelMultipleChoiceFilter(label='Contract',
                                                          field_name='contract_ptr', lookup_expr='in',
-                                                         queryset=models.ProjectContract.objects.filter(active=True),
+                                                         queryset=(models.ProjectContract.objects.filter(active=True)
+                                                                   .select_related('customer')),
                                                          distinct=True))
     customer = (django_filters.ModelMultipleChoiceFilter(queryset=models.Company.objects.filter(),
                                                          distinct=True))
@@ -0,0 +1,235 @@
+"""Benchmark calculations and reports."""
+import datetime
+import gc
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from decimal import Decimal
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse, resolve
+from django.utils.timezone import utc
+from dateutil.relativedelta import relativedelta
+from ninetofiver import calculation, factories, models
+from ninetofiver.utils import dates_in_range
+
+
+class Command(BaseCommand):
+    """Generate datasets of several sizes into throwaway databases, then benchmark calculations and reports."""
+
+    args = ''
+    help = 'Benchmark calculations and reports using generated data'
+
+    def add_arguments(self, parser):
+        """Add arguments."""
+        parser.add_argument('--users', type=int, nargs='+', default=[5, 20],
+                            help='Amounts of users to generate a dataset for')
+        parser.add_argument('--months', type=int, default=3, help='Amount of months to generate data for')
+        parser.add_argument('--contracts', type=int, default=5, help='Amount of contracts to generate')
+        parser.add_argument('--performances', type=int, default=2,
+                            help='Amount of activity performances per user per working day')
+        parser.add_argument('--leave-density', type=float, default=0.05,
+                            help='Fraction of working days on which users take leave')
+        parser.add_argument('--whereabout-density', type=float, default=0.3,
+                            help='Fraction of working days on which users have a whereabout')
+        parser.add_argument('--from', dest='from_date', default='2018-01-01', help='Date to generate data from')
+        parser.add_argument('--seed', type=int, default=925, help='Random seed')
+        parser.add_argument('--json', dest='json_path', default=None,
+                            help='File to write results to as JSON, or - for standard output')
+
+    def handle(self, *args, **options):
+        """Generate datasets of several sizes into throwaway databases, then benchmark calculations and reports."""
+        from_date = datetime.datetime.strptime(options['from_date'], '%Y-%m-%d').date()
+        until_date = from_date + relativedelta(months=options['months']) - relativedelta(days=1)
+        results = []
+
+        for user_count in options['users']:
+            random.seed(options['seed'])
+            database_path = tempfile.mkstemp(suffix='.sqlite3')[1]
+            database = self.use_database({'ENGINE': 'django.db.backends.sqlite3', 'NAME': database_path})
+
+            try:
+                call_command('migrate', verbosity=0, interactive=False)
+                with transaction.atomic():
+                    data = self.generate_data(user_count, from_date, until_date, options)
+
+                for name, fn in self.get_benchmarks(data, from_date, until_date):
+                    result = self.measure(fn)
+                    result.update({'name': name, 'users': user_count, 'months': options['months']})
+                    results.append(result)
+
+                    if options['json_path'] != '-':
+                        self.stdout.write('%(users)s users\t%(name)s\t%(time).3fs\t%(queries)s queries\t'
+                                          '%(peak_memory)s bytes' % result)
+            finally:
+                self.use_database(database)
+                os.remove(database_path)
+
+        if options['json_path']:
+            output = json.dumps({
+                'parameters': {x: options[x] for x in ['users', 'months', 'contracts', 'performances',
+                                                       'leave_density', 'whereabout_density', 'from_date', 'seed']},
+                'results': results,
+            }, indent=2)
+
+            if options['json_path'] == '-':
+                self.stdout.write(output)
+            else:
+                with open(options['json_path'], 'w') as f:
+                    f.write(output)
+
+    def use_database(self, database):
+        """Point the default database connection to the given database, returning the previous one."""
+        connection.close()
+        previous = connections.databases['default']
+        connections.databases['default'] = database
+        if hasattr(connections._connections, 'default'):
+            delattr(connections._connections, 'default')
+        return previous
+
+    def measure(self, fn):
+        """
+        Measure wall time, query count and peak memory of the given function.
+
+        The cache is cleared before every run, so cached reports are never measured instead of rendered ones.
+        """
+        cache.clear()
+        gc.collect()
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            fn()
+        duration = time.perf_counter() - start
+
+        # Memory is measured separately, since tracing allocations slows everything down
+        cache.clear()
+        gc.collect()
+        tracemalloc.start()
+        fn()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        return {'time': duration, 'queries': len(queries), 'peak_memory': peak_memory}
+
+    def generate_data(self, user_count, from_date, until_date, options):
+        """Generate a dataset using factories."""
+        company = factories.InternalCompanyFactory.create(country='BE')
+        work_schedule = factories.WorkScheduleFactory.create(monday=8, tuesday=8, wednesday=8, thursday=8, friday=8,
+                                                             saturday=0, sunday=0)
+        employment_contract_type = factories.EmploymentContractTypeFactory.create()
+        leave_type = factories.LeaveTypeFactory.create()
+        location = factories.LocationFactory.create()
+        performance_type = factories.PerformanceTypeFactory.create(multiplier=Decimal('1.00'))
+        contract_role = factories.ContractRoleFactory.create()
+
+        contract_factories = [factories.ProjectContractFactory, factories.ConsultancyContractFactory,
+                              factories.SupportContractFactory]
+        contracts = [contract_factories[i % len(contract_factories)].create(company=company, active=True)
+                     for i in range(options['contracts'])]
+
+        for current_date in dates_in_range(from_date, until_date):
+            if current_date.day == 1:
+                factories.HolidayFactory.create(date=current_date, country='BE')
+
+        users = []
+        for i in range(user_count):
+            user = factories.UserFactory.create()
+            users.append(user)
+            factories.EmploymentContractFactory.create(user=user, company=company, work_schedule=work_schedule,
+                                                       employment_contract_type=employment_contract_type,
+                                                       started_at=from_date, ended_at=None)
+            for contract in contracts:
+                factories.ContractUserFactory.create(user=user, contract=contract, contract_role=contract_role)
+
+            timesheets = {}
+            leave = factories.LeaveFactory.create(user=user, leave_type=leave_type, status=models.STATUS_APPROVED)
+
+            for current_date in dates_in_range(from_date, until_date):
+                timesheet = timesheets.get((current_date.year, current_date.month), None)
+                if not timesheet:
+                    timesheet = timesheets[(current_date.year, current_date.month)] = (
+                        factories.OpenTimesheetFactory.create(user=user, year=current_date.year,
+                                                              month=current_date.month))
+
+                if current_date.weekday() >= 5:
+                    continue
+
+                starts_at = datetime.datetime.combine(current_date, datetime.time(9)).replace(tzinfo=utc)
+                ends_at = datetime.datetime.combine(current_date, datetime.time(17)).replace(tzinfo=utc)
+
+                if random.random() < options['whereabout_density']:
+                    factories.WhereaboutFactory.create(timesheet=timesheet, location=location, starts_at=starts_at,
+                                                       ends_at=ends_at)
+
+                if random.random() < options['leave_density']:
+                    factories.LeaveDateFactory.create(leave=leave, timesheet=timesheet, starts_at=starts_at,
+                                                      ends_at=ends_at)
+                    continue
+
+                for j in range(options['performances']):
+                    factories.ActivityPerformanceFactory.create(
+                        timesheet=timesheet, date=current_date, contract=random.choice(contracts),
+                        contract_role=contract_role, performance_type=performance_type,
+                        duration=Decimal(random.choice(['1.00', '2.50', '3.75', '4.00'])))
+
+        return {
+            'users': users,
+            'admin': factories.AdminFactory.create(),
+        }
+
+    def get_benchmarks(self, data, from_date, until_date):
+        """Get the calculations and reports to benchmark, as (name, function) pairs."""
+        users = data['users']
+        benchmarks = [
+            ('get_range_info', lambda: calculation.get_range_info(users, from_date, until_date)),
+            ('get_range_info (summary)', lambda: calculation.get_range_info(users, from_date, until_date,
+                                                                            summary=True)),
+            ('get_range_info (daily)', lambda: calculation.get_range_info(users, from_date, until_date, daily=True)),
+            ('get_range_info (detailed, serialized)', lambda: calculation.get_range_info(
+                users, from_date, until_date, daily=True, detailed=True, serialize=True)),
+            ('get_range_info_matrix (daily)', lambda: calculation.get_range_info_matrix(
+                users, from_date, until_date).to_range_info(daily=True)),
+            ('get_availability (serialized)', lambda: calculation.get_availability(users, from_date, until_date,
+                                                                                   serialize=True)),
+            ('get_availability_info', lambda: calculation.get_availability_info(users, from_date, until_date)),
+        ]
+
+        period = {'from_date': str(from_date), 'until_date': str(until_date)}
+        user_period = dict(period, user=users[0].id)
+        reports = [
+            ('admin_report_timesheet_overview', {'year': from_date.year}),
+            ('admin_report_timesheet_contract_overview', {'year': from_date.year}),
+            ('admin_report_user_range_info', user_period),
+            ('admin_report_user_leave_overview', user_period),
+            ('admin_report_user_work_ratio_overview', {'user': users[0].id, 'year': from_date.year}),
+            ('admin_report_user_overtime_overview', user_period),
+            ('admin_report_resource_availability_overview', period),
+            ('admin_report_expiring_consultancy_contract_overview', {}),
+            ('admin_report_expiring_support_contract_overview', {}),
+            ('admin_report_project_contract_overview', {}),
+            ('admin_report_project_contract_budget_overview', {}),
+        ]
+        for name, params in reports:
+            benchmarks.append((name, self.get_report_benchmark(name, params, data['admin'])))
+
+        return benchmarks
+
+    def get_report_benchmark(self, name, params, user):
+        """Get a function rendering the given report."""
+        path = reverse(name)
+        view = resolve(path).func
+
+        def benchmark():
+            request = RequestFactory().get(path, params)
+            request.user = user
+            response = view(request)
+            if response.status_code != 200:
+                raise CommandError('%s returned status code %s' % (name, response.status_code))
+
+        return benchmark
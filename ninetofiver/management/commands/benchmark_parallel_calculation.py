@@ -0,0 +1,51 @@
+"""Benchmark parallel calculations."""
+import time
+from django.core.management.base import BaseCommand
+from django.contrib.auth import models as auth_models
+from django.utils.dateparse import parse_date
+from ninetofiver import calculation
+
+
+class Command(BaseCommand):
+    """Compare serial and parallel range info calculation for increasing amounts of users."""
+
+    args = ''
+    help = 'Compare serial and parallel range info calculation for increasing amounts of users'
+
+    def add_arguments(self, parser):
+        """Add arguments."""
+        parser.add_argument('from_date', help='Date to calculate from')
+        parser.add_argument('until_date', help='Date to calculate until')
+        parser.add_argument('--workers', type=int, default=4, help='Amount of processes to use')
+        parser.add_argument('--users', type=int, nargs='+', default=[10, 25, 50, 100, 250, 500],
+                            help='Amounts of users to calculate for')
+
+    def handle(self, *args, **options):
+        """Compare serial and parallel range info calculation for increasing amounts of users."""
+        from_date = parse_date(options['from_date'])
+        until_date = parse_date(options['until_date'])
+        day_count = (until_date - from_date).days + 1
+        crossover = None
+
+        self.stdout.write('users\tuser days\tserial (s)\tparallel (s)')
+
+        for user_count in options['users']:
+            users = list(auth_models.User.objects.order_by('id')[:user_count])
+            timings = []
+
+            # Fetching data is included, since the parallel calculation needs to prefetch everything up front
+            for workers in [0, options['workers']]:
+                start = time.perf_counter()
+                calculation.calculate_parallel(calculation.get_range_info, users, from_date, until_date,
+                                               workers=workers, threshold=0, daily=True)
+                timings.append(time.perf_counter() - start)
+
+            self.stdout.write('%s\t%s\t%.3f\t%.3f' % (len(users), len(users) * day_count, *timings))
+            if (crossover is None) and (timings[1] < timings[0]):
+                crossover = len(users) * day_count
+
+        if crossover is None:
+            self.stdout.write('Parallel calculation was not faster for any amount of users')
+        else:
+            self.stdout.write('Parallel calculation was faster from %s user days onwards, consider setting '
+                              'CALCULATION_PARALLEL_THRESHOLD accordingly' % crossover)
@@ -0,0 +1,56 @@
+"""Rebuild the user day ledger."""
+import datetime
+from django.core.management.base import BaseCommand
+from django.contrib.auth import models as auth_models
+from django.utils.dateparse import parse_date
+from ninetofiver import calculation, models
+
+
+class Command(BaseCommand):
+    """Rebuild the user day ledger for all users, one year and chunk of users at a time."""
+
+    args = ''
+    help = 'Rebuild the user day ledger for all users'
+
+    def add_arguments(self, parser):
+        """Add arguments."""
+        parser.add_argument('--user', type=int, action='append', dest='users', help='ID of a user to rebuild for')
+        parser.add_argument('--from', dest='from_date', default='2000-01-01', help='Date to rebuild from')
+        parser.add_argument('--invalidated', action='store_true',
+                            help='Only rebuild periods which have not been built or have been invalidated since')
+
+    def handle(self, *args, **options):
+        """Rebuild the user day ledger for all users, one year and chunk of users at a time."""
+        from_date = parse_date(options['from_date'])
+        until_date = calculation.get_user_day_ledger_until_date()
+        users = auth_models.User.objects.all()
+        if options['users']:
+            users = users.filter(id__in=options['users'])
+
+        # Users rebuilt from the same date are rebuilt together in chunks, so calculations can run in parallel
+        user_from_dates = {}
+
+        for user in users:
+            user_from_date = from_date
+
+            # Only the part following the built period is rebuilt, if the built period covers the start
+            if options['invalidated']:
+                ledger_range = models.UserDayLedgerRange.objects.filter(user=user).first()
+                if ledger_range and (ledger_range.from_date <= from_date):
+                    if ledger_range.until_date >= until_date:
+                        continue
+                    user_from_date = ledger_range.until_date + datetime.timedelta(days=1)
+
+            # The built period is only kept if it continues into the rebuilt period, which replaces it otherwise
+            (models.UserDayLedgerRange.objects
+                .filter(user=user)
+                .exclude(from_date__lt=user_from_date, until_date__gte=user_from_date - datetime.timedelta(days=1))
+                .delete())
+
+            user_from_dates.setdefault(user_from_date, []).append(user)
+
+        for user_from_date, date_users in sorted(user_from_dates.items()):
+            for chunk in calculation.chunk_users(date_users):
+                for year in range(user_from_date.year, until_date.year + 1):
+                    calculation.update_user_day_ledger(chunk, max(user_from_date, datetime.date(year, 1, 1)),
+                                                       datetime.date(year, 12, 31), parallel=True)
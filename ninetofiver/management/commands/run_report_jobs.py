@@ -0,0 +1,36 @@
+"""Run pending report jobs."""
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from ninetofiver import reports
+
+
+class Command(BaseCommand):
+    """Run pending report jobs in the background, one at a time, polling for new ones."""
+
+    args = ''
+    help = 'Run pending report jobs'
+
+    def add_arguments(self, parser):
+        """Add arguments."""
+        parser.add_argument('--once', action='store_true', help='Exit once there are no pending report jobs left')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Amount of seconds to wait before polling for new report jobs')
+
+    def handle(self, *args, **options):
+        """Run pending report jobs in the background, one at a time, polling for new ones."""
+        while True:
+            # Connections are not closed automatically outside of requests, so stale ones are closed manually
+            close_old_connections()
+            job = reports.claim_report_job()
+
+            if job:
+                self.stdout.write('Running report job %s (%s)' % (job.id, job.report))
+                reports.run_report_job(job)
+                self.stdout.write('Report job %s %s' % (job.id, job.status))
+                continue
+
+            if options['once']:
+                break
+
+            time.sleep(options['interval'])
@@ -10,7 +10,7 @@ import requests
 from dateutil.relativedelta import relativedelta
 from ninetofiver import models, settings
 from ninetofiver.utils import send_mail
-from ninetofiver.calculation import get_range_info
+from ninetofiver.calculation import iter_range_info
 
 
 log = logging.getLogger(__name__)
@@ -28,13 +28,13 @@ class Command(BaseCommand):
         users = (auth_models.User.objects
                  .filter(is_active=True))
          
-        # Get range info for all users for yesterday
+        # Get range info for all users for yesterday, processing one chunk of users at a time as it is fetched
         yesterday = datetime.date.today() - datetime.timedelta(days=1)
-        range_info = get_range_info(users, yesterday, yesterday)
-
-        for user in users:
-            user_range_info = range_info[user.id]
+        self.send_reminders(iter_range_info(users.iterator(), yesterday, yesterday, matrix=True))
 
+    def send_reminders(self, range_info):
+        """Send reminders based on the given (user, range info) pairs."""
+        for user, user_range_info in range_info:
             if (not user_range_info['work_hours']) or (user_range_info['remaining_hours'] != user_range_info['work_hours']):
                 log.info('User %s skipped because they were not required to log performance yesterday' % user)
                 continue
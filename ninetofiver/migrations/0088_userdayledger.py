@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2019-03-04 10:12
+from __future__ import unicode_literals
+
+from django.conf import settings
+import dirtyfields.dirtyfields
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.manager
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('ninetofiver', '0087_auto_20181025_1234'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDayLedger',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('date', models.DateField()),
+                ('work_hours', models.DecimalField(decimal_places=2, default=0.0, max_digits=6)),
+                ('holiday_hours', models.DecimalField(decimal_places=2, default=0.0, max_digits=6)),
+                ('leave_hours', models.DecimalField(decimal_places=2, default=0.0, max_digits=6)),
+                ('pending_leave_hours', models.DecimalField(decimal_places=2, default=0.0, max_digits=6)),
+                ('performed_hours', models.DecimalField(decimal_places=2, default=0.0, max_digits=6)),
+                ('standby_count', models.PositiveIntegerField(default=0)),
+                ('polymorphic_ctype', models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='polymorphic_ninetofiver.userdayledger_set+', to='contenttypes.ContentType')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+                'abstract': False,
+                'base_manager_name': 'base_objects',
+            },
+            bases=(dirtyfields.dirtyfields.DirtyFieldsMixin, models.Model),
+            managers=[
+                ('objects', django.db.models.manager.Manager()),
+                ('base_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='userdayledger',
+            unique_together=set([('user', 'date')]),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2019-03-11 09:12
+from __future__ import unicode_literals
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ninetofiver', '0089_timesheetrangeinfo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contractrole',
+            name='hourly_cost',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=6, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(9999)]),
+        ),
+    ]
@@ -3,9 +3,12 @@ import humanize
 import uuid
 import logging
 import datetime
+import json
+import zlib
 from decimal import Decimal
 from django.contrib.auth import models as auth_models
 from django.core import validators
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.urls import reverse
@@ -18,7 +21,7 @@ from dirtyfields import DirtyFieldsMixin
 from dateutil.relativedelta import relativedelta
 from phonenumber_field.modelfields import PhoneNumberField
 from adminsortable.models import SortableMixin
-from ninetofiver.utils import days_in_month
+from ninetofiver.utils import days_in_month, hours_to_centi, multiply_centi
 
 
 log = logging.getLogger(__name__)
@@ -51,6 +54,9 @@ STATUS_PENDING = 'pending'
 STATUS_CLOSED = 'closed'
 STATUS_APPROVED = 'approved'
 STATUS_REJECTED = 'rejected'
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
 
 # Periods
 PERIOD_DAILY = 'daily'
@@ -809,6 +815,15 @@ class ContractRole(BaseModel):
 
     name = models.CharField(unique=True, max_length=255)
     description = models.TextField(max_length=255, blank=True, null=True)
+    hourly_cost = models.DecimalField(
+        max_digits=6,
+        decimal_places=2,
+        default=0.00,
+        validators=[
+            validators.MinValueValidator(0),
+            validators.MaxValueValidator(9999),
+        ]
+    )
 
     def __str__(self):
         """Return a string representation."""
@@ -1130,6 +1145,11 @@ class ActivityPerformance(Performance):
         """Get the normalized duration, taking into account the performance type multiplier."""
         return round(self.duration * self.performance_type.multiplier, 2)
 
+    @property
+    def normalized_centi_duration(self):
+        """Get the normalized duration in hundredths of an hour, taking into account the performance multiplier."""
+        return multiply_centi(hours_to_centi(self.duration), hours_to_centi(self.performance_type.multiplier))
+
 
 class StandbyPerformance(Performance):
     """Standby (oncall) performance model."""
@@ -1190,4 +1210,103 @@ class InvoiceItem(BaseModel):
         ]
     )
     amount = models.PositiveIntegerField(default=1)
-    description = models.TextField(max_length=255, blank=True, null=True)
\ No newline at end of file
+    description = models.TextField(max_length=255, blank=True, null=True)
+
+
+class UserDayLedger(BaseModel):
+    """
+    User day ledger model.
+
+    Holds the hours of a user for a single day, as calculated from their employment contract, holidays, leave and
+    performances. It is kept up to date using signals, and allows summing up large periods using a single query.
+
+    """
+
+    user = models.ForeignKey(auth_models.User, on_delete=models.CASCADE)
+    date = models.DateField()
+    work_hours = models.DecimalField(max_digits=6, decimal_places=2, default=0.00)
+    holiday_hours = models.DecimalField(max_digits=6, decimal_places=2, default=0.00)
+    leave_hours = models.DecimalField(max_digits=6, decimal_places=2, default=0.00)
+    pending_leave_hours = models.DecimalField(max_digits=6, decimal_places=2, default=0.00)
+    performed_hours = models.DecimalField(max_digits=6, decimal_places=2, default=0.00)
+    standby_count = models.PositiveIntegerField(default=0)
+
+    class Meta(BaseModel.Meta):
+        unique_together = (('user', 'date'),)
+
+    def __str__(self):
+        """Return a string representation."""
+        return '%s - %s' % (self.user, self.date)
+
+
+class UserDayLedgerRange(BaseModel):
+    """
+    User day ledger range model.
+
+    Holds the continuous period for which the user day ledger of a user has actually been built, so periods outside
+    of it are never read from the ledger as if they were empty.
+
+    """
+
+    user = models.OneToOneField(auth_models.User, on_delete=models.CASCADE)
+    from_date = models.DateField()
+    until_date = models.DateField()
+
+    def __str__(self):
+        """Return a string representation."""
+        return '%s: %s - %s' % (self.user, self.from_date, self.until_date)
+
+
+class TimesheetRangeInfo(BaseModel):
+    """
+    Timesheet range info model.
+
+    Holds the range info, including a summary, of a closed timesheet. Since closed timesheets can no longer be
+    modified, it only needs to be removed when a timesheet is reopened.
+
+    """
+
+    timesheet = models.OneToOneField(Timesheet, on_delete=models.CASCADE)
+    data = models.TextField()
+
+    def __str__(self):
+        """Return a string representation."""
+        return '%s' % self.timesheet
+
+
+class ReportJob(BaseModel):
+    """
+    Report job model.
+
+    Holds an admin report which is run in the background by the `run_report_jobs` command, along with its result.
+    The result contains the headers and rows of the report table, stored as compressed JSON.
+
+    """
+
+    STATUS_CHOICES = Choices(
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_RUNNING, _('Running')),
+        (STATUS_COMPLETED, _('Completed')),
+        (STATUS_FAILED, _('Failed')),
+    )
+
+    user = models.ForeignKey(auth_models.User, on_delete=models.CASCADE)
+    report = models.CharField(max_length=255)
+    parameters = models.TextField(blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    result = models.BinaryField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+
+    def __str__(self):
+        """Return a string representation."""
+        return '%s - %s' % (self.report, self.created_at)
+
+    def get_result(self):
+        """Get the decompressed result."""
+        return json.loads(zlib.decompress(self.result).decode('utf-8')) if self.result else None
+
+    def set_result(self, result):
+        """Compress and set the result."""
+        self.result = zlib.compress(json.dumps(result, cls=DjangoJSONEncoder).encode('utf-8'))
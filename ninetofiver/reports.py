@@ -0,0 +1,197 @@
+"""Reports."""
+import hashlib
+import logging
+from datetime import date, timedelta
+from functools import wraps
+from django.contrib.auth import models as auth_models
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection
+from django.db.models import Q
+from django.http import HttpRequest, QueryDict
+from django.urls import reverse, resolve, NoReverseMatch
+from django.utils import timezone
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django_tables2.export.export import TableExport
+from ninetofiver import exports, models, settings
+
+
+logger = logging.getLogger(__name__)
+
+
+REPORT_PREFIX = 'admin_report_'
+REPORT_EXCLUDES = ['admin_report_index']
+
+# Models which report filters list choices of, or which are displayed in most reports
+COMMON_MODELS = [auth_models.User, auth_models.Group, models.Company, models.ContractGroup]
+# Models range info and availability are calculated from
+RANGE_INFO_MODELS = [models.EmploymentContract, models.WorkSchedule, models.Company, models.Holiday, models.Leave,
+                     models.LeaveDate, models.LeaveType, models.Performance, models.PerformanceType, models.Contract,
+                     models.ContractGroup, models.Timesheet]
+AVAILABILITY_MODELS = RANGE_INFO_MODELS + [models.Whereabout, models.Location, models.ContractUser,
+                                           models.ContractUserWorkSchedule, models.UserInfo]
+
+
+def is_report(report):
+    """Determine whether the given URL name belongs to an admin report which can be run in the background."""
+    if (not report) or (not report.startswith(REPORT_PREFIX)) or (report in REPORT_EXCLUDES):
+        return False
+
+    try:
+        reverse(report)
+    except NoReverseMatch:
+        return False
+
+    return True
+
+
+def run_report(report, parameters, user):
+    """
+    Run the given admin report with the given (URL encoded) parameters as the given user.
+
+    The report is requested as a CSV export, so only the rows of its table are computed, but the values of the
+    table are used directly instead of generating and parsing the CSV. They are returned along with the table headers.
+
+    """
+    path = reverse(report)
+    query = QueryDict(parameters, mutable=True)
+    query['_export'] = TableExport.CSV
+
+    request = HttpRequest()
+    request.method = 'GET'
+    request.path = request.path_info = path
+    request.GET = query
+    request.user = user
+    response = resolve(path).func(request)
+
+    if (response.status_code != 200) or (not hasattr(response, 'table')):
+        raise ValueError('Report %s could not be exported, status code %s' % (report, response.status_code))
+
+    values = exports.get_table_values(response.table)
+
+    return {
+        'headers': next(values),
+        'rows': list(values),
+    }
+
+
+def claim_report_job():
+    """
+    Claim the oldest pending report job by marking it as running, returning it, or None if there is none.
+
+    Jobs which have been running for longer than `REPORT_JOB_TIMEOUT` are assumed to have been abandoned, e.g.
+    because their worker was stopped, and are claimed again.
+
+    """
+    claimable = (Q(status=models.STATUS_PENDING) |
+                 Q(status=models.STATUS_RUNNING,
+                   started_at__lt=timezone.now() - timedelta(seconds=settings.REPORT_JOB_TIMEOUT)))
+    job_ids = (models.ReportJob.objects
+               .filter(claimable)
+               .order_by('id')
+               .values_list('id', flat=True))
+
+    for job_id in job_ids:
+        # Only one worker can successfully update the status of a job, so jobs are never run twice
+        if (models.ReportJob.objects
+                .filter(claimable, id=job_id)
+                .update(status=models.STATUS_RUNNING, started_at=timezone.now())):
+            return models.ReportJob.objects.get(id=job_id)
+
+    return None
+
+
+def run_report_job(job):
+    """Run the given report job, storing its result or error."""
+    try:
+        job.set_result(run_report(job.report, job.parameters, job.user))
+        job.status = models.STATUS_COMPLETED
+    except Exception as e:
+        logger.exception('Report job %s failed' % job.id)
+        job.status = models.STATUS_FAILED
+        job.error = str(e)
+
+    job.finished_at = timezone.now()
+    job.save()
+
+
+def get_data_version_tables(report_models):
+    """
+    Get the tables to determine the data version of the given models from, along with their last modification column.
+
+    Tables of models without an `updated_at` field, such as users and groups, and tables of many-to-many relations
+    have no last modification column.
+
+    """
+    tables = {}
+    for model in report_models:
+        try:
+            field = model._meta.get_field('updated_at')
+            tables[field.model._meta.db_table] = field.column
+        except FieldDoesNotExist:
+            tables[model._meta.db_table] = None
+
+        for field in model._meta.many_to_many:
+            tables.setdefault(field.remote_field.through._meta.db_table, None)
+
+    return sorted(tables.items())
+
+
+def get_data_version(report_models):
+    """
+    Get a version of the data stored for the given models, using a single query.
+
+    The version consists of the row count and the last modification of the table of every model, and the row count of
+    their many-to-many relations, so it changes whenever a row is created, saved or deleted, including bulk creates
+    and deletes. Bulk updates which don't touch `updated_at` are not detected, so cached reports also expire after
+    `REPORT_CACHE_TIMEOUT` seconds.
+
+    """
+    quote_name = connection.ops.quote_name
+    columns = []
+    for table, column in get_data_version_tables(report_models):
+        columns.append('(SELECT COUNT(*) FROM %s)' % quote_name(table))
+        if column:
+            columns.append('(SELECT MAX(%s) FROM %s)' % (quote_name(column), quote_name(table)))
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT %s' % ', '.join(columns))
+        return cursor.fetchone()
+
+
+def get_report_cache_key(request, report, report_models):
+    """Get the cache key for a report response, based on the request, the current date and the data version."""
+    parameters = sorted([(key, sorted(request.GET.getlist(key))) for key in request.GET])
+    key = repr([report, request.user.id, parameters, date.today(), get_data_version(report_models)])
+
+    return 'report:%s:%s' % (report, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+
+def cache_report(*report_models):
+    """
+    Cache responses of the decorated report view until the data of the given models, or of `COMMON_MODELS`, changes.
+
+    Responses are cached per user. They are rendered without a CSRF token, which is filled in from the CSRF cookie
+    instead, so the CSRF cookie is always set.
+
+    """
+    report_models = COMMON_MODELS + list(report_models)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method != 'GET') or (not settings.REPORT_CACHE_TIMEOUT):
+                return view(request, *args, **kwargs)
+
+            key = get_report_cache_key(request, view.__name__, report_models)
+            response = cache.get(key)
+
+            if response is None:
+                response = view(request, *args, **kwargs)
+                # Streamed exports are not cached, since their content is only generated while being sent
+                if (response.status_code == 200) and (not response.streaming):
+                    cache.set(key, response, settings.REPORT_CACHE_TIMEOUT)
+
+            return response
+        return ensure_csrf_cookie(wrapper)
+    return decorator
@@ -163,6 +163,14 @@ class Base(Configuration):
         },
     }
 
+    # Cache
+    # https://docs.djangoproject.com/en/1.10/ref/settings/#caches
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+
     # Password validation
     # https://docs.djangoproject.com/en/1.10/ref/settings/#auth-password-validators
 
@@ -347,6 +355,30 @@ class Base(Configuration):
     ROCKETCHAT_PERFORMANCE_REMINDER_NOTIFICATION_ENABLED = values.Value(True)
     ROCKETCHAT_TIMESHEET_REMINDER_NOTIFICATION_ENABLED = values.Value(True)
 
+    # Amount of users to calculate range info or availability for at once, when processing users in chunks
+    CALCULATION_CHUNK_SIZE = values.Value(100)
+
+    # Amount of processes to use for parallel calculations, and the minimum amount of user days to use them for
+    # Parallel calculations are only used by management commands, never while handling requests
+    CALCULATION_WORKERS = values.Value(0)
+    CALCULATION_PARALLEL_THRESHOLD = values.Value(20000)
+
+    # User day ledger
+    # Run the rebuild_user_day_ledger command after enabling this, and at least once a year afterwards
+    # Changes to employment contracts, work schedules and company countries invalidate the ledger from then on, run
+    # the rebuild_user_day_ledger command with --invalidated periodically to rebuild invalidated periods
+    USER_DAY_LEDGER_ENABLED = values.Value(False)
+
+    # Amount of seconds to cache admin report responses for, or 0 to disable caching them
+    # Cached reports are invalidated when the row count or last modification of the tables they use changes, which is
+    # determined using a single query per request, so bulk updates are only picked up once responses expire
+    REPORT_CACHE_TIMEOUT = values.Value(0)
+
+    # Report jobs
+    # Amount of seconds after which running report jobs are considered abandoned, e.g. because their worker died,
+    # and are claimed again
+    REPORT_JOB_TIMEOUT = values.Value(3600)
+
 
 class Dev(Base):
     """Dev configuration."""
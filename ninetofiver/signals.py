@@ -2,9 +2,10 @@
 from django_auth_ldap.backend import populate_user
 from django.contrib.auth import models as auth_models
 from django.dispatch import receiver
-from django.db.models.signals import post_save, pre_save, m2m_changed, pre_delete
+from django.db.models import Q
+from django.db.models.signals import post_save, pre_save, m2m_changed, pre_delete, post_delete
 from django.utils.translation import ugettext_lazy as _
-from ninetofiver import models, notifications
+from ninetofiver import models, notifications, calculation, settings
 from ninetofiver.utils import send_mail, get_users_with_permission
 
 
@@ -85,6 +86,10 @@ def on_timesheet_pre_save(sender, instance, created=False, **kwargs):
                     }
                 )
 
+        # Stored range info is only valid for as long as the timesheet stays closed
+        if (old_status == models.STATUS_CLOSED) and (new_status != models.STATUS_CLOSED):
+            models.TimesheetRangeInfo.objects.filter(timesheet=instance).delete()
+
 
 @receiver(pre_save, sender=models.ContractUserGroup)
 def on_contract_user_group_pre_save(sender, instance, created=False, **kwargs):
@@ -201,4 +206,163 @@ def on_attachment_pre_delete(sender, instance, **kwargs):
 
     if timesheets or leaves:
         notifications.send_attachments_modified_notification(attachments=[instance], action='removed',
-                                                             timesheets=timesheets, leaves=leaves)
\ No newline at end of file
+                                                             timesheets=timesheets, leaves=leaves)
+
+
+def update_user_day_ledger_for_timesheets(timesheet_ids):
+    """Update the user day ledger for the given timesheets."""
+    if not settings.USER_DAY_LEDGER_ENABLED:
+        return
+
+    timesheets = models.Timesheet.objects.filter(id__in=[x for x in timesheet_ids if x]).select_related('user')
+    for timesheet in timesheets:
+        calculation.update_user_day_ledger([timesheet.user], *timesheet.get_date_range())
+
+
+def update_user_day_ledger_for_days(timesheet_days):
+    """Update the user day ledger for the given (timesheet ID, date) pairs, only recalculating those days."""
+    if not settings.USER_DAY_LEDGER_ENABLED:
+        return
+
+    timesheet_days = {(x, y) for x, y in timesheet_days if x and y}
+    timesheets = (models.Timesheet.objects
+                  .filter(id__in={x[0] for x in timesheet_days})
+                  .select_related('user')
+                  .in_bulk())
+    for timesheet_id, date in timesheet_days:
+        if timesheet_id in timesheets:
+            calculation.update_user_day_ledger([timesheets[timesheet_id].user], date, date)
+
+
+def invalidate_user_day_ledger_for_employment_contracts(employment_contracts, from_date=None):
+    """Invalidate the user day ledger for the users of the given employment contracts, onwards from their start."""
+    if not settings.USER_DAY_LEDGER_ENABLED:
+        return
+
+    for employment_contract in employment_contracts:
+        started_at = min(employment_contract.started_at, from_date) if from_date else employment_contract.started_at
+        calculation.invalidate_user_day_ledger([employment_contract.user_id], started_at)
+
+
+def get_user_day_ledger_date(instance, value=None):
+    """Get the day an object which affects the user day ledger applies to, optionally using an old value."""
+    if isinstance(instance, models.LeaveDate):
+        value = value if value else instance.starts_at
+        return value.date()
+    return value if value else instance.date
+
+
+@receiver(pre_save, sender=models.ActivityPerformance)
+@receiver(pre_save, sender=models.StandbyPerformance)
+@receiver(pre_save, sender=models.LeaveDate)
+def on_user_day_ledger_source_pre_save(sender, instance, **kwargs):
+    """Process pre-save event for an object which affects the user day ledger, keeping track of its old day."""
+    dirty = instance.get_dirty_fields(check_relationship=True) if instance.pk else {}
+    old_date = dirty.get('starts_at' if isinstance(instance, models.LeaveDate) else 'date', None)
+    instance._old_timesheet_id = dirty.get('timesheet', None)
+    instance._old_date = get_user_day_ledger_date(instance, old_date) if old_date else None
+
+
+@receiver(post_save, sender=models.ActivityPerformance)
+@receiver(post_save, sender=models.StandbyPerformance)
+@receiver(post_save, sender=models.LeaveDate)
+@receiver(post_delete, sender=models.ActivityPerformance)
+@receiver(post_delete, sender=models.StandbyPerformance)
+@receiver(post_delete, sender=models.LeaveDate)
+def on_user_day_ledger_source_changed(sender, instance, **kwargs):
+    """Process post-save or post-delete event for an object which affects the user day ledger."""
+    date = get_user_day_ledger_date(instance)
+    old_timesheet_id = getattr(instance, '_old_timesheet_id', None) or instance.timesheet_id
+    old_date = getattr(instance, '_old_date', None) or date
+    update_user_day_ledger_for_days({(instance.timesheet_id, date), (old_timesheet_id, old_date)})
+
+
+@receiver(post_save, sender=models.Leave)
+def on_leave_post_save(sender, instance, created=False, **kwargs):
+    """Process post-save event for a leave."""
+    if not created:
+        leave_dates = models.LeaveDate.objects.filter(leave=instance).values_list('timesheet', 'starts_at')
+        update_user_day_ledger_for_days({(x[0], x[1].date()) for x in leave_dates})
+
+
+@receiver(pre_save, sender=models.Holiday)
+def on_holiday_pre_save(sender, instance, **kwargs):
+    """Process pre-save event for a holiday, keeping track of its old date and country."""
+    dirty = instance.get_dirty_fields() if instance.pk else {}
+    instance._old_date = dirty.get('date', None)
+    instance._old_country = dirty.get('country', None)
+
+
+@receiver(post_save, sender=models.Holiday)
+@receiver(post_delete, sender=models.Holiday)
+def on_holiday_changed(sender, instance, **kwargs):
+    """Process post-save or post-delete event for a holiday."""
+    if not settings.USER_DAY_LEDGER_ENABLED:
+        return
+
+    for country, date in {(str(instance.country), instance.date),
+                          (str(getattr(instance, '_old_country', None) or instance.country),
+                           getattr(instance, '_old_date', None) or instance.date)}:
+        employment_contracts = (models.EmploymentContract.objects
+                                .filter(company__country=country, started_at__lte=date)
+                                .filter(Q(ended_at__isnull=True) | Q(ended_at__gte=date))
+                                .select_related('user'))
+        users = {x.user for x in employment_contracts}
+        calculation.update_user_day_ledger(users, date, date)
+
+
+@receiver(pre_save, sender=models.EmploymentContract)
+def on_employment_contract_pre_save(sender, instance, **kwargs):
+    """Process pre-save event for an employment contract, keeping track of its old user and start date."""
+    dirty = instance.get_dirty_fields(check_relationship=True) if instance.pk else {}
+    instance._old_user_id = dirty.get('user', None)
+    instance._old_started_at = dirty.get('started_at', None)
+
+
+@receiver(post_save, sender=models.EmploymentContract)
+@receiver(post_delete, sender=models.EmploymentContract)
+def on_employment_contract_changed(sender, instance, **kwargs):
+    """Process post-save or post-delete event for an employment contract."""
+    invalidate_user_day_ledger_for_employment_contracts([instance], getattr(instance, '_old_started_at', None))
+
+    # The contract no longer applies to its old user if it has been reassigned
+    old_user_id = getattr(instance, '_old_user_id', None)
+    if settings.USER_DAY_LEDGER_ENABLED and old_user_id and (old_user_id != instance.user_id):
+        calculation.invalidate_user_day_ledger([old_user_id], min(instance.started_at,
+                                                                  instance._old_started_at or instance.started_at))
+
+
+@receiver(post_save, sender=models.WorkSchedule)
+def on_work_schedule_post_save(sender, instance, created=False, **kwargs):
+    """Process post-save event for a work schedule."""
+    if not created:
+        employment_contracts = models.EmploymentContract.objects.filter(work_schedule=instance)
+        invalidate_user_day_ledger_for_employment_contracts(employment_contracts)
+
+
+@receiver(pre_save, sender=models.Company)
+def on_company_pre_save(sender, instance, **kwargs):
+    """Process pre-save event for a company, keeping track of whether its country changed."""
+    dirty = instance.get_dirty_fields() if instance.pk else {}
+    instance._country_changed = 'country' in dirty
+
+
+@receiver(post_save, sender=models.Company)
+def on_company_post_save(sender, instance, created=False, **kwargs):
+    """Process post-save event for a company, of which the country determines the holidays of its employees."""
+    if (not created) and getattr(instance, '_country_changed', False):
+        employment_contracts = models.EmploymentContract.objects.filter(company=instance)
+        invalidate_user_day_ledger_for_employment_contracts(employment_contracts)
+
+
+@receiver(post_save, sender=models.PerformanceType)
+def on_performance_type_post_save(sender, instance, created=False, **kwargs):
+    """Process post-save event for a performance type."""
+    if not created:
+        timesheet_ids = (models.ActivityPerformance.objects
+                         .filter(performance_type=instance)
+                         .order_by()
+                         .values_list('timesheet', flat=True)
+                         .distinct())
+        update_user_day_ledger_for_timesheets(set(timesheet_ids))
+
@@ -1,10 +1,12 @@
 """Tables."""
 import uuid
+from collections import OrderedDict
 from django.utils.translation import ugettext_lazy as _
 from django.utils.html import format_html
 from django.urls import reverse
 import django_tables2 as tables
-from django_tables2.utils import A
+from django_tables2.data import TableListData
+from django_tables2.utils import A, OrderBy
 from django_tables2.export.export import TableExport
 from ninetofiver import models
 from ninetofiver.utils import month_date_range, format_duration, dates_in_range
@@ -19,12 +21,96 @@ class BaseTable(tables.Table):
         TableExport.JSON,
         TableExport.ODS,
         TableExport.XLS,
+        TableExport.XLSX,
     ]
 
     class Meta:
         template_name = 'django_tables2/bootstrap4.html'
         attrs = {'class': 'table table-bordered table-striped table-hover', 'container': 'table-responsive'}
 
+    def __init__(self, *args, totals=None, **kwargs):
+        """
+        Constructor.
+
+        Totals can be passed, indexed by accessor, if they can be determined without iterating over all of the data.
+
+        """
+        super().__init__(*args, **kwargs)
+        self._totals = totals
+
+    def get_totals(self):
+        """
+        Get the totals of the accessors used by summed columns, indexed by accessor.
+
+        Unless they were passed, totals are calculated the first time they are needed, resolving the accessors of all
+        summed columns in a single pass over the data, rather than in a separate pass for every column.
+
+        """
+        if self._totals is None:
+            accessors = {}
+            for bound_column in self.columns:
+                get_summed_accessors = getattr(bound_column.column, 'get_summed_accessors', None)
+                if get_summed_accessors:
+                    accessors.update({str(x): x for x in get_summed_accessors(bound_column)})
+
+            totals = {x: 0 for x in accessors}
+            if accessors:
+                for record in self.data:
+                    for key, accessor in accessors.items():
+                        value = accessor.resolve(record)
+                        if value is not None:
+                            totals[key] += value
+
+            self._totals = totals
+
+        return self._totals
+
+
+class LazyTableData(TableListData):
+    """
+    Table data for a list of dicts which only computes the expensive values of records when they are needed.
+
+    Records initially contain only cheap values, which are used to count and sort them. `compute` receives a list of
+    records and should add the given lazy keys to each of them. It is called for the records on the displayed page
+    only, or for all remaining records at once when all of them are iterated over, e.g. to export them or calculate
+    totals, so totals should be passed to the table instead. Sorting on a column which uses a lazy key computes all
+    records first.
+
+    """
+
+    def __init__(self, data, compute, lazy_keys):
+        """Constructor."""
+        super().__init__(list(data))
+        self.compute = compute
+        self.lazy_keys = set(lazy_keys)
+
+    def compute_records(self, records):
+        """Compute the lazy values of the given records, if they haven't been computed yet."""
+        records = [x for x in records if not self.lazy_keys.issubset(x)]
+        if records:
+            self.compute(records)
+
+    def __getitem__(self, key):
+        """Get a record or a slice of records, computing their lazy values."""
+        records = self.data[key]
+        self.compute_records(records if isinstance(key, slice) else [records])
+        return records
+
+    def __iter__(self):
+        """Iterate over all records, computing their lazy values."""
+        self.compute_records(self.data)
+        return iter(self.data)
+
+    def order_by(self, aliases):
+        """Order the records, computing all of them first if any of the ordered columns uses a lazy key."""
+        for alias in aliases:
+            bound_column = self.table.columns[OrderBy(alias).bare]
+            if [x for x in bound_column.order_by if x.bare.split('.')[0] in self.lazy_keys]:
+                self.compute_records(self.data)
+                break
+
+        super().order_by(aliases)
+
 
 class HoursColumn(tables.Column):
     """Hours column."""
@@ -73,12 +159,17 @@ class BarChartComparisonColumn(tables.TemplateColumn):
     def value(self, record, table, value, bound_column, **kwargs):
         return bound_column.accessor.resolve(record)
 
+    def get_summed_accessors(self, bound_column):
+        """Get the accessors of which totals are rendered in the footer."""
+        return [x['accessor'] for x in self.extra_context['dataset'] if x.get('accessor', None)]
+
     def render_footer(self, table, column, bound_column, **kwargs):
         self.extra_context['uniqueId'] = str(uuid.uuid4())
 
+        totals = table.get_totals()
         for item in self.extra_context['dataset']:
             if item.get('accessor', None):
-                item['value'] = sum([item['accessor'].resolve(record) for record in table.data])
+                item['value'] = totals[str(item['accessor'])]
 
         self.extra_context['title'] = 'Total: %s vs. %s: %s' % (self.extra_context['dataset'][0]['label'],
                                                          self.extra_context['dataset'][1]['label'],
@@ -91,11 +182,13 @@ class BarChartComparisonColumn(tables.TemplateColumn):
 class SummedHoursColumn(HoursColumn):
     """Summed hours column."""
 
+    def get_summed_accessors(self, bound_column):
+        """Get the accessors of which totals are rendered in the footer."""
+        return [bound_column.accessor]
+
     def render_footer(self, table, column, bound_column):
         """Render the footer."""
-        accessor = self.accessor if self.accessor else A(bound_column.name)
-        total = [accessor.resolve(x) for x in table.data]
-        total = sum([x for x in total if x is not None])
+        total = table.get_totals()[str(bound_column.accessor)]
         return format_html(_('Total: {}'), self.render(total))
 
 
@@ -630,4 +723,14 @@ class ProjectContractBudgetOverviewTable(BaseTable):
             'contract': record['contract'].id,
         })
 
-        return format_html('%s' % ('&nbsp;'.join(buttons)))
\ No newline at end of file
+        return format_html('%s' % ('&nbsp;'.join(buttons)))
+
+
+def get_report_job_result_table_class(headers):
+    """Get a table class for the result of a report job, containing a column for every header."""
+    attrs = OrderedDict()
+    attrs['Meta'] = type('Meta', (BaseTable.Meta,), {})
+    for i, header in enumerate(headers):
+        attrs['column_%s' % i] = tables.Column(verbose_name=header)
+
+    return type('ReportJobResultTable', (BaseTable,), attrs)
@@ -1,11 +1,19 @@
+from django.contrib import admin
 from django.urls import reverse
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django_tables2.data import TableListData
 from rest_framework import status
 from rest_framework.test import APITestCase
 from rest_assured import testcases
+from silk.config import SilkyConfig
 from django.utils.timezone import utc
-from ninetofiver import factories, models
+from ninetofiver import factories, models, calculation, reports, settings, tables, utils
 from decimal import Decimal
 from datetime import timedelta
+from unittest import mock
 import logging
 import tempfile
 import datetime
@@ -41,6 +49,61 @@ class ModelTestMixin:
         self.object.validate_unique()
 
 
+class QueryBudgetTestMixin:
+    """
+    This test case mixin provides an assertion for the amount of queries performed when requesting a URL.
+
+    A budget is the maximum amount of queries for a given amount of rows. It can be a function of the amount of
+    rows, a constant, or omitted, in which case the amount of queries for the first amount of rows is used as a
+    constant budget for the others.
+
+    The URL is requested once before measuring, so queries filling caches such as the content type cache are not
+    counted. Requests are not profiled while measuring, since profiling performs queries of its own at random.
+    """
+
+    query_budget_row_counts = [1, 5]
+
+    def assertQueryBudget(self, url, create_row, budget=None, data=None):
+        """Assert the amount of queries performed when requesting the given URL stays within budget."""
+        row_count = 0
+
+        with mock.patch.dict(SilkyConfig().attrs, {'SILKY_INTERCEPT_FUNC': lambda request: False}):
+            response = self.client.get(url, data)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            for budget_row_count in self.query_budget_row_counts:
+                while row_count < budget_row_count:
+                    create_row()
+                    row_count += 1
+
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, data)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+                if budget is None:
+                    budget = len(queries)
+                max_query_count = budget(row_count) if callable(budget) else budget
+
+                self.assertLessEqual(len(queries), max_query_count,
+                                     '%s performed %s queries for %s rows, exceeding its budget of %s' %
+                                     (url, len(queries), row_count, max_query_count))
+
+
+class ListQueryBudgetTestMixin(QueryBudgetTestMixin):
+    """This test case mixin verifies the amount of queries performed by a list endpoint stays within budget."""
+
+    list_query_budget = None
+
+    def create_query_budget_row(self):
+        """Create a row to be listed."""
+        return self.get_object(self.factory_class)
+
+    def test_list_query_budget(self):
+        """Test whether the amount of queries performed by the list endpoint stays within budget."""
+        self.assertQueryBudget(reverse('%s-list' % self.base_name), self.create_query_budget_row,
+                               budget=self.list_query_budget)
+
+
 class GenericViewTests(AuthenticatedAPITestCase):
     """Generic view tests."""
 
@@ -169,14 +232,11 @@ class ContractUserGroupTests(AuthenticatedAPITestCase):
         self.assertEqual(contract.contractuser_set.count(), 0)
 
 
-class AdminReportViewTests(AuthenticatedAPITestCase):
+class AdminReportViewTests(QueryBudgetTestMixin, AuthenticatedAPITestCase):
     """Admin report view tests."""
 
     user_factory = factories.AdminFactory
 
-    def setUp(self):
-        super().setUp()
-
     def test_report_index_view(self):
         """Test the report index view."""
         response = self.client.get(reverse('admin_report_index'))
@@ -235,4 +295,623 @@ class AdminReportViewTests(AuthenticatedAPITestCase):
     def test_project_contract_budget_overview_report_view(self):
         """Test the project contract budget overview report view."""
         response = self.client.get(reverse('admin_report_project_contract_budget_overview'))
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_timesheet_overview_report_view_query_budget(self):
+        """Test the amount of queries performed by the timesheet overview report view."""
+        self.assertQueryBudget(reverse('admin_report_timesheet_overview'),
+                               lambda: factories.OpenTimesheetFactory.create(user=factories.UserFactory.create(),
+                                                                             year=2018, month=10),
+                               data={'year': 2018, 'month': 10})
+
+    def test_timesheet_contract_overview_report_view_query_budget(self):
+        """Test the amount of queries performed by the timesheet contract overview report view."""
+        self.assertQueryBudget(reverse('admin_report_timesheet_contract_overview'),
+                               lambda: factories.OpenTimesheetFactory.create(user=factories.UserFactory.create(),
+                                                                             year=2018, month=10),
+                               data={'year': 2018, 'month': 10})
+
+    def test_expiring_consultancy_contract_overview_report_view_query_budget(self):
+        """Test the amount of queries performed by the expiring consultancy contract overview report view."""
+        def create_row():
+            contract = factories.ConsultancyContractFactory.create(active=True, duration=Decimal('100.00'),
+                                                                   starts_at=datetime.date(2018, 1, 1),
+                                                                   ends_at=datetime.date(2018, 10, 31))
+            factories.ContractUserFactory.create(user=factories.UserFactory.create(), contract=contract)
+
+        self.assertQueryBudget(reverse('admin_report_expiring_consultancy_contract_overview'), create_row,
+                               data={'ends_at_lte': '2018-12-31', 'only_final': 'true'})
+
+    def create_project_contract(self, company, performance_type, hourly_cost=Decimal('0.00')):
+        """Create a project contract with a single performance for a new user."""
+        user = factories.UserFactory.create()
+        contract = factories.ProjectContractFactory.create(company=company, active=True,
+                                                           starts_at=datetime.date(2018, 1, 1), ends_at=None)
+        contract_role = factories.ContractRoleFactory.create(hourly_cost=hourly_cost)
+        factories.ContractUserFactory.create(user=user, contract=contract, contract_role=contract_role)
+        factories.ActivityPerformanceFactory.create(
+            timesheet=factories.OpenTimesheetFactory.create(user=user, year=2018, month=10),
+            date=datetime.date(2018, 10, 3), contract=contract, contract_role=contract_role,
+            performance_type=performance_type, duration=Decimal('2.00'))
+
+        return contract
+
+    def test_project_contract_overview_report_view_query_budget(self):
+        """Test the amount of queries performed by the project contract overview report view."""
+        company = factories.InternalCompanyFactory.create()
+        performance_type = factories.PerformanceTypeFactory.create(multiplier=Decimal('1.00'))
+        self.assertQueryBudget(reverse('admin_report_project_contract_overview'),
+                               lambda: self.create_project_contract(company, performance_type),
+                               data={'company': company.id})
+
+    def test_project_contract_budget_overview_report_view_query_budget(self):
+        """Test the amount of queries performed by the project contract budget overview report view."""
+        company = factories.InternalCompanyFactory.create()
+        performance_type = factories.PerformanceTypeFactory.create(multiplier=Decimal('1.00'))
+        self.assertQueryBudget(reverse('admin_report_project_contract_budget_overview'),
+                               lambda: self.create_project_contract(company, performance_type))
+
+    def test_project_contract_budget_overview_report_view_performance_cost(self):
+        """Test whether the project contract budget overview determines performance cost using hourly costs."""
+        contract = self.create_project_contract(factories.InternalCompanyFactory.create(),
+                                                factories.PerformanceTypeFactory.create(multiplier=Decimal('1.50')),
+                                                hourly_cost=Decimal('50.00'))
+        response = self.client.get(reverse('admin_report_project_contract_budget_overview'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        record = [x.record for x in response.context['table'].rows if x.record['contract'].id == contract.id][0]
+        self.assertEqual(record['performed_hours'], Decimal('3.00'))
+        self.assertEqual(record['performance_cost'], Decimal('150.00'))
+
+    def test_report_job(self):
+        """Test running a report in the background and displaying its result."""
+        factories.OpenTimesheetFactory.create(user=self.user, year=2018, month=10)
+        response = self.client.post(reverse('admin_report_job_create'), {
+            'report': 'admin_report_timesheet_overview',
+            'parameters': 'year=2018&month=10',
+        }, format='multipart')
+        job = models.ReportJob.objects.get()
+        self.assertRedirects(response, reverse('admin_report_job', kwargs={'job_pk': job.id}),
+                             fetch_redirect_response=False)
+
+        response = self.client.get(reverse('admin_report_job_status', kwargs={'job_pk': job.id}))
+        self.assertEqual(response.json()['status'], models.STATUS_PENDING)
+
+        reports.run_report_job(reports.claim_report_job())
+        self.assertIsNone(reports.claim_report_job())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.STATUS_COMPLETED)
+        self.assertEqual(len(job.get_result()['rows']), 1)
+        self.assertEqual(len(job.get_result()['rows'][0]), len(job.get_result()['headers']))
+
+        response = self.client.get(reverse('admin_report_job', kwargs={'job_pk': job.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(reverse('admin_report_job', kwargs={'job_pk': job.id}), {'_export': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_report_export(self):
+        """Test whether report exports are streamed."""
+        factories.OpenTimesheetFactory.create(user=self.user, year=2018, month=10)
+        url = reverse('admin_report_timesheet_overview')
+
+        response = self.client.get(url, {'year': 2018, 'month': 10, '_export': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(b''.join(response.streaming_content).decode('utf-8').splitlines()), 2)
+
+        response = self.client.get(url, {'year': 2018, 'month': 10, '_export': 'xlsx'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'PK'))
+
+    def test_admin_export(self):
+        """Test whether admin exports are streamed."""
+        factories.ProjectContractFactory.create(description=None)
+        url = reverse('admin:ninetofiver_contract_export')
+        formats = [x().get_extension() for x in admin.site._registry[models.Contract].get_export_formats()]
+
+        response = self.client.post(url, {'file_format': formats.index('xlsx')}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'PK'))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                           'LOCATION': 'test_report_cache'}})
+    @mock.patch.object(settings, 'REPORT_CACHE_TIMEOUT', 3600)
+    def test_report_cache(self):
+        """Test whether report responses are cached until their data changes."""
+        cache.clear()
+        url = reverse('admin_report_timesheet_overview')
+        data = {'year': 2018, 'month': 10}
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data)
+        computed_queries = len(queries)
+        self.assertIn('csrftoken', response.cookies)
+
+        with CaptureQueriesContext(connection) as queries:
+            cached_response = self.client.get(url, data)
+        self.assertLess(len(queries), computed_queries)
+        self.assertEqual(cached_response.content, response.content)
+
+        factories.OpenTimesheetFactory.create(user=self.user, year=2018, month=10)
+        response = self.client.get(url, data)
+        self.assertNotEqual(response.content, cached_response.content)
+
+    def test_report_data_version(self):
+        """Test whether the data version of reports changes along with their data."""
+        contract = factories.ProjectContractFactory.create()
+        version = reports.get_data_version([models.Contract])
+        self.assertEqual(reports.get_data_version([models.Contract]), version)
+
+        contract.contract_groups.add(factories.ContractGroupFactory.create())
+        self.assertNotEqual(reports.get_data_version([models.Contract]), version)
+        version = reports.get_data_version([models.Contract])
+
+        contract.save()
+        self.assertNotEqual(reports.get_data_version([models.Contract]), version)
+        version = reports.get_data_version([models.Contract])
+
+        # Bulk creates and deletes don't send signals, but are detected as well
+        group_version = reports.get_data_version([models.ContractGroup])
+        models.ContractGroup.objects.bulk_create([models.ContractGroup(name='Bulk')])
+        self.assertNotEqual(reports.get_data_version([models.ContractGroup]), group_version)
+
+        models.Contract.objects.filter(id=contract.id).delete()
+        self.assertNotEqual(reports.get_data_version([models.Contract]), version)
+
+    def test_lazy_table_data(self):
+        """Test whether lazy table data only computes the records which are displayed."""
+        computed = []
+
+        def compute(records):
+            computed.append(len(records))
+            for record in records:
+                record['range_info'] = {'work_hours': record['timesheet'].month}
+
+        timesheets = [factories.OpenTimesheetFactory.create(user=self.user, year=2018, month=x) for x in range(1, 4)]
+        table = tables.TimesheetOverviewTable(tables.LazyTableData([{'timesheet': x} for x in timesheets], compute,
+                                                                   ['range_info']))
+        table.paginate(per_page=2, page=2)
+        self.assertEqual(len(list(table.paginated_rows)), 1)
+        self.assertEqual(computed, [1])
+
+        table.order_by = '-work_hours'
+        self.assertEqual(computed, [1, 2])
+        self.assertEqual([x['timesheet'].month for x in table.data], [3, 2, 1])
+
+    def test_timesheet_overview_report_view_lazy_rows(self):
+        """Test whether the timesheet overview only computes range info for the displayed timesheets."""
+        factories.EmploymentContractFactory.create(
+            user=self.user, company=factories.InternalCompanyFactory.create(),
+            work_schedule=factories.WorkScheduleFactory.create(),
+            employment_contract_type=factories.EmploymentContractTypeFactory.create(),
+            started_at=datetime.date(2018, 1, 1), ended_at=None)
+        for month in range(1, 4):
+            factories.OpenTimesheetFactory.create(user=self.user, year=2018, month=month)
+
+        with mock.patch.object(calculation, 'get_timesheet_range_info',
+                               wraps=calculation.get_timesheet_range_info) as get_timesheet_range_info:
+            response = self.client.get(reverse('admin_report_timesheet_overview'), {'year': 2018, 'per_page': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([len(x[0][0]) for x in get_timesheet_range_info.call_args_list], [1])
+
+        totals = response.context['table'].get_totals()
+        range_info = calculation.get_timesheet_range_info(models.Timesheet.objects.filter(user=self.user)).values()
+        self.assertGreater(totals['range_info.work_hours'], 0)
+        for key in ['work_hours', 'performed_hours', 'leave_hours', 'holiday_hours', 'remaining_hours']:
+            self.assertEqual(totals['range_info.%s' % key], sum([x[key] for x in range_info]))
+
+    def test_table_totals(self):
+        """Test whether totals of all summed columns are calculated in a single pass."""
+        timesheets = [factories.OpenTimesheetFactory.create(user=self.user, year=2018, month=x) for x in range(1, 4)]
+        data = [{'timesheet': x, 'range_info': {'work_hours': Decimal('8.00'), 'performed_hours': x.month,
+                                                'leave_hours': None, 'holiday_hours': 0, 'remaining_hours': 0}}
+                for x in timesheets]
+        table = tables.TimesheetOverviewTable(data)
+
+        with mock.patch.object(TableListData, '__iter__', autospec=True,
+                               side_effect=lambda x: iter(x.data)) as iterate:
+            totals = table.get_totals()
+            table.get_totals()
+        self.assertEqual(iterate.call_count, 1)
+        self.assertEqual(totals['range_info.work_hours'], Decimal('24.00'))
+        self.assertEqual(totals['range_info.performed_hours'], 6)
+        self.assertEqual(totals['range_info.leave_hours'], 0)
+
+    def test_report_job_invalid_report(self):
+        """Test whether report jobs can only be created for admin reports."""
+        response = self.client.post(reverse('admin_report_job_create'), {'report': 'admin_report_index'},
+                                    format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(models.ReportJob.objects.exists())
+
+    def test_report_job_owner(self):
+        """Test whether report jobs are only accessible to the user who created them and to superusers."""
+        job = models.ReportJob.objects.create(user=self.user, report='admin_report_timesheet_overview')
+        response = self.client.get(reverse('admin_report_job', kwargs={'job_pk': job.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        user = factories.UserFactory.create(is_staff=True)
+        self.client.force_login(user)
+        response = self.client.get(reverse('admin_report_job', kwargs={'job_pk': job.id}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('admin_report_job_status', kwargs={'job_pk': job.id}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        job = models.ReportJob.objects.create(user=user, report='admin_report_timesheet_overview')
+        response = self.client.get(reverse('admin_report_job_status', kwargs={'job_pk': job.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('admin_report_job_status', kwargs={'job_pk': job.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_report_job_timeout(self):
+        """Test whether report jobs which have been running for too long are claimed again."""
+        job = models.ReportJob.objects.create(user=self.user, report='admin_report_timesheet_overview')
+        self.assertEqual(reports.claim_report_job(), job)
+        self.assertIsNone(reports.claim_report_job())
+
+        models.ReportJob.objects.filter(id=job.id).update(started_at=datetime.datetime.now(utc) - timedelta(hours=2))
+        with mock.patch.object(settings, 'REPORT_JOB_TIMEOUT', 3600):
+            self.assertEqual(reports.claim_report_job(), job)
+            self.assertIsNone(reports.claim_report_job())
+
+
+class AdminChangelistQueryBudgetTests(QueryBudgetTestMixin, AuthenticatedAPITestCase):
+    """Admin changelist query budget tests."""
+
+    user_factory = factories.AdminFactory
+
+    def test_timesheet_changelist_query_budget(self):
+        """Test the amount of queries performed by the timesheet changelist."""
+        self.assertQueryBudget(reverse('admin:ninetofiver_timesheet_changelist'),
+                               lambda: factories.OpenTimesheetFactory.create(user=factories.UserFactory.create(),
+                                                                             year=2018, month=10))
+
+    def test_holiday_changelist_query_budget(self):
+        """Test the amount of queries performed by the holiday changelist."""
+        self.assertQueryBudget(reverse('admin:ninetofiver_holiday_changelist'), factories.HolidayFactory.create)
+
+    def test_employment_contract_changelist_query_budget(self):
+        """Test the amount of queries performed by the employment contract changelist."""
+        company = factories.InternalCompanyFactory.create()
+        work_schedule = factories.WorkScheduleFactory.create()
+        employment_contract_type = factories.EmploymentContractTypeFactory.create()
+
+        self.assertQueryBudget(reverse('admin:ninetofiver_employmentcontract_changelist'),
+                               lambda: factories.EmploymentContractFactory.create(
+                                   user=factories.UserFactory.create(), company=company,
+                                   work_schedule=work_schedule, employment_contract_type=employment_contract_type,
+                                   started_at=datetime.date(2018, 1, 1), ended_at=None))
+
+
+class CalculationTests(AuthenticatedAPITestCase):
+    """Calculation tests."""
+
+    def setUp(self):
+        super().setUp()
+        self.from_date = datetime.date(2018, 10, 1)
+        self.until_date = datetime.date(2018, 10, 31)
+
+        company = factories.InternalCompanyFactory.create(country='BE')
+        work_schedule = factories.WorkScheduleFactory.create(monday=8, tuesday=8, wednesday=Decimal('7.60'),
+                                                             thursday=8, friday=Decimal('4.50'), saturday=0,
+                                                             sunday=0)
+        factories.EmploymentContractFactory.create(user=self.user, company=company, work_schedule=work_schedule,
+                                                   employment_contract_type=(factories.EmploymentContractTypeFactory
+                                                                             .create()),
+                                                   started_at=datetime.date(2018, 1, 1), ended_at=None)
+        factories.HolidayFactory.create(date=datetime.date(2018, 10, 1), country='BE')
+
+        timesheet = factories.OpenTimesheetFactory.create(user=self.user, year=2018, month=10)
+
+        leave = factories.LeaveFactory.create(user=self.user, leave_type=factories.LeaveTypeFactory.create(),
+                                              status=models.STATUS_APPROVED)
+        factories.LeaveDateFactory.create(leave=leave, timesheet=timesheet,
+                                          starts_at=datetime.datetime(2018, 10, 2, 9, tzinfo=utc),
+                                          ends_at=datetime.datetime(2018, 10, 2, 13, 30, tzinfo=utc))
+
+        contract = factories.ContractFactory.create(company=company)
+        contract_role = factories.ContractRoleFactory.create()
+        factories.ContractUserFactory.create(user=self.user, contract=contract, contract_role=contract_role)
+        performance_type = factories.PerformanceTypeFactory.create(multiplier=Decimal('1.50'))
+        for day, duration in [(3, Decimal('7.33')), (4, Decimal('2.25')), (4, Decimal('6.75'))]:
+            factories.ActivityPerformanceFactory.create(timesheet=timesheet, date=datetime.date(2018, 10, day),
+                                                        contract=contract, contract_role=contract_role,
+                                                        performance_type=performance_type, duration=duration)
+
+    def test_range_info_matrix(self):
+        """Test whether the matrix engine returns the same range info as the default engine."""
+        expected = calculation.get_range_info([self.user], self.from_date, self.until_date, daily=True)
+        actual = (calculation.get_range_info_matrix([self.user], self.from_date, self.until_date)
+                  .to_range_info(daily=True))
+        self.assertEqual(actual, expected)
+
+    def test_calendar_context(self):
+        """Test whether calculations sharing a calendar context only fetch data once."""
+        context = calculation.CalendarContext([self.user], self.from_date, self.until_date)
+        calculations = [calculation.get_availability, calculation.get_availability_info, calculation.get_range_info,
+                        calculation.get_range_info_matrix]
+
+        for fn in calculations:
+            fn(context.users, self.from_date, self.until_date, context=context)
+
+        with self.assertNumQueries(0):
+            for fn in calculations:
+                fn(context.users, self.from_date, self.until_date, context=context)
+
+    def test_calendar_context_values(self):
+        """Test whether the matrix engine only fetches values and rejects contexts not matching its arguments."""
+        context = calculation.CalendarContext([self.user], self.from_date, self.until_date)
+        calculation.get_range_info_matrix(context.users, self.from_date, self.until_date, context=context)
+        self.assertNotIn('activity_performances', context.__dict__)
+        self.assertNotIn('employment_contracts', context.__dict__)
+
+        with self.assertRaises(ValueError):
+            calculation.get_range_info_matrix(context.users, self.from_date, self.until_date + timedelta(days=1),
+                                              context=context)
+        with self.assertRaises(ValueError):
+            calculation.get_range_info_matrix([self.user, factories.UserFactory.create()], self.from_date,
+                                              self.until_date, context=context)
+
+    def test_user_day_ledger(self):
+        """Test whether range info totals summed up using the user day ledger match the default engine."""
+        expected = calculation.get_range_info([self.user], self.from_date, self.until_date)
+        calculation.update_user_day_ledger([self.user], self.from_date, self.until_date)
+
+        with mock.patch.object(settings, 'USER_DAY_LEDGER_ENABLED', True):
+            # Only working days are stored, and days without entries count as zero hours
+            self.assertEqual(models.UserDayLedger.objects.filter(user=self.user).count(), 23)
+            user = factories.UserFactory.create()
+            self.assertEqual(calculation.get_ledger_range_info([user], self.from_date, self.until_date)[user.id],
+                             calculation.get_aggregated_range_info([user], self.from_date, self.until_date)[user.id])
+            self.assertEqual(calculation.get_range_info([self.user], self.from_date, self.until_date), expected)
+
+            # Changes to performances are reflected in the ledger
+            performance = models.ActivityPerformance.objects.filter(date=datetime.date(2018, 10, 3)).get()
+            performance.duration = Decimal('8.00')
+            performance.save()
+            actual = calculation.get_range_info([self.user], self.from_date, self.until_date)
+
+        expected = calculation.get_range_info([self.user], self.from_date, self.until_date)
+        self.assertEqual(actual, expected)
+
+    def test_user_day_ledger_range(self):
+        """Test whether the user day ledger is only used for periods it has actually been built for."""
+        expected = calculation.get_range_info([self.user], self.from_date, self.until_date)
+        calculation.update_user_day_ledger([self.user], self.from_date, datetime.date(2018, 10, 15))
+
+        with mock.patch.object(settings, 'USER_DAY_LEDGER_ENABLED', True):
+            self.assertFalse(calculation.is_user_day_ledger_built([self.user], self.from_date, self.until_date))
+            self.assertEqual(calculation.get_range_info([self.user], self.from_date, self.until_date), expected)
+
+            # Saving a performance only recalculates its own day, so the built period is not extended past it
+            performance = models.ActivityPerformance.objects.filter(date=datetime.date(2018, 10, 3)).get()
+            performance.date = datetime.date(2018, 10, 4)
+            performance.save()
+            ledger_range = models.UserDayLedgerRange.objects.get(user=self.user)
+            self.assertEqual([ledger_range.from_date, ledger_range.until_date],
+                             [self.from_date, datetime.date(2018, 10, 15)])
+
+            # Bordering periods extend the built period
+            calculation.update_user_day_ledger([self.user], datetime.date(2018, 10, 16), self.until_date)
+            self.assertTrue(calculation.is_user_day_ledger_built([self.user], self.from_date, self.until_date))
+            self.assertEqual(calculation.get_range_info([self.user], self.from_date, self.until_date), expected)
+
+            # Changing the country of the company invalidates the ledger of its employees, until it is rebuilt
+            employment_contract = models.EmploymentContract.objects.get(user=self.user)
+            company = employment_contract.company
+            company.country = 'NL' if company.country != 'NL' else 'BE'
+            company.save()
+            self.assertFalse(calculation.is_user_day_ledger_built([self.user], self.from_date, self.until_date))
+            expected = calculation.get_range_info([self.user], self.from_date, self.until_date, summary=True)
+            expected[self.user.id].pop('summary')
+            call_command('rebuild_user_day_ledger', '--invalidated', '--from=%s' % self.from_date,
+                         '--user=%s' % self.user.id)
+            self.assertTrue(calculation.is_user_day_ledger_built([self.user], self.from_date, self.until_date))
+            self.assertEqual(calculation.get_range_info([self.user], self.from_date, self.until_date), expected)
+
+            # Reassigned employment contracts no longer count for their old user, once the ledger is rebuilt
+            employment_contract.user = factories.UserFactory.create()
+            employment_contract.save()
+            self.assertFalse(calculation.is_user_day_ledger_built([self.user], self.from_date, self.until_date))
+            call_command('rebuild_user_day_ledger', '--invalidated', '--from=%s' % self.from_date,
+                         '--user=%s' % self.user.id)
+            self.assertFalse(models.UserDayLedger.objects.filter(user=self.user, work_hours__gt=0).exists())
+
+    def test_timesheet_range_info(self):
+        """Test whether range info for closed timesheets is stored, and removed again when they are reopened."""
+        models.Timesheet.objects.filter(user=self.user).update(status=models.STATUS_CLOSED)
+        timesheet = models.Timesheet.objects.get(user=self.user)
+        expected = calculation.get_range_info([self.user], self.from_date, self.until_date, summary=True)
+        expected = expected[self.user.id]
+        expected['summary']['performances'] = list(expected['summary']['performances'])
+
+        self.assertEqual(calculation.get_timesheet_range_info([timesheet])[timesheet.id], expected)
+        self.assertEqual(models.TimesheetRangeInfo.objects.filter(timesheet=timesheet).count(), 1)
+
+        with self.assertNumQueries(2):
+            self.assertEqual(calculation.get_timesheet_range_info([timesheet])[timesheet.id], expected)
+
+        # Range info stored by another request in the meantime is kept
+        with mock.patch.object(models.TimesheetRangeInfo.objects, 'filter',
+                               return_value=models.TimesheetRangeInfo.objects.none()):
+            self.assertEqual(calculation.get_timesheet_range_info([timesheet])[timesheet.id], expected)
+        self.assertEqual(models.TimesheetRangeInfo.objects.filter(timesheet=timesheet).count(), 1)
+
+        timesheet.status = models.STATUS_ACTIVE
+        timesheet.save()
+        self.assertEqual(models.TimesheetRangeInfo.objects.filter(timesheet=timesheet).count(), 0)
+
+    def test_iter_range_info(self):
+        """Test whether calculating for chunks of users returns the same results as calculating for all at once."""
+        users = [self.user, factories.UserFactory.create()]
+        expected = calculation.get_range_info(users, self.from_date, self.until_date, daily=True)
+        actual = {x.id: y for x, y in calculation.iter_range_info(users, self.from_date, self.until_date, chunk_size=1,
+                                                                  daily=True)}
+        self.assertEqual(actual, expected)
+
+        expected = calculation.get_availability(users, self.from_date, self.until_date)
+        actual = dict(calculation.iter_availability(users, self.from_date, self.until_date, chunk_size=1))
+        self.assertEqual(actual, {int(x): y for x, y in expected.items()})
+
+    def test_aggregated_range_info(self):
+        """Test whether range info aggregated in the database matches range info calculated per performance."""
+        contract = factories.SupportContractFactory.create()
+        factories.ContractUserFactory.create(user=self.user, contract=contract,
+                                             contract_role=factories.ContractRoleFactory.create())
+        factories.StandbyPerformanceFactory.create(timesheet=models.Timesheet.objects.get(user=self.user),
+                                                   date=datetime.date(2018, 10, 6), contract=contract)
+        context = calculation.CalendarContext([self.user], self.from_date, self.until_date)
+        expected = calculation.get_range_info(context.users, self.from_date, self.until_date, summary=True,
+                                              context=context)
+        expected[self.user.id]['summary']['performances'] = list(expected[self.user.id]['summary']['performances'])
+
+        with self.assertNumQueries(6):
+            actual = calculation.get_range_info([self.user], self.from_date, self.until_date, summary=True)
+        self.assertEqual(actual, expected)
+
+        # Serializing the summary doesn't query the customer of every contract
+        factories.StandbyPerformanceFactory.create(timesheet=models.Timesheet.objects.get(user=self.user),
+                                                   date=datetime.date(2018, 10, 7),
+                                                   contract=factories.SupportContractFactory.create())
+        calculation.get_range_info([self.user], self.from_date, self.until_date, summary=True, serialize=True)
+        with self.assertNumQueries(6):
+            actual = calculation.get_range_info([self.user], self.from_date, self.until_date, summary=True,
+                                                serialize=True)
+        self.assertEqual(len(actual[self.user.id]['summary']['performances']), 3)
+
+    def test_timesheet_contract_info(self):
+        """Test whether performances aggregated per timesheet and contract match the range info summary."""
+        timesheet = models.Timesheet.objects.get(user=self.user)
+        contract = factories.SupportContractFactory.create()
+        factories.ContractUserFactory.create(user=self.user, contract=contract,
+                                             contract_role=factories.ContractRoleFactory.create())
+        factories.StandbyPerformanceFactory.create(timesheet=timesheet, date=datetime.date(2018, 10, 6),
+                                                   contract=contract)
+        summary = calculation.get_range_info([self.user], self.from_date, self.until_date, summary=True)
+        expected = [dict(x, timesheet=timesheet) for x in summary[self.user.id]['summary']['performances']]
+        timesheets = models.Timesheet.objects.filter(user=self.user)
+
+        self.assertEqual(len(expected), 2)
+        self.assertEqual(calculation.get_timesheet_contract_info(timesheets), expected)
+        self.assertEqual(calculation.get_timesheet_contract_info(timesheets, contracts=models.Contract.objects
+                                                                 .filter(id=contract.id)),
+                         [x for x in expected if x['contract'].id == contract.id])
+        self.assertEqual(calculation.get_timesheet_contract_info(timesheets, contracts=models.Contract.objects
+                                                                 .exclude(id__in=[x['contract'].id
+                                                                                  for x in expected])), [])
+
+    def test_timesheet_contract_type_info(self):
+        """Test whether hours aggregated per contract type match the range info for a timesheet."""
+        timesheet = models.Timesheet.objects.get(user=self.user)
+        contract = models.Contract.objects.get()
+        range_info = calculation.get_range_info([self.user], self.from_date, self.until_date)[self.user.id]
+
+        actual = calculation.get_timesheet_contract_type_info(models.Timesheet.objects.filter(id=timesheet.id))
+        self.assertEqual(actual, {
+            timesheet.id: {
+                'performed_hours': range_info['performed_hours'],
+                'leave_hours': range_info['leave_hours'],
+                'contract_types': {contract.polymorphic_ctype_id: range_info['performed_hours']},
+            },
+        })
+
+    def test_bucketed_range_info(self):
+        """Test whether range info summed up per bucket matches range info calculated per bucket."""
+        from_date = datetime.date(2018, 9, 1)
+        until_date = datetime.date(2018, 11, 30)
+        actual = calculation.get_bucketed_range_info([self.user], from_date, until_date)[self.user.id]
+        self.assertEqual([(x['from_date'], x['until_date']) for x in actual], [
+            (datetime.date(2018, 9, 1), datetime.date(2018, 9, 30)),
+            (datetime.date(2018, 10, 1), datetime.date(2018, 10, 31)),
+            (datetime.date(2018, 11, 1), datetime.date(2018, 11, 30)),
+        ])
+
+        for bucket in actual:
+            expected = calculation.get_range_info([self.user], bucket.pop('from_date'), bucket.pop('until_date'))
+            self.assertEqual(bucket, expected[self.user.id])
+
+        actual = calculation.get_bucketed_range_info([self.user], self.from_date, self.until_date,
+                                                     granularity='week')[self.user.id]
+        self.assertEqual(actual[0]['until_date'], datetime.date(2018, 10, 7))
+        self.assertEqual(sum([x['performed_hours'] for x in actual]),
+                         calculation.get_range_info([self.user], self.from_date,
+                                                    self.until_date)[self.user.id]['performed_hours'])
+
+        with self.assertRaises(ValueError):
+            calculation.get_bucketed_range_info([self.user], self.from_date, self.until_date, granularity='decade')
+
+    def test_calculate_parallel(self):
+        """Test whether calculating using multiple processes returns the same results as calculating serially."""
+        users = [self.user, factories.UserFactory.create()]
+        expected = calculation.get_range_info(users, self.from_date, self.until_date, daily=True)
+        actual = calculation.calculate_parallel(calculation.get_range_info, users, self.from_date, self.until_date,
+                                                workers=2, threshold=0, daily=True)
+        self.assertEqual(actual, expected)
+
+        expected = calculation.get_range_info(users, self.from_date, self.until_date, summary=True)
+        actual = calculation.calculate_parallel(calculation.get_range_info, users, self.from_date, self.until_date,
+                                                workers=2, threshold=0, summary=True)
+        self.assertEqual(actual, expected)
+
+        # The user day ledger is rebuilt using multiple processes
+        with mock.patch.object(settings, 'CALCULATION_WORKERS', 2), \
+                mock.patch.object(settings, 'CALCULATION_PARALLEL_THRESHOLD', 0):
+            call_command('rebuild_user_day_ledger', '--from=%s' % self.from_date)
+        with mock.patch.object(settings, 'USER_DAY_LEDGER_ENABLED', True):
+            self.assertTrue(calculation.is_user_day_ledger_built(users, self.from_date, self.until_date))
+            self.assertEqual(calculation.get_range_info(users, self.from_date, self.until_date),
+                             calculation.get_aggregated_range_info(users, self.from_date, self.until_date))
+
+        with self.assertRaises(ValueError):
+            calculation.calculate_parallel(calculation.get_availability, users, self.from_date, self.until_date,
+                                           workers=2, threshold=0, serialize=True)
+
+    def test_centi_hours(self):
+        """Test whether integer hundredths of an hour give the same results as the decimal calculations."""
+        for duration in range(0, 2401, 7):
+            for multiplier in [0, 25, 33, 50, 67, 100, 125, 150, 175, 200]:
+                expected = round(Decimal(duration).scaleb(-2) * Decimal(multiplier).scaleb(-2), 2)
+                actual = utils.centi_to_hours(utils.multiply_centi(duration, multiplier))
+                self.assertEqual(actual, expected)
+
+        for seconds in range(0, 86400, 9):
+            expected = Decimal(str(round(seconds / 3600, 2)))
+            actual = utils.centi_to_hours(utils.seconds_to_centi(float(seconds)))
+            self.assertEqual(actual, expected)
+
+        for performance in models.ActivityPerformance.objects.all():
+            self.assertEqual(utils.centi_to_hours(performance.normalized_centi_duration),
+                             performance.normalized_duration)
+
+    def test_employment_timeline(self):
+        """Test looking up employment contracts, work hours and countries using an employment timeline."""
+        first = models.EmploymentContract(started_at=datetime.date(2018, 1, 1), ended_at=datetime.date(2018, 6, 30),
+                                          company=models.Company(country='BE'),
+                                          work_schedule=models.WorkSchedule(monday=8, tuesday=8, wednesday=8,
+                                                                            thursday=8, friday=8, saturday=0,
+                                                                            sunday=0))
+        second = models.EmploymentContract(started_at=datetime.date(2018, 3, 1), ended_at=None,
+                                           company=models.Company(country='NL'),
+                                           work_schedule=models.WorkSchedule(monday=4, tuesday=4, wednesday=4,
+                                                                             thursday=4, friday=4, saturday=0,
+                                                                             sunday=0))
+        timeline = calculation.EmploymentTimeline([first, second])
+
+        # Before the first employment contract
+        self.assertIsNone(timeline.get_employment_contract(datetime.date(2017, 12, 31)))
+        self.assertIsNone(timeline.get_country(datetime.date(2017, 12, 31)))
+        self.assertEqual(timeline.get_work_hours(datetime.date(2017, 12, 31)), 0)
+
+        # Overlapping employment contracts, the earliest one wins
+        self.assertIs(timeline.get_employment_contract(datetime.date(2018, 3, 5)), first)
+        self.assertEqual(timeline.get_work_hours(datetime.date(2018, 3, 5)), 8)
+
+        # After the first employment contract has ended
+        self.assertIs(timeline.get_employment_contract(datetime.date(2018, 7, 2)), second)
+        self.assertEqual(timeline.get_country(datetime.date(2018, 7, 2)), 'NL')
+        self.assertEqual(timeline.get_work_hours(datetime.date(2018, 7, 2)), 4)
+        self.assertEqual(timeline.get_work_hours(datetime.date(2018, 7, 7)), 0)
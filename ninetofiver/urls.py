@@ -117,6 +117,9 @@ urlpatterns += [
     url(r'^admin/ninetofiver/report/expiring_support_contract_overview/$', views.admin_report_expiring_support_contract_overview_view, name='admin_report_expiring_support_contract_overview'),  # noqa
     url(r'^admin/ninetofiver/report/project_contract_overview/$', views.admin_report_project_contract_overview_view, name='admin_report_project_contract_overview'),  # noqa
     url(r'^admin/ninetofiver/report/project_contract_budget_overview/$', views.admin_report_project_contract_budget_overview_view, name='admin_report_project_contract_budget_overview'),  # noqa
+    url(r'^admin/ninetofiver/report/job/$', views.admin_report_job_create_view, name='admin_report_job_create'),  # noqa
+    url(r'^admin/ninetofiver/report/job/(?P<job_pk>[0-9]+)/$', views.admin_report_job_view, name='admin_report_job'),  # noqa
+    url(r'^admin/ninetofiver/report/job/(?P<job_pk>[0-9]+)/status/$', views.admin_report_job_status_view, name='admin_report_job_status'),  # noqa
     url(r'^admin/ninetofiver/timesheet_contract_pdf_export/(?P<user_timesheet_contract_pks>[0-9:,]+)/$', views.AdminTimesheetContractPdfExportView.as_view(), name='admin_timesheet_contract_pdf_export'),  # noqa
 
     # Admin
@@ -5,6 +5,7 @@ from dateutil.relativedelta import relativedelta
 import datetime
 import os
 import copy
+from decimal import Decimal
 from django.core.mail import send_mail as base_send_mail
 from django.template.loader import render_to_string
 from django.db.models import Q
@@ -70,6 +71,27 @@ def dates_in_range(from_date, until_date):
     return dates
 
 
+def hours_to_centi(hours):
+    """Convert a decimal amount of hours to an integer amount of hundredths of an hour."""
+    return int(hours * 100)
+
+
+def centi_to_hours(centi):
+    """Convert an integer amount of hundredths of an hour to a decimal amount of hours."""
+    return Decimal(int(centi)).scaleb(-2)
+
+
+def seconds_to_centi(seconds):
+    """Convert an amount of seconds to hundredths of an hour, rounding like leave durations have always been."""
+    return int(round(round(seconds / 3600, 2) * 100))
+
+
+def multiply_centi(centi, multiplier_centi):
+    """Multiply two amounts of hundredths, rounding the result to hundredths half to even like Decimal does."""
+    quotient, remainder = divmod(centi * multiplier_centi, 100)
+    return quotient + ((remainder > 50) or ((remainder == 50) and (quotient % 2 == 1)))
+
+
 def hours_to_days(hours):
     """Convert hours to days."""
     return round(hours / 8, 2)
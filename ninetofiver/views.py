@@ -4,12 +4,14 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.contenttypes.models import ContentType
 from django.shortcuts import get_object_or_404
 from django.shortcuts import render, redirect
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_POST
 from django.forms.models import modelform_factory
 from django.views import generic as generic_views
 from django.db import transaction
 from django.utils.translation import ugettext_lazy as _
 from django.utils import timezone
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from decimal import Decimal
 from ninetofiver import filters
 from ninetofiver import models
@@ -32,9 +34,9 @@ from rest_framework.views import APIView
 from rest_framework_swagger.renderers import OpenAPIRenderer
 from rest_framework_swagger.renderers import SwaggerUIRenderer
 from rest_framework.authtoken import models as authtoken_models
-from ninetofiver import settings, tables, calculation, pagination
+from ninetofiver import settings, tables, calculation, pagination, reports, exports
 from ninetofiver.utils import month_date_range, dates_in_range
-from django.db.models import Q, F, Sum, Prefetch, DecimalField
+from django.db.models import Q, F, Sum, Count, Prefetch, DecimalField, OuterRef, Subquery, prefetch_related_objects
 from django_tables2 import RequestConfig
 from django_tables2.export.export import TableExport
 from datetime import datetime, date, timedelta
@@ -283,12 +285,13 @@ def admin_report_index_view(request):
 
 
 @staff_member_required
+@reports.cache_report(models.Timesheet, models.Performance, models.PerformanceType, models.Contract)
 def admin_report_timesheet_contract_overview_view(request):
     """Timesheet contract overview report."""
     fltr = filters.AdminReportTimesheetContractOverviewFilter(request.GET, models.Timesheet.objects)
     timesheets = fltr.qs.select_related('user')
 
-    contracts = (models.Contract.objects.all())
+    contracts = models.Contract.objects.non_polymorphic()
 
     try:
         contract_ids = list(map(int, request.GET.getlist('performance__contract', [])))
@@ -322,21 +325,11 @@ def admin_report_timesheet_contract_overview_view(request):
     if contract_groups:
         contracts = contracts.filter(contract_groups__id__in=contract_groups)
 
-    contracts = contracts.values_list('id', flat=True)
+    # Contract filters are applied in the database, so only performances on matching contracts are aggregated
+    if not (contract_ids or contract_types or contract_companies or contract_customers or contract_groups):
+        contracts = None
 
-    data = []
-    for timesheet in timesheets:
-        date_range = timesheet.get_date_range()
-        range_info = calculation.get_range_info([timesheet.user], date_range[0], date_range[1], summary=True)
-
-        for contract_performance in range_info[timesheet.user.id]['summary']['performances']:
-            if (not contracts) or (contract_performance['contract'].id in contracts):
-                data.append({
-                    'contract': contract_performance['contract'],
-                    'duration': contract_performance['duration'],
-                    'standby_days': contract_performance['standby_days'],
-                    'timesheet': timesheet,
-                })
+    data = calculation.get_timesheet_contract_info(timesheets, contracts=contracts)
 
     config = RequestConfig(request, paginate={'per_page': pagination.CustomizablePageNumberPagination.page_size})
     table = tables.TimesheetContractOverviewTable(data)
@@ -344,8 +337,7 @@ def admin_report_timesheet_contract_overview_view(request):
 
     export_format = request.GET.get('_export', None)
     if TableExport.is_valid_format(export_format):
-        exporter = TableExport(export_format, table)
-        return exporter.response('table.{}'.format(export_format))
+        return exports.export_table(export_format, table, 'table.{}'.format(export_format))
 
     context = {
         'title': _('Timesheet contract overview'),
@@ -357,6 +349,7 @@ def admin_report_timesheet_contract_overview_view(request):
 
 
 @staff_member_required
+@reports.cache_report(*reports.RANGE_INFO_MODELS, models.TimesheetRangeInfo, models.Attachment)
 def admin_report_timesheet_overview_view(request):
     """Timesheet overview report."""
     fltr = filters.AdminReportTimesheetOverviewFilter(request.GET, models.Timesheet.objects)
@@ -375,25 +368,29 @@ def admin_report_timesheet_overview_view(request):
                                          user__employmentcontract__ended_at__gte=period_start,
                                          user__employmentcontract__started_at__lte=period_end))
 
-    data = []
-    for timesheet in timesheets:
-        date_range = timesheet.get_date_range()
-        range_info = calculation.get_range_info([timesheet.user], date_range[0], date_range[1])
-        range_info = range_info[timesheet.user.id]
+    # Range info and attachments are only loaded for the timesheets which are displayed, calculating range info for
+    # all users of a month at once, so the amount of queries doesn't grow with the amount of timesheets
+    # Totals are aggregated for all timesheets separately, so rendering them doesn't compute every row
+    timesheets = list(timesheets)
+    totals = calculation.get_timesheet_range_info_totals(timesheets)
 
-        data.append({
-            'timesheet': timesheet,
-            'range_info': range_info,
-        })
+    def compute(records):
+        page_timesheets = [x['timesheet'] for x in records]
+        prefetch_related_objects(page_timesheets, 'attachments')
+        timesheet_range_info = calculation.get_timesheet_range_info(page_timesheets)
+
+        for record in records:
+            record['range_info'] = timesheet_range_info[record['timesheet'].id]
+
+    data = tables.LazyTableData([{'timesheet': x} for x in timesheets], compute, ['range_info'])
 
     config = RequestConfig(request, paginate={'per_page': pagination.CustomizablePageNumberPagination.page_size * 4})
-    table = tables.TimesheetOverviewTable(data)
+    table = tables.TimesheetOverviewTable(data, totals={'range_info.%s' % key: value for key, value in totals.items()})
     config.configure(table)
 
     export_format = request.GET.get('_export', None)
     if TableExport.is_valid_format(export_format):
-        exporter = TableExport(export_format, table)
-        return exporter.response('table.{}'.format(export_format))
+        return exports.export_table(export_format, table, 'table.{}'.format(export_format))
 
     context = {
         'title': _('Timesheet overview'),
@@ -405,6 +402,7 @@ def admin_report_timesheet_overview_view(request):
 
 
 @staff_member_required
+@reports.cache_report(*reports.RANGE_INFO_MODELS)
 def admin_report_user_range_info_view(request):
     """User range info report."""
     fltr = filters.AdminReportUserRangeInfoFilter(request.GET, models.Timesheet.objects.all())
@@ -432,8 +430,7 @@ def admin_report_user_range_info_view(request):
 
     export_format = request.GET.get('_export', None)
     if TableExport.is_valid_format(export_format):
-        exporter = TableExport(export_format, table)
-        return exporter.response('table.{}'.format(export_format))
+        return exports.export_table(export_format, table, 'table.{}'.format(export_format))
 
     context = {
         'title': _('User range info'),
@@ -445,6 +442,7 @@ def admin_report_user_range_info_view(request):
 
 
 @staff_member_required
+@reports.cache_report(models.Timesheet, models.Leave, models.LeaveDate, models.LeaveType)
 def admin_report_user_leave_overview_view(request):
     """User leave overview report."""
     fltr = filters.AdminReportUserLeaveOverviewFilter(request.GET, models.LeaveDate.objects
@@ -508,8 +506,7 @@ def admin_report_user_leave_overview_view(request):
 
     export_format = request.GET.get('_export', None)
     if TableExport.is_valid_format(export_format):
-        exporter = TableExport(export_format, table)
-        return exporter.response('table.{}'.format(export_format))
+        return exports.export_table(export_format, table, 'table.{}'.format(export_format))
 
     context = {
         'title': _('User leave overview'),
@@ -521,6 +518,8 @@ def admin_report_user_leave_overview_view(request):
 
 
 @staff_member_required
+@reports.cache_report(models.Timesheet, models.Performance, models.PerformanceType, models.Contract,
+                      models.Leave, models.LeaveDate)
 def admin_report_user_work_ratio_overview_view(request):
     """User work ratio overview report."""
     fltr = filters.AdminReportUserWorkRatioOverviewFilter(request.GET, models.Timesheet.objects)
@@ -533,24 +532,24 @@ def admin_report_user_work_ratio_overview_view(request):
 
         timesheets = fltr.qs.select_related('user').order_by('year', 'month')
 
+        # Hours are summed up per contract type in the database, so contracts are never resolved per row
+        contract_types = ContentType.objects.get_for_models(models.ConsultancyContract, models.ProjectContract,
+                                                            models.SupportContract)
+        timesheet_info = calculation.get_timesheet_contract_type_info(timesheets)
+        empty_info = {'performed_hours': Decimal('0.00'), 'leave_hours': Decimal('0.00'), 'contract_types': {}}
         for timesheet in timesheets:
-            date_range = timesheet.get_date_range()
-            range_info = calculation.get_range_info([timesheet.user], date_range[0], date_range[1], summary=True)
-            range_info = range_info[timesheet.user.id]
-
-            total_hours = range_info['performed_hours'] + range_info['leave_hours']
-            leave_hours = range_info['leave_hours']
-            consultancy_hours = sum([x['duration'] for x in range_info['summary']['performances']
-                                    if x['contract'].get_real_instance_class() == models.ConsultancyContract])
-            project_hours = sum([x['duration'] for x in range_info['summary']['performances']
-                                if x['contract'].get_real_instance_class() == models.ProjectContract])
-            support_hours = sum([x['duration'] for x in range_info['summary']['performances']
-                                if x['contract'].get_real_instance_class() == models.SupportContract])
-
-            consultancy_pct = round((consultancy_hours / (total_hours if total_hours else 1.0)) * 100, 2)
-            project_pct = round((project_hours / (total_hours if total_hours else 1.0)) * 100, 2)
-            support_pct = round((support_hours / (total_hours if total_hours else 1.0)) * 100, 2)
-            leave_pct = round((leave_hours / (total_hours if total_hours else 1.0)) * 100, 2)
+            info = timesheet_info.get(timesheet.id, empty_info)
+
+            total_hours = info['performed_hours'] + info['leave_hours']
+            leave_hours = info['leave_hours']
+            consultancy_hours = info['contract_types'].get(contract_types[models.ConsultancyContract].id, 0)
+            project_hours = info['contract_types'].get(contract_types[models.ProjectContract].id, 0)
+            support_hours = info['contract_types'].get(contract_types[models.SupportContract].id, 0)
+
+            consultancy_pct = round((consultancy_hours / (total_hours if total_hours else 1)) * 100, 2)
+            project_pct = round((project_hours / (total_hours if total_hours else 1)) * 100, 2)
+            support_pct = round((support_hours / (total_hours if total_hours else 1)) * 100, 2)
+            leave_pct = round((leave_hours / (total_hours if total_hours else 1)) * 100, 2)
 
             data.append({
                 'year': timesheet.year,
@@ -573,8 +572,7 @@ def admin_report_user_work_ratio_overview_view(request):
 
     export_format = request.GET.get('_export', None)
     if TableExport.is_valid_format(export_format):
-        exporter = TableExport(export_format, table)
-        return exporter.response('table.{}'.format(export_format))
+        return exports.export_table(export_format, table, 'table.{}'.format(export_format))
 
     context = {
         'title': _('User work ratio overview'),
@@ -586,6 +584,7 @@ def admin_report_user_work_ratio_overview_view(request):
 
 
 @staff_member_required
+@reports.cache_report(*reports.AVAILABILITY_MODELS)
 def admin_report_resource_availability_overview_view(request):
     """Resource availability overview report."""
     data = []
@@ -614,8 +613,10 @@ def admin_report_resource_availability_overview_view(request):
     if users and from_date and until_date and (until_date >= from_date):
         dates = dates_in_range(from_date, until_date)
 
-        # Fetch availability
-        availability = calculation.get_availability_info(users, from_date, until_date)
+        # Fetch availability, sharing the calendar context for employment contracts below
+        calendar_context = calculation.CalendarContext(users, from_date, until_date)
+        availability = calculation.get_availability_info(calendar_context.users, from_date, until_date,
+                                                         context=calendar_context)
 
         # Fetch contract user work schedules
         contract_user_work_schedules = (models.ContractUserWorkSchedule.objects
@@ -626,30 +627,15 @@ def admin_report_resource_availability_overview_view(request):
                                         .select_related('contract_user', 'contract_user__user',
                                                         'contract_user__contract_role', 'contract_user__contract',
                                                         'contract_user__contract__customer'))
-        # Index contract user work schedules by user
+        # Index contract user work schedules by user, along with their hours indexed by weekday
         contract_user_work_schedule_data = {}
         for contract_user_work_schedule in contract_user_work_schedules:
             (contract_user_work_schedule_data
                 .setdefault(contract_user_work_schedule.contract_user.user.id, [])
-                .append(contract_user_work_schedule))
-
-        # Fetch employment contracts
-        employment_contracts = (models.EmploymentContract.objects
-                                .filter(
-                                    (Q(ended_at__isnull=True) & Q(started_at__lte=until_date)) |
-                                    (Q(started_at__lte=until_date) & Q(ended_at__gte=from_date)),
-                                    user__in=users)
-                                .order_by('started_at')
-                                .select_related('user', 'company', 'work_schedule'))
-        # Index employment contracts by user ID
-        employment_contract_data = {}
-        for employment_contract in employment_contracts:
-            (employment_contract_data
-                .setdefault(employment_contract.user.id, [])
-                .append(employment_contract))
+                .append([contract_user_work_schedule, calculation.get_weekday_hours(contract_user_work_schedule)]))
 
         # Iterate over users, days to create daily user data
-        for user in users:
+        for user in calendar_context.users:
             user_data = {
                 'user': user,
                 'days': {},
@@ -663,32 +649,18 @@ def admin_report_resource_availability_overview_view(request):
                 day_availability = availability[str(user.id)][date_str]
                 day_contract_user_work_schedules = []
                 day_scheduled_hours = Decimal('0.00')
-                day_work_hours = Decimal('0.00')
 
                 # Get contract user work schedules for this day
                 # This allows us to determine the scheduled hours for this user
-                for contract_user_work_schedule in contract_user_work_schedule_data.get(user.id, []):
+                for contract_user_work_schedule, weekday_hours in contract_user_work_schedule_data.get(user.id, []):
                     if (contract_user_work_schedule.starts_at <= current_date) and \
                             ((not contract_user_work_schedule.ends_at) or
                                 (contract_user_work_schedule.ends_at >= current_date)):
                         day_contract_user_work_schedules.append(contract_user_work_schedule)
-                        day_scheduled_hours += getattr(contract_user_work_schedule,
-                                                       current_date.strftime('%A').lower(), Decimal('0.00'))
-
-                # Get employment contract for this day
-                # This allows us to determine the required hours for this user
-                employment_contract = None
-                try:
-                    for ec in employment_contract_data[user.id]:
-                        if (ec.started_at <= current_date) and ((not ec.ended_at) or (ec.ended_at >= current_date)):
-                            employment_contract = ec
-                            break
-                except KeyError:
-                    pass
-
-                work_schedule = employment_contract.work_schedule if employment_contract else None
-                if work_schedule:
-                    day_work_hours = getattr(work_schedule, current_date.strftime('%A').lower(), Decimal('0.00'))
+                        day_scheduled_hours += weekday_hours[current_date.weekday()]
+
+                # Get the required hours for this user using their employment contract for this day
+                day_work_hours = calendar_context.get_work_hours(user.id, current_date)
 
                 user_day_data['availability'] = day_availability
                 user_day_data['contract_user_work_schedules'] = day_contract_user_work_schedules
@@ -702,8 +674,7 @@ def admin_report_resource_availability_overview_view(request):
 
     export_format = request.GET.get('_export', None)
     if TableExport.is_valid_format(export_format):
-        exporter = TableExport(export_format, table)
-        return exporter.response('table.{}'.format(export_format))
+        return exports.export_table(export_format, table, 'table.{}'.format(export_format))
 
     context = {
         'title': _('Resource availability overview'),
@@ -715,6 +686,8 @@ def admin_report_resource_availability_overview_view(request):
 
 
 @staff_member_required
+@reports.cache_report(models.Contract, models.ContractUser, models.ContractRole, models.Performance,
+                      models.PerformanceType)
 def admin_report_expiring_consultancy_contract_overview_view(request):
     """Expiring consultancy User work ratio overview report."""
     fltr = filters.AdminReportExpiringConsultancyContractOverviewFilter(request.GET,
@@ -733,6 +706,13 @@ def admin_report_expiring_consultancy_contract_overview_view(request):
         if remaining_days_lte and ((not remaining_hours_lte) or ((remaining_days_lte * 8) < remaining_hours_lte)):
             remaining_hours_lte = remaining_days_lte * 8
 
+        # Performed hours are annotated using a grouped subquery, instead of being aggregated per contract
+        performed_hours = (models.ActivityPerformance.objects
+                           .filter(contract=OuterRef('pk'))
+                           .order_by()
+                           .values('contract')
+                           .annotate(performed_hours=Sum(F('duration') * F('performance_type__multiplier')))
+                           .values('performed_hours'))
         contracts = (models.ConsultancyContract.objects.all()
                      .select_related('customer')
                      .prefetch_related('contractuser_set', 'contractuser_set__contract_role', 'contractuser_set__user')
@@ -741,14 +721,28 @@ def admin_report_expiring_consultancy_contract_overview_view(request):
                      .filter(Q(ends_at__isnull=False) | Q(duration__isnull=False))
                      # Ensure contracts where the internal company and the customer are the same are filtered out
                      # These are internal contracts to cover things such as meetings, talks, etc..
-                     .exclude(customer=F('company')))
+                     .exclude(customer=F('company'))
+                     .annotate(performed_hours=Subquery(performed_hours,
+                                                        output_field=DecimalField(max_digits=9, decimal_places=2))))
+
+        # If we're only supposed to show final consultancy contracts for any given user, determine the two latest
+        # active consultancy contracts with an end date for every user at once
+        latest_contracts = {}
+        if only_final:
+            user_contracts = (models.ConsultancyContract.objects
+                              .filter(active=True, ends_at__isnull=False, contractuser__isnull=False)
+                              .order_by()
+                              .values_list('contractuser__user', 'ends_at', 'id')
+                              .distinct())
+            for user_id, contract_ends_at, contract_id in user_contracts:
+                user_latest_contracts = latest_contracts.setdefault(user_id, [])
+                user_latest_contracts.append((contract_ends_at, contract_id))
+                user_latest_contracts.sort(reverse=True)
+                del user_latest_contracts[2:]
 
         for contract in contracts:
             alotted_hours = contract.duration
-            performed_hours = (models.ActivityPerformance.objects
-                               .filter(contract=contract)
-                               .aggregate(performed_hours=Sum(F('duration') * F('performance_type__multiplier'))))['performed_hours']
-            performed_hours = performed_hours if performed_hours else Decimal('0.00')
+            performed_hours = contract.performed_hours if contract.performed_hours else Decimal('0.00')
             remaining_hours = (alotted_hours - performed_hours) if alotted_hours else None
 
             if (((not ends_at_lte) or (not contract.ends_at) or (contract.ends_at > ends_at_lte)) and
@@ -760,12 +754,9 @@ def admin_report_expiring_consultancy_contract_overview_view(request):
                 # AND if the current contract actually has an end date,
                 # ensure the user has no linked active consultancy contracts with a later end date
                 if only_final and contract.ends_at:
-                    final = (models.ConsultancyContract.objects
-                             .filter(contractuser__user=contract_user.user, ends_at__isnull=False,
-                                     ends_at__gte=contract.ends_at, active=True)
-                             .exclude(id=contract.id)
-                             .count()) == 0
-                    if not final:
+                    later_contracts = [x for x in latest_contracts.get(contract_user.user.id, [])
+                                       if (x[1] != contract.id) and (x[0] >= contract.ends_at)]
+                    if later_contracts:
                         continue
 
                 data.append({
@@ -783,8 +774,7 @@ def admin_report_expiring_consultancy_contract_overview_view(request):
 
     export_format = request.GET.get('_export', None)
     if TableExport.is_valid_format(export_format):
-        exporter = TableExport(export_format, table)
-        return exporter.response('table.{}'.format(export_format))
+        return exports.export_table(export_format, table, 'table.{}'.format(export_format))
 
     context = {
         'title': _('Expiring consultancy contract overview'),
@@ -796,6 +786,8 @@ def admin_report_expiring_consultancy_contract_overview_view(request):
 
 
 @staff_member_required
+@reports.cache_report(models.Contract, models.ContractEstimate, models.ContractRole, models.Performance,
+                      models.PerformanceType, models.UserInfo, models.Invoice, models.InvoiceItem)
 def admin_report_project_contract_overview_view(request):
     """Project contract overview report."""
     fltr = filters.AdminReportProjectContractOverviewFilter(request.GET, models.ProjectContract.objects)
@@ -810,9 +802,47 @@ def admin_report_project_contract_overview_view(request):
                     # These are internal contracts to cover things such as meetings, talks, etc..
                     .exclude(customer=F('company')))
 
+        contracts = list(contracts)
+        contract_ids = [x.id for x in contracts]
+
+        # Sum up performed hours for all contracts at once, grouped by everything the breakdowns need
+        # Performances are also grouped by duration and multiplier, so normalized durations are rounded per
+        # performance, exactly like `ActivityPerformance.normalized_duration` does
+        performances = (models.ActivityPerformance.objects
+                        .filter(contract__in=contract_ids)
+                        .order_by()
+                        .values_list('contract', 'contract_role', 'timesheet__user',
+                                     'timesheet__user__userinfo__country', 'duration',
+                                     'performance_type__multiplier')
+                        .annotate(count=Count('id')))
+        performance_data = {}
+        for contract_id, contract_role_id, user_id, country, duration, multiplier, count in performances:
+            duration = round(duration * multiplier, 2) * count
+            contract_data = performance_data.setdefault(contract_id, {'contract_roles': {}, 'countries': {},
+                                                                      'users': {}})
+            contract_data['contract_roles'][contract_role_id] = (contract_data['contract_roles']
+                                                                 .get(contract_role_id, Decimal('0.00')) + duration)
+            country = country if country else 'Other'
+            contract_data['countries'][country] = contract_data['countries'].get(country, Decimal('0.00')) + duration
+            contract_data['users'][user_id] = contract_data['users'].get(user_id, Decimal('0.00')) + duration
+
+        # Fetch contract roles and users which were performed as, and invoiced amounts, for all contracts at once
+        contract_roles = {x.id: x for x in models.ContractRole.objects.filter(
+            id__in=set([y for x in performance_data.values() for y in x['contract_roles']]))}
+        users = {x.id: x for x in auth_models.User.objects.filter(
+            id__in=set([y for x in performance_data.values() for y in x['users']]))}
+        invoiced_amounts = dict(models.InvoiceItem.objects
+                                .filter(invoice__contract__in=contract_ids)
+                                .order_by()
+                                .values_list('invoice__contract')
+                                .annotate(invoiced_amount=Sum(F('price') * F('amount'),
+                                                              output_field=DecimalField(max_digits=9,
+                                                                                        decimal_places=2))))
+
         for contract in contracts:
-            # Keep track of totals
-            performed_hours = Decimal('0.00')
+            contract_performance_data = performance_data.get(contract.id, {'contract_roles': {}, 'countries': {},
+                                                                           'users': {}})
+            performed_hours = sum(contract_performance_data['users'].values(), Decimal('0.00'))
             estimated_hours = Decimal('0.00')
 
             # List containing estimated and performed hours per role
@@ -822,11 +852,6 @@ def admin_report_project_contract_overview_view(request):
             # List containing performed hours per user
             user_data = {}
 
-            # Fetch each performance for the contract, annotated with country
-            performances = (models.ActivityPerformance.objects
-                            .select_related('performance_type', 'contract_role', 'timesheet__user', 'timesheet__user__userinfo')
-                            .filter(contract=contract))
-
             # Iterate over estimates to populate contract role data
             for contract_estimate in contract.contractestimate_set.all():
                 estimated_hours += contract_estimate.duration
@@ -838,37 +863,23 @@ def admin_report_project_contract_overview_view(request):
                         'estimated_hours': contract_estimate.duration,
                     }
 
-            # Iterate over performance and fill in performed data
-            for performance in performances:
-                country = (performance.timesheet.user.userinfo.country
-                        if (performance.timesheet.user.userinfo and performance.timesheet.user.userinfo.country)
-                        else 'Other')
-                if country not in country_data:
-                    country_data[country] = {
-                        'country': country,
-                        'performed_hours': Decimal('0.00'),
-                    }
-
-                user = performance.timesheet.user
-                if user.id not in user_data:
-                    user_data[user.id] = {
-                        'user': user,
-                        'performed_hours': Decimal('0.00'),
-                    }
-
-                contract_role = performance.contract_role
-                if contract_role.id not in contract_role_data:
-                    contract_role_data[contract_role.id] = {
-                        'contract_role': contract_role,
-                        'performed_hours': Decimal('0.00'),
-                        'estimated_hours': Decimal('0.00'),
-                    }
-
-                duration = performance.normalized_duration
-                performed_hours += duration
-                contract_role_data[performance.contract_role.id]['performed_hours'] += duration
-                country_data[country]['performed_hours'] += duration
-                user_data[user.id]['performed_hours'] += duration
+            # Fill in performed data
+            for contract_role_id, duration in sorted(contract_performance_data['contract_roles'].items()):
+                contract_role_data.setdefault(contract_role_id, {
+                    'contract_role': contract_roles[contract_role_id],
+                    'performed_hours': Decimal('0.00'),
+                    'estimated_hours': Decimal('0.00'),
+                })['performed_hours'] += duration
+            for country, duration in sorted(contract_performance_data['countries'].items()):
+                country_data[country] = {
+                    'country': country,
+                    'performed_hours': duration,
+                }
+            for user_id, duration in sorted(contract_performance_data['users'].items()):
+                user_data[user_id] = {
+                    'user': users[user_id],
+                    'performed_hours': duration,
+                }
 
             # Iterate over contract role, user, country data and calculate performed_pct
             for contract_role_id, item in contract_role_data.items():
@@ -879,11 +890,7 @@ def admin_report_project_contract_overview_view(request):
             for country, item in country_data.items():
                 item['performed_pct'] = round((item['performed_hours'] / performed_hours) * 100, 2) if performed_hours else None
 
-            # Fetch invoiced amount
-            invoiced_amount = (models.InvoiceItem.objects
-                    .filter(invoice__contract=contract)
-                    .aggregate(invoiced_amount=Sum(F('price') * F('amount'),
-                                                   output_field=DecimalField(max_digits=9, decimal_places=2))))['invoiced_amount']
+            invoiced_amount = invoiced_amounts.get(contract.id, None)
             invoiced_amount = invoiced_amount if invoiced_amount else Decimal('0.00')
 
             data.append({
@@ -904,8 +911,7 @@ def admin_report_project_contract_overview_view(request):
 
     export_format = request.GET.get('_export', None)
     if TableExport.is_valid_format(export_format):
-        exporter = TableExport(export_format, table)
-        return exporter.response('table.{}'.format(export_format))
+        return exports.export_table(export_format, table, 'table.{}'.format(export_format))
 
     context = {
         'title': _('Project contract overview'),
@@ -917,6 +923,7 @@ def admin_report_project_contract_overview_view(request):
 
 
 @staff_member_required
+@reports.cache_report(*reports.RANGE_INFO_MODELS)
 def admin_report_user_overtime_overview_view(request):
     """User overtime overview report."""
     fltr = filters.AdminReportUserOvertimeOverviewFilter(request.GET, models.LeaveDate.objects
@@ -939,19 +946,20 @@ def admin_report_user_overtime_overview_view(request):
                 .setdefault(leave_date.starts_at.month, [])
                 .append(leave_date))
 
-        # Iterate over years, months to create monthly data
-        current_date = copy.deepcopy(from_date)
+        # Calculate range info for all months at once, then iterate over them to create monthly data
+        month_range_info = calculation.get_bucketed_range_info([user], month_date_range(from_date.year,
+                                                                                        from_date.month)[0],
+                                                               month_date_range(until_date.year, until_date.month)[1],
+                                                               granularity='month')[user.id]
         remaining_overtime_hours = Decimal('0.00')
 
-        while current_date.strftime('%Y%m') <= until_date.strftime('%Y%m'):
-            current_date_range = month_date_range(current_date.year, current_date.month)
-            month_range_info = calculation.get_range_info([user], from_date=current_date_range[0],
-                                                          until_date=current_date_range[1])
+        for month_info in month_range_info:
+            current_date = month_info['from_date']
 
-            overtime_hours = month_range_info[user.id]['overtime_hours']
+            overtime_hours = month_info['overtime_hours']
             remaining_overtime_hours += overtime_hours
 
-            remaining_hours = month_range_info[user.id]['remaining_hours']
+            remaining_hours = month_info['remaining_hours']
             remaining_overtime_hours -= remaining_hours
 
             used_overtime_hours = sum([Decimal(str(round((x.ends_at - x.starts_at).total_seconds() / 3600, 2)))
@@ -968,16 +976,13 @@ def admin_report_user_overtime_overview_view(request):
                 'remaining_overtime_hours': remaining_overtime_hours,
             })
 
-            current_date += relativedelta(months=1)
-
     config = RequestConfig(request, paginate={'per_page': pagination.CustomizablePageNumberPagination.page_size})
     table = tables.UserOvertimeOverviewTable(data)
     config.configure(table)
 
     export_format = request.GET.get('_export', None)
     if TableExport.is_valid_format(export_format):
-        exporter = TableExport(export_format, table)
-        return exporter.response('table.{}'.format(export_format))
+        return exports.export_table(export_format, table, 'table.{}'.format(export_format))
 
     context = {
         'title': _('User overtime overview'),
@@ -989,6 +994,7 @@ def admin_report_user_overtime_overview_view(request):
 
 
 @staff_member_required
+@reports.cache_report(models.Contract, models.Performance, models.PerformanceType)
 def admin_report_expiring_support_contract_overview_view(request):
     """Expiring support contract overview report."""
     fltr = filters.AdminReportExpiringSupportContractOverviewFilter(request.GET,
@@ -1024,8 +1030,7 @@ def admin_report_expiring_support_contract_overview_view(request):
 
     export_format = request.GET.get('_export', None)
     if TableExport.is_valid_format(export_format):
-        exporter = TableExport(export_format, table)
-        return exporter.response('table.{}'.format(export_format))
+        return exports.export_table(export_format, table, 'table.{}'.format(export_format))
 
     context = {
         'title': _('Expiring support contract overview'),
@@ -1037,36 +1042,57 @@ def admin_report_expiring_support_contract_overview_view(request):
 
 
 @staff_member_required
+@reports.cache_report(models.Contract, models.ContractEstimate, models.ContractRole, models.Performance,
+                      models.PerformanceType, models.Invoice, models.InvoiceItem)
 def admin_report_project_contract_budget_overview_view(request):
     """Project contract budget overview report."""
     fltr = filters.AdminReportProjectContractOverviewFilter(request.GET, models.ProjectContract.objects)
     data = []
 
+    # Performed hours, performance cost, estimated hours and invoiced amount are annotated using grouped subqueries,
+    # so all of them are determined in the same query as the contracts themselves
+    performances = (models.ActivityPerformance.objects
+                    .filter(contract=OuterRef('pk'))
+                    .order_by()
+                    .values('contract'))
+    performed_hours = performances.annotate(
+        performed_hours=Sum(F('duration') * F('performance_type__multiplier'))).values('performed_hours')
+    performance_cost = performances.annotate(
+        performance_cost=Sum(F('duration') * F('performance_type__multiplier') * F('contract_role__hourly_cost'))
+    ).values('performance_cost')
+    estimated_hours = (models.ContractEstimate.objects
+                       .filter(contract=OuterRef('pk'))
+                       .order_by()
+                       .values('contract')
+                       .annotate(estimated_hours=Sum('duration'))
+                       .values('estimated_hours'))
+    invoiced_amount = (models.InvoiceItem.objects
+                       .filter(invoice__contract=OuterRef('pk'))
+                       .order_by()
+                       .values('invoice__contract')
+                       .annotate(invoiced_amount=Sum(F('price') * F('amount')))
+                       .values('invoiced_amount'))
+
     contracts = (fltr.qs.all()
                  .select_related('customer')
                  .filter(active=True)
                  # Ensure contracts where the internal company and the customer are the same are filtered out
                  # These are internal contracts to cover things such as meetings, talks, etc..
-                 .exclude(customer=F('company')))
+                 .exclude(customer=F('company'))
+                 .annotate(performed_hours=Subquery(performed_hours,
+                                                    output_field=DecimalField(max_digits=9, decimal_places=2)),
+                           performance_cost=Subquery(performance_cost,
+                                                     output_field=DecimalField(max_digits=9, decimal_places=2)),
+                           estimated_hours=Subquery(estimated_hours,
+                                                    output_field=DecimalField(max_digits=9, decimal_places=2)),
+                           invoiced_amount=Subquery(invoiced_amount,
+                                                    output_field=DecimalField(max_digits=9, decimal_places=2))))
 
     for contract in contracts:
-        performed_hours = (models.ActivityPerformance.objects
-                            .filter(contract=contract)
-                            .aggregate(performed_hours=Sum(F('duration') * F('performance_type__multiplier'))))['performed_hours']
-        performed_hours = performed_hours if performed_hours else Decimal('0.00')
-
-        estimated_hours = (models.ContractEstimate.objects
-                            .filter(contract=contract)
-                            .aggregate(estimated_hours=Sum('duration')))['estimated_hours']
-        estimated_hours = estimated_hours if estimated_hours else Decimal('0.00')
-
-        invoiced_amount = (models.InvoiceItem.objects
-                            .filter(invoice__contract=contract)
-                            .aggregate(invoiced_amount=Sum(F('price') * F('amount'),
-                                        output_field=DecimalField(max_digits=9, decimal_places=2))))['invoiced_amount']
-        invoiced_amount = invoiced_amount if invoiced_amount else Decimal('0.00')
-
-        performance_cost = Decimal('0.00')
+        performed_hours = contract.performed_hours if contract.performed_hours else Decimal('0.00')
+        estimated_hours = contract.estimated_hours if contract.estimated_hours else Decimal('0.00')
+        invoiced_amount = contract.invoiced_amount if contract.invoiced_amount else Decimal('0.00')
+        performance_cost = contract.performance_cost if contract.performance_cost else Decimal('0.00')
 
         data.append({
             'contract': contract,
@@ -1085,8 +1111,7 @@ def admin_report_project_contract_budget_overview_view(request):
 
     export_format = request.GET.get('_export', None)
     if TableExport.is_valid_format(export_format):
-        exporter = TableExport(export_format, table)
-        return exporter.response('table.{}'.format(export_format))
+        return exports.export_table(export_format, table, 'table.{}'.format(export_format))
 
     context = {
         'title': _('Project contract budget overview'),
@@ -1097,6 +1122,72 @@ def admin_report_project_contract_budget_overview_view(request):
     return render(request, 'ninetofiver/admin/reports/project_contract_budget_overview.pug', context)
 
 
+@staff_member_required
+@require_POST
+def admin_report_job_create_view(request):
+    """Create a job to run a report in the background."""
+    report = request.POST.get('report', None)
+    if not reports.is_report(report):
+        raise Http404()
+
+    job = models.ReportJob.objects.create(user=request.user, report=report,
+                                          parameters=request.POST.get('parameters', ''))
+
+    return redirect('admin_report_job', job_pk=job.id)
+
+
+def get_report_job(request, job_pk):
+    """Get the given report job, which is only accessible to the user who created it and to superusers."""
+    jobs = models.ReportJob.objects.all()
+    if not request.user.is_superuser:
+        jobs = jobs.filter(user=request.user)
+
+    return get_object_or_404(jobs, pk=job_pk)
+
+
+@staff_member_required
+def admin_report_job_view(request, job_pk):
+    """Report job, displaying its progress or its result."""
+    job = get_report_job(request, job_pk)
+    table = None
+
+    if job.status == models.STATUS_COMPLETED:
+        result = job.get_result()
+        data = [{'column_%s' % i: value for i, value in enumerate(row)} for row in result['rows']]
+
+        config = RequestConfig(request,
+                               paginate={'per_page': pagination.CustomizablePageNumberPagination.page_size * 4})
+        table = tables.get_report_job_result_table_class(result['headers'])(data)
+        config.configure(table)
+
+        export_format = request.GET.get('_export', None)
+        if TableExport.is_valid_format(export_format):
+            return exports.export_table(export_format, table, 'table.{}'.format(export_format))
+
+    context = {
+        'title': _('Report job'),
+        'job': job,
+        'table': table,
+        'report_url': '%s?%s' % (reverse(job.report), job.parameters),
+    }
+
+    return render(request, 'ninetofiver/admin/reports/report_job.pug', context)
+
+
+@staff_member_required
+def admin_report_job_status_view(request, job_pk):
+    """Report job status, which is polled while the job is pending or running."""
+    job = get_report_job(request, job_pk)
+
+    return JsonResponse({
+        'status': job.status,
+        'queue_position': (models.ReportJob.objects.filter(status=models.STATUS_PENDING, id__lt=job.id).count()
+                           if job.status == models.STATUS_PENDING else None),
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    })
+
+
 class AdminTimesheetContractPdfExportView(BaseTimesheetContractPdfExportServiceAPIView):
     """Export a timesheet contract to PDF."""
 